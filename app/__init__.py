@@ -1,16 +1,44 @@
-from flask import Flask
+import time
+from flask import Flask, g, request
 # 1. Adicione este import
 from app.database.manager import setup_database 
+from app.metrics import API_REQUEST_SECONDS
+from app.logging_config import setup_logging
 
 def create_app():
+    # Tempo de cada etapa da inicialização (ver scripts/startup_profile.py)
+    timings = {}
+    started = time.perf_counter()
+    setup_logging()
     app = Flask(__name__)
+    timings['flask_app'] = time.perf_counter() - started
     
     # 2. Adicione esta chamada ANTES de registrar as rotas
     # Isso garante que as tabelas existem antes de qualquer coisa tentar acessá-las
+    step = time.perf_counter()
     setup_database()
+    timings['setup_database'] = time.perf_counter() - step
     
     # Importa e registra as rotas
+    step = time.perf_counter()
     from app.routes import api_bp
     app.register_blueprint(api_bp)
-    
+    timings['register_routes'] = time.perf_counter() - step
+
+    # Latência de cada requisição, agrupada pela regra da rota (não pela URL, para limitar a cardinalidade)
+    @app.before_request
+    def _start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def _observe_request_latency(response):
+        started = g.pop('request_started_at', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            API_REQUEST_SECONDS.labels(endpoint, request.method, response.status_code).observe(
+                time.perf_counter() - started)
+        return response
+
+    timings['total'] = time.perf_counter() - started
+    app.extensions['motorotas_startup_seconds'] = timings
     return app
\ No newline at end of file
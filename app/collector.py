@@ -1,110 +1,467 @@
 import os
 import time
+import itertools
+import logging
+import threading
+import urllib.parse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 import sys
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database.manager import save_new_order
+from app.database.manager import save_new_orders, get_recent_order_times
+from app.token_manager import TokenManager
+from app.merchants import load_merchants
+from app.routing.timing import DEFAULT_PREP_TIME_S, DEFAULT_PROMISE_S
+from app.pipeline import get_pipeline
+from app.recorder import get_recorder
+from app.dedup import RecentIdCache, DEDUP_TTL_S
+from app import metrics
+from app.logging_config import log_context
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+_cycle_ids = itertools.count(1)
+
 # --- Configurações da API ---
 CLIENT_ID = os.getenv("IFOOD_CLIENT_ID")
 CLIENT_SECRET = os.getenv("IFOOD_CLIENT_SECRET")
-BASE_API_URL = "https://merchant-api.ifood.com.br"
+# Pode ser apontada para o simulador local (scripts/ifood_simulator.py)
+BASE_API_URL = os.getenv("IFOOD_BASE_API_URL", "https://merchant-api.ifood.com.br")
+
+# --- Configurações de concorrência HTTP ---
+# Número de threads que buscam detalhes de pedidos em paralelo.
+DETAIL_FETCH_WORKERS = int(os.getenv("IFOOD_DETAIL_FETCH_WORKERS", "8"))
+# Máximo de requisições simultâneas para um mesmo host (também é o tamanho do pool de conexões).
+MAX_REQUESTS_PER_HOST = int(os.getenv("IFOOD_MAX_REQUESTS_PER_HOST", "4"))
+# Validade usada quando a resposta de autenticação não informa 'expiresIn' (o token do iFood dura 6h).
+DEFAULT_TOKEN_TTL_S = 6 * 60 * 60
+
+# --- Várias lojas (ver app/merchants.py) ---
+# Lojas consultadas ao mesmo tempo (cada uma tem no máximo um polling em andamento).
+MAX_CONCURRENT_POLLS = int(os.getenv("IFOOD_MAX_CONCURRENT_POLLS", "8"))
+# Eventos tratados por loja a cada ciclo; o excedente não é confirmado e o iFood o reentrega
+# no próximo polling. Assim uma loja com pico não segura as demais.
+MAX_EVENTS_PER_CYCLE = int(os.getenv("IFOOD_MAX_EVENTS_PER_CYCLE", "100"))
+# Se o pré-carregamento do cache de duplicatas falhar, tenta de novo depois deste intervalo
+SEEN_CACHE_PRELOAD_RETRY_S = 30.0
+
+_session = None
+_executor = None
+_merchants = None
+_seen_cache = None
+_seen_cache_preloaded = False
+_seen_cache_retry_at = 0.0
+_seen_cache_lock = threading.Lock()
+_host_semaphores = {}
+_http_lock = threading.Lock()
+
+def get_http_session():
+    """Retorna a sessão HTTP compartilhada (keep-alive), criando-a na primeira chamada."""
+    global _session
+    with _http_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_REQUESTS_PER_HOST)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def _get_executor():
+    """Retorna o pool de threads limitado usado para buscar detalhes de pedidos."""
+    global _executor
+    with _http_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DETAIL_FETCH_WORKERS, thread_name_prefix="coletor-http")
+        return _executor
 
-def get_ifood_token():
+def _host_semaphore(url):
+    """Semáforo que limita as requisições simultâneas por host."""
+    host = urllib.parse.urlsplit(url).netloc
+    with _http_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        return _host_semaphores[host]
+
+def get_merchants():
+    """Lojas atendidas por este coletor, lidas do ambiente na primeira chamada."""
+    global _merchants
+    with _http_lock:
+        if _merchants is None:
+            _merchants = load_merchants(CLIENT_ID, CLIENT_SECRET)
+        return _merchants
+
+def _resolve(merchant):
+    return merchant if merchant is not None else get_merchants()[0]
+
+def get_token_manager(merchant=None):
+    """Retorna o gerenciador de token da loja (a principal, se nenhuma for informada)."""
+    merchant = _resolve(merchant)
+    with _http_lock:
+        if merchant.token_manager is None:
+            merchant.token_manager = TokenManager(lambda: request_ifood_token(merchant))
+        return merchant.token_manager
+
+def reset_http_clients():
+    """Fecha a sessão, o pool de threads e descarta lojas e tokens em cache (usado em testes e no desligamento)."""
+    global _session, _executor, _merchants
+    with _http_lock:
+        if _session is not None:
+            _session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        for merchant in _merchants or ():
+            if merchant.token_manager is not None:
+                merchant.token_manager.stop_background_refresh()
+        _session = None
+        _executor = None
+        _merchants = None
+        _host_semaphores.clear()
+
+def request_ifood_token(merchant=None):
+    """Faz a requisição OAuth ao iFood. Retorna (token, expires_in) ou None em caso de falha."""
     auth_url = f"{BASE_API_URL}/authentication/v1.0/oauth/token"
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    data = {'grantType': 'client_credentials', 'clientId': CLIENT_ID, 'clientSecret': CLIENT_SECRET}
+    client_id, client_secret = (merchant.client_id, merchant.client_secret) if merchant else (CLIENT_ID, CLIENT_SECRET)
+    data = {'grantType': 'client_credentials', 'clientId': client_id, 'clientSecret': client_secret}
     try:
-        response = requests.post(auth_url, headers=headers, data=data, timeout=10)
+        response = get_http_session().post(auth_url, headers=headers, data=data, timeout=10)
         response.raise_for_status()
-        return response.json().get('accessToken')
+        payload = response.json()
+        token = payload.get('accessToken')
+        if not token:
+            return None
+        return token, payload.get('expiresIn', DEFAULT_TOKEN_TTL_S)
     except requests.RequestException as e:
-        print(f"❌ Coletor: Falha na autenticação! {e}")
+        logger.error("Coletor: falha na autenticação: %s", e, extra={'merchant_id': merchant.id if merchant else None})
         return None
 
-def get_new_orders(token):
+def get_ifood_token(merchant=None):
+    """Retorna o token em cache da loja; só autentica de novo quando ele está perto de expirar."""
+    return get_token_manager(merchant).get_token()
+
+def _send(session, method, url, merchant, host_limited, **kwargs):
+    # A ficha da loja vem antes da vaga do host: quem espera o limite de taxa de uma loja
+    # não segura uma conexão que as outras lojas poderiam usar
+    merchant.rate_limiter.acquire()
+    if not host_limited:
+        return session.request(method, url, timeout=10, **kwargs)
+    with _host_semaphore(url):
+        return session.request(method, url, timeout=10, **kwargs)
+
+def _authorized_request(method, url, token, merchant=None, host_limited=False, **kwargs):
+    """
+    Faz uma requisição autenticada pela sessão compartilhada, dentro do limite de taxa da loja
+    (e, com host_limited, do limite de requisições simultâneas por host).
+    Se o iFood responder 401, renova o token uma única vez e repete a requisição.
+    """
+    merchant = _resolve(merchant)
+    session = get_http_session()
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers['Authorization'] = f'Bearer {token}'
+    response = _send(session, method, url, merchant, host_limited, headers=headers, **kwargs)
+    if response.status_code == 401:
+        new_token = get_token_manager(merchant).refresh(stale_token=token)
+        if new_token:
+            headers['Authorization'] = f'Bearer {new_token}'
+            response = _send(session, method, url, merchant, host_limited, headers=headers, **kwargs)
+    return response
+
+def get_new_orders(token, merchant=None):
     orders_url = f"{BASE_API_URL}/order/v1.0/events:polling"
-    headers = {'Authorization': f'Bearer {token}'}
     try:
-        response = requests.get(orders_url, headers=headers, timeout=10)
+        with metrics.COLLECTOR_POLL_SECONDS.time():
+            response = _authorized_request('GET', orders_url, token, merchant)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 204:
             return []
         else:
-            print(f"❌ Coletor: Erro ao buscar pedidos: Status {response.status_code}")
+            logger.error("Coletor: erro ao buscar pedidos: status %s", response.status_code)
             return None
     except requests.RequestException as e:
-        print(f"❌ Coletor: Erro de conexão ao buscar pedidos: {e}")
+        logger.error("Coletor: erro de conexão ao buscar pedidos: %s", e)
         return None
 
-def get_order_details(token, order_id):
+def get_order_details(token, order_id, merchant=None):
     details_url = f"{BASE_API_URL}/order/v1.0/orders/{order_id}"
-    headers = {'Authorization': f'Bearer {token}'}
     try:
-        response = requests.get(details_url, headers=headers, timeout=10)
+        response = _authorized_request('GET', details_url, token, merchant, host_limited=True)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
-        print(f"❌ Coletor: Erro ao buscar detalhes do pedido {order_id}: {e}")
+        logger.error("Coletor: erro ao buscar detalhes do pedido: %s", e, extra={'order_id': order_id})
+        return None
+
+def _fair_share():
+    """Buscas de detalhes em andamento por loja: o pool compartilhado é dividido entre as lojas."""
+    return max(2, DETAIL_FETCH_WORKERS // len(get_merchants()))
+
+def fetch_order_details_batch(token, order_ids, merchant=None):
+    """
+    Busca os detalhes de vários pedidos em paralelo, reutilizando as conexões da sessão.
+    Cada loja mantém no máximo a sua fatia do pool ocupada, para não enfileirar as outras.
+    Retorna um dicionário {order_id: detalhes}; pedidos com erro ficam de fora.
+    """
+    unique_ids = list(dict.fromkeys(order_ids))
+    if not unique_ids:
+        return {}
+    if len(unique_ids) == 1:
+        details = get_order_details(token, unique_ids[0], merchant)
+        return {unique_ids[0]: details} if details else {}
+
+    executor = _get_executor()
+    share = _fair_share()
+    queued = iter(unique_ids)
+    in_flight = {}
+    results = {}
+    while True:
+        for order_id in itertools.islice(queued, share - len(in_flight)):
+            in_flight[executor.submit(get_order_details, token, order_id, merchant)] = order_id
+        if not in_flight:
+            return results
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            order_id = in_flight.pop(future)
+            details = future.result()
+            if details:
+                results[order_id] = details
+
+def _parse_ifood_datetime(value):
+    """Converte um horário ISO 8601 do iFood em epoch (None se ausente ou inválido)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
         return None
 
-def acknowledge_orders(token, events):
+def order_times(details, received_at):
+    """
+    Horários do pedido para o roteamento: quando fica pronto e o prometido ao cliente.
+    Usa os do iFood quando vierem nos detalhes; senão, estima a partir do recebimento.
+    """
+    preparation_start = _parse_ifood_datetime(details.get('preparationStartDateTime'))
+    promised_at = _parse_ifood_datetime((details.get('delivery') or {}).get('deliveryDateTime'))
+    ready_at = (preparation_start or received_at) + DEFAULT_PREP_TIME_S
+    return ready_at, promised_at or received_at + DEFAULT_PROMISE_S
+
+def acknowledge_orders(token, events, merchant=None):
     ack_url = f"{BASE_API_URL}/order/v1.0/events/acknowledgment"
-    headers = {'Authorization': f'Bearer {token}'}
     data = [{'id': event['id']} for event in events]
     try:
-        response = requests.post(ack_url, headers=headers, json=data, timeout=10)
+        response = _authorized_request('POST', ack_url, token, merchant, json=data)
         return response.status_code == 202
     except requests.RequestException as e:
-        print(f"❌ Coletor: Erro ao confirmar eventos: {e}")
+        logger.error("Coletor: erro ao confirmar eventos: %s", e)
         return False
 
-def collector_cycle():
-    """Executa um único ciclo de coleta de pedidos."""
-    token = get_ifood_token()
+def get_seen_cache():
+    """
+    Retorna o cache de ids de eventos/pedidos já vistos (um só, compartilhado pelos pollings das
+    lojas). Na primeira chamada, é pré-carregado com os pedidos recentes do banco, para não refazer
+    buscas após um reinício. Se o banco falhar, o cache segue valendo (vazio) e só o
+    pré-carregamento é tentado de novo, a cada SEEN_CACHE_PRELOAD_RETRY_S.
+    """
+    global _seen_cache, _seen_cache_preloaded, _seen_cache_retry_at
+    with _seen_cache_lock:
+        if _seen_cache is None:
+            _seen_cache = RecentIdCache()
+        if not _seen_cache_preloaded and time.monotonic() >= _seen_cache_retry_at:
+            try:
+                _seen_cache.preload(('o:' + order_id, created_at) for order_id, created_at
+                                    in get_recent_order_times(DEDUP_TTL_S, _seen_cache.max_items))
+                _seen_cache_preloaded = True
+            except Exception as e:
+                _seen_cache_retry_at = time.monotonic() + SEEN_CACHE_PRELOAD_RETRY_S
+                logger.warning("Coletor: não foi possível pré-carregar o cache de duplicatas: %s", e)
+        return _seen_cache
+
+def reset_seen_cache():
+    global _seen_cache, _seen_cache_preloaded, _seen_cache_retry_at
+    with _seen_cache_lock:
+        _seen_cache = None
+        _seen_cache_preloaded = False
+        _seen_cache_retry_at = 0.0
+
+_BREAKER_LEVELS = {'closed': 0.0, 'half_open': 0.5, 'open': 1.0}
+
+def get_collector_metrics():
+    """
+    Métricas do coletor: intervalo atual de polling, estado do disjuntor e cache de duplicatas
+    (da loja principal), mais o estado de cada loja em 'merchants'.
+    """
+    merchants = get_merchants()
+    metrics = merchants[0].poll_scheduler.metrics()
+    metrics['merchants'] = {
+        merchant.id: dict(merchant.poll_scheduler.metrics(), orders_saved=merchant.orders_saved,
+                          throttled_seconds=round(merchant.rate_limiter.throttled_seconds, 3))
+        for merchant in merchants
+    }
+    if _seen_cache is not None:
+        metrics.update(_seen_cache.stats())
+    return metrics
+
+def _register_collector_gauges():
+    """
+    Expõe o estado do agendamento e do cache de duplicatas em /metrics (lidos na hora da coleta).
+    Com várias lojas, o intervalo é o menor entre elas e o disjuntor, o pior.
+    """
+    interval = metrics.gauge('motorotas_collector_poll_interval_seconds', 'Intervalo atual entre pollings.')
+    interval.set_function(lambda: min(m.poll_scheduler.current_interval for m in get_merchants()))
+    breaker = metrics.gauge('motorotas_collector_breaker_open',
+                            'Estado do disjuntor do coletor (0 = fechado, 0.5 = meio-aberto, 1 = aberto).')
+    breaker.set_function(lambda: max(_BREAKER_LEVELS[m.poll_scheduler.breaker.state] for m in get_merchants()))
+    dedup = metrics.gauge('motorotas_collector_dedup_lookups', 'Consultas ao cache de duplicatas.', ('result',))
+    dedup.labels('hit').set_function(lambda: _seen_cache.hits if _seen_cache else 0)
+    dedup.labels('miss').set_function(lambda: _seen_cache.misses if _seen_cache else 0)
+
+def _register_merchant_gauges(merchant):
+    """Pedidos gravados e intervalo de polling por loja."""
+    metrics.gauge('motorotas_collector_merchant_orders_saved', 'Pedidos novos gravados por loja.',
+                  ('merchant',)).labels(merchant.id).set_function(lambda: merchant.orders_saved)
+    metrics.gauge('motorotas_collector_merchant_poll_interval_seconds', 'Intervalo atual entre pollings, por loja.',
+                  ('merchant',)).labels(merchant.id).set_function(lambda: merchant.poll_scheduler.current_interval)
+
+def collector_cycle(merchant=None):
+    """
+    Executa um único ciclo de coleta de pedidos de uma loja (a principal, se nenhuma for informada).
+    Retorna o número de eventos recebidos, ou None se o ciclo falhou (autenticação ou polling).
+    """
+    merchant = _resolve(merchant)
+    token = get_ifood_token(merchant)
     if not token:
-        return
+        return None
 
-    events = get_new_orders(token)
+    events = get_new_orders(token, merchant)
     if events is None:
-        return
+        return None
 
+    metrics.COLLECTOR_EVENTS_PER_POLL.observe(len(events))
     if not events:
-        return # Continua silenciosamente
+        return 0 # Continua silenciosamente
 
-    print(f"✅ Coletor: {len(events)} novo(s) evento(s) encontrado(s)!")
+    logger.info("Coletor: %d novo(s) evento(s) encontrado(s)", len(events))
     
-    new_orders_to_ack = []
+    # Eventos reentregues (ou de pedidos já salvos) são descartados antes de qualquer busca ou escrita
+    seen = get_seen_cache()
+    order_events = []
+    duplicate_events = []
     for event in events:
-        order_id = event.get('orderId')
-        if order_id:
-            details = get_order_details(token, order_id)
-            if details and details.get('delivery'):
-                address = details['delivery']['deliveryAddress']
-                coords = address['coordinates']
-                
-                order_data = {'id': order_id, 'lat': coords['latitude'], 'lon': coords['longitude']}
-                if save_new_order(order_data):
-                    new_orders_to_ack.append(event)
+        if not event.get('orderId'):
+            continue
+        if seen.seen_any('e:' + event['id'], 'o:' + event['orderId']):
+            duplicate_events.append(event)
+        elif len(order_events) < MAX_EVENTS_PER_CYCLE:
+            order_events.append(event)
+
+    details_by_order = fetch_order_details_batch(token, [event['orderId'] for event in order_events], merchant)
+
+    orders_to_save = []
+    received_at = time.time()
+    for order_id, details in details_by_order.items():
+        if details.get('delivery'):
+            coords = details['delivery']['deliveryAddress']['coordinates']
+            ready_at, promised_at = order_times(details, received_at)
+            orders_to_save.append({'id': order_id, 'lat': coords['latitude'], 'lon': coords['longitude'],
+                                   'merchant_id': merchant.id, 'ready_at': ready_at, 'promised_at': promised_at})
+
+    # Grava todos os pedidos do lote em uma única transação
+    saved_ids = set(save_new_orders(orders_to_save))
+    merchant.orders_saved += len(saved_ids)
+    # Depois da gravação, todos esses pedidos estão no banco (novos ou que já existiam)
+    stored_ids = {o['id'] for o in orders_to_save}
+    seen.add(*('o:' + order_id for order_id in stored_ids))
+    new_orders_to_ack = [event for event in order_events if event['orderId'] in stored_ids] + duplicate_events
+
+    recorder = get_recorder()
+    if recorder is not None and saved_ids:
+        recorder.record([o for o in orders_to_save if o['id'] in saved_ids])
+
+    # Modo pipeline: entrega os pedidos novos direto ao processador (o banco segue como registro durável)
+    pipeline = get_pipeline()
+    if pipeline is not None and saved_ids:
+        pipeline.publish([
+            {'id': o['id'], 'coords': {'lat': o['lat'], 'lon': o['lon']}, 'created_at': received_at,
+             'merchant_id': o['merchant_id'], 'ready_at': o['ready_at'], 'promised_at': o['promised_at']}
+            for o in orders_to_save if o['id'] in saved_ids
+        ])
 
     if new_orders_to_ack:
-        if not acknowledge_orders(token, new_orders_to_ack):
-            print("   -> Falha ao confirmar eventos.")
+        if acknowledge_orders(token, new_orders_to_ack, merchant):
+            seen.add(*('e:' + event['id'] for event in new_orders_to_ack))
+        else:
+            logger.warning("Coletor: falha ao confirmar eventos.", extra={'events': len(new_orders_to_ack)})
 
-def start_collector_loop():
-    """Inicia o loop infinito do coletor."""
-    interval = 3
-    print(f"--- COLETOR DE PEDIDOS INICIADO (verificando a cada {interval}s) ---")
-    while True:
+    return len(events)
+
+def _run_merchant_cycle(merchant):
+    with log_context(component='collector', cycle_id=next(_cycle_ids), merchant_id=merchant.id):
         try:
-            collector_cycle()
-            time.sleep(interval)
+            return collector_cycle(merchant)
         except Exception as e:
-            print(f"\n🚨 Coletor: Erro inesperado no loop: {e}")
-            time.sleep(interval)
+            logger.exception("Coletor: erro inesperado no loop: %s", e)
+            return None
+
+def _schedule_next_poll(merchant, outcome):
+    breaker = merchant.poll_scheduler.breaker
+    previous_state = breaker.state
+    delay = merchant.poll_scheduler.next_delay(outcome)
+    if breaker.state != previous_state:
+        logger.warning("Coletor: disjuntor mudou de '%s' para '%s'.", previous_state, breaker.state,
+                       extra={'merchant_id': merchant.id})
+    merchant.next_poll_at = time.monotonic() + delay
+
+def start_collector_loop(should_run=None):
+    """
+    Inicia o loop do coletor. Roda para sempre, ou enquanto should_run() for verdadeiro
+    (o worker passa o estado do lease para que um único coletor consuma os eventos).
+    O intervalo entre ciclos é adaptativo e por loja (ver app/polling.py): mais curto com eventos
+    chegando, mais longo em períodos ociosos, com backoff e disjuntor em caso de falhas.
+    As lojas são consultadas em paralelo, cada uma quando chega a sua vez (a mais atrasada primeiro).
+    """
+    merchants = get_merchants()
+    logger.info("Coletor de pedidos iniciado (polling adaptativo, %d loja(s))", len(merchants))
+    # Só o processo que roda o coletor expõe as métricas dele (e não quem apenas importa o módulo)
+    _register_collector_gauges()
+    for merchant in merchants:
+        _register_merchant_gauges(merchant)
+    for merchant in merchants:
+        get_token_manager(merchant).start_background_refresh()
+    max_polls = max(1, min(len(merchants), MAX_CONCURRENT_POLLS))
+    poll_executor = ThreadPoolExecutor(max_workers=max_polls, thread_name_prefix="coletor-polling")
+    running = {}  # future -> loja
+    try:
+        while should_run is None or should_run():
+            now = time.monotonic()
+            busy = set(running.values())
+            waiting = [m for m in merchants if m not in busy]
+            for merchant in waiting:
+                breaker = merchant.poll_scheduler.breaker
+                if not breaker.allow_request():
+                    merchant.next_poll_at = max(merchant.next_poll_at, now + breaker.seconds_until_retry())
+            due = sorted((m for m in waiting if m.next_poll_at <= now), key=lambda m: m.next_poll_at)
+            for merchant in due[:max_polls - len(running)]:
+                running[poll_executor.submit(_run_merchant_cycle, merchant)] = merchant
+
+            if len(running) >= max_polls:
+                timeout = 1.0  # Todas as vagas ocupadas: espera algum polling terminar
+            else:
+                busy = set(running.values())
+                timeout = max(0.0, min((m.next_poll_at - now for m in merchants if m not in busy), default=1.0))
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                _schedule_next_poll(running.pop(future), future.result())
+    finally:
+        poll_executor.shutdown(wait=True)
+        for merchant in merchants:
+            get_token_manager(merchant).stop_background_refresh()
@@ -1,7 +1,17 @@
 import sqlite3
 import os
-import psycopg2
-from psycopg2.extras import DictCursor
+import time
+import logging
+
+from app.routing.geojson import serialize_route_geometry
+from app.routing.sharding import bearing_of
+from app.metrics import timed_query
+
+logger = logging.getLogger(__name__)
+
+# Versão do esquema gravada na tabela schema_meta. Aumente sempre que mudar tabelas/colunas/índices
+# em setup_database: com a versão igual, o setup só faz uma consulta e pula os CREATE/ALTER.
+SCHEMA_VERSION = 11
 
 # Define o caminho da base de dados na raiz do projeto (Padrão para SQLite)
 # Isso deve estar no nível superior do módulo para ser acessível pelo monkeypatch
@@ -17,6 +27,8 @@ def get_db_connection():
     # Se DATABASE_URL estiver definido e não for vazio, usa PostgreSQL
     if db_url:
         # Estamos em produção (Render), conectar ao PostgreSQL
+        # Import tardio: em desenvolvimento (SQLite) o psycopg2 nunca é carregado
+        import psycopg2
         return psycopg2.connect(db_url)
     else:
         # Estamos em desenvolvimento local, usar SQLite
@@ -25,15 +37,47 @@ def get_db_connection():
         conn.row_factory = sqlite3.Row  # Permite acessar colunas pelo nome
         return conn
 
+@timed_query
 def setup_database():
-    """Cria as tabelas do banco de dados se elas não existirem, com sintaxe compatível."""
-    # ... (código da função setup_database continua igual) ...
-    print("Verificando e configurando o banco de dados...")
+    """
+    Cria as tabelas do banco de dados se elas não existirem, com sintaxe compatível.
+    Se o banco já estiver na SCHEMA_VERSION atual, não faz nada além de conferir a versão.
+    Retorna True se o esquema foi (re)aplicado.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    is_postgres = isinstance(conn, psycopg2.extensions.connection)
-    
+    try:
+        cursor = conn.cursor()
+        try:
+            is_postgres = _is_postgres(conn)
+            if _stored_schema_version(conn, cursor) == SCHEMA_VERSION:
+                return False
+
+            logger.info("Verificando e configurando o banco de dados (esquema v%d)...", SCHEMA_VERSION)
+            _apply_schema(cursor, is_postgres)
+            placeholder = _get_placeholder(conn)
+            cursor.execute(f'''
+                INSERT INTO schema_meta (key, value) VALUES ('version', {placeholder})
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            ''', (str(SCHEMA_VERSION),))
+            conn.commit()
+            return True
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+def _stored_schema_version(conn, cursor):
+    """Versão gravada no banco, ou None se a tabela schema_meta ainda não existir."""
+    try:
+        cursor.execute("SELECT value FROM schema_meta WHERE key = 'version'")
+        row = cursor.fetchone()
+    except Exception:
+        conn.rollback()  # No PostgreSQL, o erro aborta a transação
+        return None
+    return int(row[0]) if row else None
+
+def _apply_schema(cursor, is_postgres):
+    """CREATE TABLE/INDEX IF NOT EXISTS e colunas novas: pode rodar várias vezes sem efeito colateral."""
     # Sintaxe de autoincremento varia entre SQLite e PostgreSQL
     autoincrement_syntax = "SERIAL PRIMARY KEY" if is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
     text_syntax = "VARCHAR(255)" if is_postgres else "TEXT"
@@ -43,17 +87,65 @@ def setup_database():
         id {text_syntax} PRIMARY KEY,
         lat REAL NOT NULL,
         lon REAL NOT NULL,
-        status {text_syntax} NOT NULL DEFAULT 'pending'
+        status {text_syntax} NOT NULL DEFAULT 'pending',
+        created_at REAL
     )
     ''')
+
+    # created_at (epoch em segundos), merchant_id (loja de origem) e os horários em que o pedido
+    # fica pronto / foi prometido ao cliente foram adicionados depois; bancos antigos ganham as colunas vazias
+    _add_missing_columns(cursor, is_postgres, 'orders', [
+        ('created_at', 'REAL'), ('merchant_id', text_syntax), ('ready_at', 'REAL'), ('promised_at', 'REAL'),
+    ])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)")
     
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS routes (
         id {autoincrement_syntax},
         google_maps_link TEXT,
-        status {text_syntax} NOT NULL DEFAULT 'created'
+        status {text_syntax} NOT NULL DEFAULT 'created',
+        geojson TEXT,
+        min_lat REAL,
+        min_lon REAL,
+        max_lat REAL,
+        max_lon REAL,
+        sealed_at REAL,
+        updated_at REAL,
+        bearing REAL,
+        change_seq INTEGER
+    )
+    ''')
+
+    # Bancos criados antes da geometria pré-calculada não têm essas colunas
+    _add_missing_columns(cursor, is_postgres, 'routes', [
+        ('geojson', 'TEXT'),
+        ('min_lat', 'REAL'),
+        ('min_lon', 'REAL'),
+        ('max_lat', 'REAL'),
+        ('max_lon', 'REAL'),
+        ('sealed_at', 'REAL'),
+        ('updated_at', 'REAL'),
+        ('bearing', 'REAL'),
+        ('change_seq', 'INTEGER'),
+    ])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_routes_bbox ON routes (min_lon, max_lon, min_lat, max_lat)")
+    # Índice da versão 10, quando a geometria que faltava era calculada a cada leitura do mapa
+    cursor.execute("DROP INDEX IF EXISTS idx_routes_missing_geojson")
+    # Marca d'água das mudanças em rotas: o processador relê só o que mudou desde o último ciclo.
+    # change_seq vem de um contador no banco, incrementado no fim de cada transação que mexe em rotas:
+    # a trava da linha do contador vai até o commit, então os números saem na ordem dos commits
+    # (o relógio de quem grava, em updated_at, não garante isso)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_routes_updated_at ON routes (updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_routes_change_seq ON routes (change_seq)")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS route_change_seq (
+        id INTEGER PRIMARY KEY,
+        value INTEGER NOT NULL
     )
     ''')
+    cursor.execute("INSERT INTO route_change_seq (id, value) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+    # Exportação incremental do histórico (rotas fechadas, em ordem de fechamento)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_routes_sealed_at ON routes (sealed_at, id)")
     
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS route_orders (
@@ -75,60 +167,193 @@ def setup_database():
     )
     ''')
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-    # print("Banco de dados pronto.") # Comentado para limpar output dos testes
+    # Leases de liderança dos workers (no PostgreSQL o worker usa advisory lock; esta tabela serve ao SQLite)
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS leases (
+        name {text_syntax} PRIMARY KEY,
+        holder {text_syntax} NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+    # Grade de demanda (app/routing/demand.py): gravada pelo job de fundo, lida por todos os processadores
+    blob_syntax = "BYTEA" if is_postgres else "BLOB"
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS demand_grids (
+        name {text_syntax} PRIMARY KEY,
+        data {blob_syntax} NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''')
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS schema_meta (
+        key {text_syntax} PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''')
+
+    # Rotas gravadas antes da geometria pré-calculada (depois de criadas as tabelas que ela lê)
+    _backfill_route_geometry(cursor, '%s' if is_postgres else '?')
+
+def _backfill_route_geometry(cursor, placeholder):
+    """
+    Migração: calcula a geometria das rotas gravadas antes dela existir (geojson NULL), que o
+    mapa não mostraria. O restaurante não fica gravado na rota: a linha dessas rotas começa na
+    primeira parada (o processador a redesenha com o restaurante se a rota ainda mudar).
+    Rotas sem pedidos ganham uma geometria vazia, para não serem selecionadas de novo.
+    """
+    cursor.execute('''
+        SELECT r.id, o.id, o.lat, o.lon FROM routes r
+        LEFT JOIN route_orders ro ON ro.route_id = r.id
+        LEFT JOIN orders o ON o.id = ro.order_id
+        WHERE r.geojson IS NULL
+        ORDER BY r.id, ro.delivery_sequence
+    ''')
+    routes = {}
+    for route_id, order_id, lat, lon in cursor.fetchall():
+        orders = routes.setdefault(route_id, [])
+        if order_id is not None:
+            orders.append({'id': order_id, 'lat': lat, 'lon': lon})
+    for route_id, orders in routes.items():
+        _write_route_geometry(cursor, placeholder, route_id, orders, None)
+    if routes:
+        logger.info("Geometria calculada para %d rota(s) antiga(s) sem GeoJSON.", len(routes))
+
+def _add_missing_columns(cursor, is_postgres, table, columns):
+    """Adiciona colunas novas a uma tabela já existente (migração simples e idempotente)."""
+    if is_postgres:
+        for name, column_type in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {column_type}")
+        return
+
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def _is_postgres(conn):
+    """Identifica a conexão do psycopg2 sem precisar importá-lo."""
+    return type(conn).__module__.startswith('psycopg2')
+
+def _is_integrity_error(error):
+    # sqlite3.IntegrityError ou psycopg2.IntegrityError (e subclasses, como UniqueViolation)
+    return any(cls.__name__ == 'IntegrityError' for cls in type(error).__mro__)
 
 def _get_placeholder(conn):
     """Retorna o placeholder correto para o tipo de conexão."""
-    return "%s" if isinstance(conn, psycopg2.extensions.connection) else "?"
+    return "%s" if _is_postgres(conn) else "?"
 
+@timed_query
 def save_new_order(order_data):
     """Salva um novo pedido no banco de dados, evitando duplicatas."""
     conn = get_db_connection()
     placeholder = _get_placeholder(conn)
-    sql = f"INSERT INTO orders (id, lat, lon, status) VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})"
+    sql = (f"INSERT INTO orders (id, lat, lon, status, created_at, merchant_id, ready_at, promised_at) "
+           f"VALUES ({', '.join([placeholder] * 8)})")
     
     try:
         # with conn: # Removido para compatibilidade com psycopg2 que gerencia transações diferente
         cursor = conn.cursor()
         try:
-            cursor.execute(sql, (order_data['id'], order_data['lat'], order_data['lon'], 'pending'))
+            cursor.execute(sql, (order_data['id'], order_data['lat'], order_data['lon'], 'pending',
+                                 order_data.get('created_at', time.time()), order_data.get('merchant_id'),
+                                 order_data.get('ready_at'), order_data.get('promised_at')))
             conn.commit()
             # print(f"   -> Pedido {order_data['id']} salvo com sucesso.")
             return True
-        except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+        except Exception as e:
             conn.rollback()
-            return False
+            if _is_integrity_error(e):
+                return False
+            raise
         finally:
             cursor.close()
     finally:
         if conn:
             conn.close()
 
+@timed_query
+def save_new_orders(orders_data):
+    """
+    Salva um lote de pedidos em uma única transação, ignorando os que já existem.
+    Retorna a lista de ids efetivamente inseridos.
+    """
+    if not orders_data:
+        return []
+
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    sql = (f"INSERT INTO orders (id, lat, lon, status, created_at, merchant_id, ready_at, promised_at) "
+           f"VALUES ({', '.join([placeholder] * 8)}) "
+           f"ON CONFLICT (id) DO NOTHING")
+    try:
+        cursor = conn.cursor()
+        try:
+            inserted = []
+            now = time.time()
+            for order in orders_data:
+                cursor.execute(sql, (order['id'], order['lat'], order['lon'], 'pending', order.get('created_at', now),
+                                     order.get('merchant_id'), order.get('ready_at'), order.get('promised_at')))
+                if cursor.rowcount == 1:
+                    inserted.append(order['id'])
+            conn.commit()
+            return inserted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_recent_order_times(since_seconds, limit=20000):
+    """
+    Busca (id, created_at) dos `limit` pedidos mais recentes entre os recebidos nos últimos
+    `since_seconds`, do mais antigo para o mais novo.
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT id, created_at FROM orders WHERE created_at >= {placeholder} ORDER BY created_at DESC LIMIT {placeholder}",
+                (time.time() - since_seconds, limit),
+            )
+            return [(row[0], row[1]) for row in reversed(cursor.fetchall())]
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
 def _rows_to_dicts(cursor, rows):
     """Converte uma lista de tuplas/rows em uma lista de dicionários."""
     columns = [desc[0] for desc in cursor.description]
     return [dict(zip(columns, row)) for row in rows]
 
+@timed_query
 def get_pending_orders():
     """Busca todos os pedidos com status 'pending'."""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT id, lat, lon FROM orders WHERE status = 'pending'")
+            cursor.execute("SELECT id, lat, lon, created_at, merchant_id, ready_at, promised_at FROM orders WHERE status = 'pending'")
             rows = cursor.fetchall()
             orders = _rows_to_dicts(cursor, rows)
         finally:
             cursor.close()
     finally:
         conn.close()
-    return [{"id": o['id'], "coords": {"lat": o['lat'], "lon": o['lon']}} for o in orders]
+    return [{"id": o['id'], "coords": {"lat": o['lat'], "lon": o['lon']}, "created_at": o['created_at'],
+             "merchant_id": o['merchant_id'], "ready_at": o['ready_at'], "promised_at": o['promised_at']} for o in orders]
 
 # --- FUNÇÕES QUE FALTAVAM ---
 
+@timed_query
 def get_created_routes():
     """Busca todas as rotas com status 'created' para o otimizador."""
     conn = get_db_connection()
@@ -136,36 +361,127 @@ def get_created_routes():
     try:
         cursor = conn.cursor()
         try:
-            # Busca as rotas
-            sql_routes = f"SELECT * FROM routes WHERE status = 'created'"
-            cursor.execute(sql_routes)
-            routes_rows = _rows_to_dicts(cursor, cursor.fetchall())
-            
-            routes = []
-            for r in routes_rows:
-                route_obj = dict(r)
-                # Busca os pedidos dessa rota
-                sql_orders = f'''
-                    SELECT o.id, o.lat, o.lon, ro.delivery_sequence 
-                    FROM orders o
-                    JOIN route_orders ro ON o.id = ro.order_id
-                    WHERE ro.route_id = {placeholder}
-                    ORDER BY ro.delivery_sequence
-                '''
-                cursor.execute(sql_orders, (route_obj['id'],))
-                orders_rows = _rows_to_dicts(cursor, cursor.fetchall())
-                
-                route_obj['orders'] = [
-                    {'id': o['id'], 'coords': {'lat': o['lat'], 'lon': o['lon']}} 
-                    for o in orders_rows
-                ]
-                routes.append(route_obj)
+            cursor.execute("SELECT id, google_maps_link, status, bearing FROM routes WHERE status = 'created'")
+            routes = _rows_to_dicts(cursor, cursor.fetchall())
+            _attach_route_orders(cursor, placeholder, routes)
+            return routes
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_routes_changed_since(since):
+    """
+    Busca as rotas (de qualquer status) alteradas depois da marca `since` (change_seq), com seus pedidos.
+    Cada rota traz 'change_seq', para o chamador avançar a sua marca d'água.
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT id, google_maps_link, status, bearing, change_seq FROM routes "
+                f"WHERE change_seq > {placeholder} ORDER BY change_seq",
+                (since,))
+            routes = _rows_to_dicts(cursor, cursor.fetchall())
+            _attach_route_orders(cursor, placeholder, [r for r in routes if r['status'] == 'created'])
+            return routes
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_routes_high_water_mark():
+    """Último change_seq confirmado (0 se nenhuma rota mudou ainda)."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT value FROM route_change_seq WHERE id = 1")
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None else 0
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_orders_created_after(created_at, order_id, until, limit=5000):
+    """
+    Busca até `limit` pedidos (id, lat, lon, created_at) criados depois do cursor (created_at, id)
+    e no máximo em `until`, em ordem de criação. Usado pela grade de demanda.
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                SELECT id, lat, lon, created_at FROM orders
+                WHERE (created_at > {placeholder} OR (created_at = {placeholder} AND id > {placeholder}))
+                  AND created_at <= {placeholder}
+                ORDER BY created_at, id
+                LIMIT {placeholder}
+            ''', (created_at, created_at, order_id, until, limit))
+            return _rows_to_dicts(cursor, cursor.fetchall())
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_sealed_routes_after(sealed_at, route_id, until, limit=500):
+    """
+    Busca até `limit` rotas fechadas depois do cursor (sealed_at, id) e antes de `until`, em ordem
+    de fechamento, com seus pedidos. Usado pela exportação incremental do histórico.
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                SELECT id, status, sealed_at FROM routes
+                WHERE status = 'sealed'
+                  AND (sealed_at > {placeholder} OR (sealed_at = {placeholder} AND id > {placeholder}))
+                  AND sealed_at < {placeholder}
+                ORDER BY sealed_at, id
+                LIMIT {placeholder}
+            ''', (sealed_at, sealed_at, route_id, until, limit))
+            routes = _rows_to_dicts(cursor, cursor.fetchall())
+            _attach_route_orders(cursor, placeholder, routes)
             return routes
         finally:
             cursor.close()
     finally:
         conn.close()
 
+def _attach_route_orders(cursor, placeholder, routes):
+    """Carrega os pedidos de várias rotas em uma única consulta (em ordem de entrega)."""
+    by_id = {}
+    for route in routes:
+        route['orders'] = []
+        by_id[route['id']] = route
+    if not by_id:
+        return
+    ids = list(by_id)
+    cursor.execute(f'''
+        SELECT ro.route_id, o.id, o.lat, o.lon, o.created_at, o.merchant_id, o.ready_at, o.promised_at
+        FROM route_orders ro
+        JOIN orders o ON o.id = ro.order_id
+        WHERE ro.route_id IN ({", ".join([placeholder] * len(ids))})
+        ORDER BY ro.route_id, ro.delivery_sequence
+    ''', ids)
+    for route_id, order_id, lat, lon, created_at, merchant_id, ready_at, promised_at in cursor.fetchall():
+        by_id[route_id]['orders'].append({
+            'id': order_id, 'coords': {'lat': lat, 'lon': lon}, 'created_at': created_at,
+            'merchant_id': merchant_id, 'ready_at': ready_at, 'promised_at': promised_at,
+        })
+
+@timed_query
 def get_all_created_routes():
     """Busca TODAS as rotas (para a API/Visualização), independente do status."""
     conn = get_db_connection()
@@ -173,7 +489,7 @@ def get_all_created_routes():
     try:
         cursor = conn.cursor()
         try:
-            cursor.execute("SELECT * FROM routes")
+            cursor.execute("SELECT id, google_maps_link, status FROM routes")
             routes_rows = _rows_to_dicts(cursor, cursor.fetchall())
             
             routes = []
@@ -200,8 +516,39 @@ def get_all_created_routes():
     finally:
         conn.close()
 
+@timed_query
+def get_routes_geojson_fragments(bbox=None):
+    """
+    Busca a geometria pré-calculada das rotas (uma lista de features serializada por rota).
+    Se bbox = (min_lon, min_lat, max_lon, max_lat) for informado, retorna apenas as rotas
+    cujo bounding box intersecta essa área.
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            sql = "SELECT geojson FROM routes WHERE geojson IS NOT NULL"
+            params = ()
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                sql += (f" AND max_lon >= {placeholder} AND min_lon <= {placeholder}"
+                        f" AND max_lat >= {placeholder} AND min_lat <= {placeholder}")
+                params = (min_lon, max_lon, min_lat, max_lat)
+            sql += " ORDER BY id"
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
 def create_new_route(first_order, restaurant_coords):
-    """Cria uma nova rota no banco de dados com um pedido inicial."""
+    """
+    Cria uma nova rota no banco de dados com um pedido inicial.
+    O ângulo do pedido (bearing) fica gravado na rota e define o setor dela para sempre.
+    """
     conn = get_db_connection()
     placeholder = _get_placeholder(conn)
     try:
@@ -211,14 +558,9 @@ def create_new_route(first_order, restaurant_coords):
             # Nota: PostgreSQL usa RETURNING id, SQLite não. 
             # Para simplificar aqui, faremos insert e depois select last_insert_rowid ou similar se for sqlite
             
-            is_postgres = isinstance(conn, psycopg2.extensions.connection) if 'psycopg2' in globals() else False
+            is_postgres = _is_postgres(conn)
             
-            if is_postgres:
-                cursor.execute("INSERT INTO routes (status) VALUES ('created') RETURNING id")
-                route_id = cursor.fetchone()[0]
-            else:
-                cursor.execute("INSERT INTO routes (status) VALUES ('created')")
-                route_id = cursor.lastrowid
+            route_id = _insert_route(cursor, is_postgres, _initial_bearing(first_order, restaurant_coords))
 
             # 2. Associa o pedido à rota
             sql_assoc = f"INSERT INTO route_orders (route_id, order_id, delivery_sequence) VALUES ({placeholder}, {placeholder}, 1)"
@@ -227,20 +569,85 @@ def create_new_route(first_order, restaurant_coords):
             # 3. Atualiza status do pedido
             sql_update = f"UPDATE orders SET status = 'routed' WHERE id = {placeholder}"
             cursor.execute(sql_update, (first_order['id'],))
+
+            # 4. Grava a geometria pré-calculada (GeoJSON + bounding box)
+            _write_route_geometry(cursor, placeholder, route_id, [first_order], restaurant_coords)
+            _stamp_route_changes(cursor, placeholder, [route_id])
             
             conn.commit()
             return route_id
         except Exception as e:
             conn.rollback()
-            print(f"Erro ao criar rota: {e}")
+            logger.error("Erro ao criar rota: %s", e, extra={'order_id': first_order['id']})
             raise e
         finally:
             cursor.close()
     finally:
         conn.close()
 
-def update_route(route_data):
-    """Atualiza uma rota existente (link e lista de pedidos)."""
+def _write_route_geometry(cursor, placeholder, route_id, orders, restaurant_coords):
+    """Recalcula e grava a geometria GeoJSON e o bounding box de uma rota (e marca a rota como alterada)."""
+    geometry = serialize_route_geometry(route_id, orders, restaurant_coords)
+    sql = f'''
+        UPDATE routes SET geojson = {placeholder}, min_lat = {placeholder}, min_lon = {placeholder},
+                          max_lat = {placeholder}, max_lon = {placeholder}, updated_at = {placeholder}
+        WHERE id = {placeholder}
+    '''
+    cursor.execute(sql, geometry + (time.time(), route_id))
+
+def _write_route_orders(cursor, placeholder, route_id, orders, restaurant_coords):
+    """Regrava a sequência de pedidos da rota, marca os pedidos como 'routed' e atualiza a geometria."""
+    # Remove associações antigas dessa rota (para recriar na nova ordem)
+    # Nota: Isso é uma estratégia simples. Em produção, poderia ser mais otimizado.
+    sql_delete = f"DELETE FROM route_orders WHERE route_id = {placeholder}"
+    cursor.execute(sql_delete, (route_id,))
+
+    # Reinsere os pedidos na nova ordem
+    for index, order in enumerate(orders):
+        sequence = index + 1
+        sql_assoc = f"INSERT INTO route_orders (route_id, order_id, delivery_sequence) VALUES ({placeholder}, {placeholder}, {placeholder})"
+        cursor.execute(sql_assoc, (route_id, order['id'], sequence))
+
+        # Garante que o status do pedido esteja 'routed'
+        sql_update_order = f"UPDATE orders SET status = 'routed' WHERE id = {placeholder}"
+        cursor.execute(sql_update_order, (order['id'],))
+
+    _write_route_geometry(cursor, placeholder, route_id, orders, restaurant_coords)
+
+def _insert_route(cursor, is_postgres, bearing=None):
+    """Cria uma rota vazia ('created') com o ângulo de origem e retorna o id."""
+    placeholder = '%s' if is_postgres else '?'
+    if is_postgres:
+        cursor.execute(f"INSERT INTO routes (status, bearing) VALUES ('created', {placeholder}) RETURNING id", (bearing,))
+        return cursor.fetchone()[0]
+    cursor.execute(f"INSERT INTO routes (status, bearing) VALUES ('created', {placeholder})", (bearing,))
+    return cursor.lastrowid
+
+def _stamp_route_changes(cursor, placeholder, route_ids):
+    """
+    Marca as rotas com o próximo change_seq. Chamado logo antes do commit: a linha do contador
+    fica travada até lá, e quem grava depois recebe um número maior e só confirma depois.
+    """
+    if not route_ids:
+        return
+    cursor.execute("UPDATE route_change_seq SET value = value + 1 WHERE id = 1")
+    cursor.execute("SELECT value FROM route_change_seq WHERE id = 1")
+    change_seq = cursor.fetchone()[0]
+    ids = list(route_ids)
+    cursor.execute(f"UPDATE routes SET change_seq = {placeholder} WHERE id IN ({', '.join([placeholder] * len(ids))})",
+                   [change_seq] + ids)
+
+def _initial_bearing(first_order, restaurant_coords):
+    if restaurant_coords is None or 'coords' not in first_order:
+        return None
+    return bearing_of(first_order['coords'], restaurant_coords)
+
+@timed_query
+def update_route(route_data, restaurant_coords=None):
+    """
+    Atualiza uma rota existente (link e lista de pedidos).
+    Se restaurant_coords for informado, a geometria da rota parte do restaurante.
+    """
     conn = get_db_connection()
     placeholder = _get_placeholder(conn)
     try:
@@ -250,27 +657,181 @@ def update_route(route_data):
             sql_route = f"UPDATE routes SET google_maps_link = {placeholder} WHERE id = {placeholder}"
             cursor.execute(sql_route, (route_data.get('google_maps_link'), route_data['id']))
             
-            # 2. Remove associações antigas dessa rota (para recriar na nova ordem)
-            # Nota: Isso é uma estratégia simples. Em produção, poderia ser mais otimizado.
-            sql_delete = f"DELETE FROM route_orders WHERE route_id = {placeholder}"
-            cursor.execute(sql_delete, (route_data['id'],))
-            
-            # 3. Reinsere os pedidos na nova ordem
-            for index, order in enumerate(route_data['orders']):
-                sequence = index + 1
-                sql_assoc = f"INSERT INTO route_orders (route_id, order_id, delivery_sequence) VALUES ({placeholder}, {placeholder}, {placeholder})"
-                cursor.execute(sql_assoc, (route_data['id'], order['id'], sequence))
-                
-                # Garante que o status do pedido esteja 'routed'
-                sql_update_order = f"UPDATE orders SET status = 'routed' WHERE id = {placeholder}"
-                cursor.execute(sql_update_order, (order['id'],))
+            # 2-4. Recria os pedidos na nova ordem e atualiza a geometria pré-calculada
+            _write_route_orders(cursor, placeholder, route_data['id'], route_data['orders'], restaurant_coords)
+            _stamp_route_changes(cursor, placeholder, [route_data['id']])
             
             conn.commit()
         except Exception as e:
             conn.rollback()
-            print(f"Erro ao atualizar rota: {e}")
+            logger.error("Erro ao atualizar rota: %s", e, extra={'route_id': route_data['id']})
             raise e
         finally:
             cursor.close()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+@timed_query
+def seal_routes(route_ids, sealed_at=None):
+    """Fecha as rotas (status 'sealed'): elas deixam de receber pedidos novos."""
+    if not route_ids:
+        return
+    now = time.time()
+    sealed_at = now if sealed_at is None else sealed_at
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            sealed = []
+            for route_id in route_ids:
+                cursor.execute(
+                    f"UPDATE routes SET status = 'sealed', sealed_at = {placeholder}, updated_at = {placeholder} "
+                    f"WHERE id = {placeholder} AND status = 'created'",
+                    (sealed_at, now, route_id))
+                # Já fechada (ou inexistente): não mudou, e as réplicas não precisam relê-la
+                if cursor.rowcount == 1:
+                    sealed.append(route_id)
+            _stamp_route_changes(cursor, placeholder, sealed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def apply_route_changes(routes, restaurant_coords=None, sealed_at=None):
+    """
+    Grava em uma única transação as rotas alteradas por um ciclo paralelo do processador.
+    Cada rota é {'id', 'orders', 'google_maps_link', 'sealed', 'bearing'}: id None cria a rota
+    (com o 'bearing' do pedido que a abriu) e 'sealed'
+    (motivo ou None) a fecha na mesma transação. Retorna os ids, na ordem recebida; se algo
+    falhar, nada é gravado.
+    """
+    now = time.time()
+    sealed_at = now if sealed_at is None else sealed_at
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            is_postgres = _is_postgres(conn)
+            route_ids = []
+            for route in routes:
+                if route['id'] is None:
+                    bearing = route.get('bearing')
+                    if bearing is None:
+                        bearing = _initial_bearing(route['orders'][0], restaurant_coords)
+                    route_id = _insert_route(cursor, is_postgres, bearing)
+                else:
+                    route_id = route['id']
+                cursor.execute(f"UPDATE routes SET google_maps_link = {placeholder} WHERE id = {placeholder}",
+                               (route.get('google_maps_link'), route_id))
+                _write_route_orders(cursor, placeholder, route_id, route['orders'], restaurant_coords)
+                if route.get('sealed'):
+                    cursor.execute(
+                        f"UPDATE routes SET status = 'sealed', sealed_at = {placeholder}, updated_at = {placeholder} "
+                        f"WHERE id = {placeholder} AND status = 'created'",
+                        (sealed_at, now, route_id))
+                route_ids.append(route_id)
+            _stamp_route_changes(cursor, placeholder, route_ids)
+            conn.commit()
+            return route_ids
+        except Exception as e:
+            conn.rollback()
+            logger.error("Erro ao gravar as rotas do ciclo: %s", e)
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def acquire_lease(name, holder, ttl, now=None):
+    """
+    Tenta obter (ou renovar) o lease `name` para `holder` por `ttl` segundos.
+    Só funciona se o lease estiver livre, expirado ou já for de `holder`. Retorna True se conseguiu.
+    """
+    now = time.time() if now is None else now
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                INSERT INTO leases (name, holder, expires_at) VALUES ({placeholder}, {placeholder}, {placeholder})
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < {placeholder}
+            ''', (name, holder, now + ttl, now))
+            cursor.execute(f"SELECT holder FROM leases WHERE name = {placeholder}", (name,))
+            row = cursor.fetchone()
+            conn.commit()
+            return row is not None and row[0] == holder
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def release_lease(name, holder):
+    """Libera o lease se ele ainda for de `holder`."""
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM leases WHERE name = {placeholder} AND holder = {placeholder}", (name, holder))
+            conn.commit()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def save_demand_grid(name, data, updated_at=None):
+    """Grava (ou substitui) a grade de demanda serializada `data` (bytes) com o nome `name`."""
+    updated_at = time.time() if updated_at is None else updated_at
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                INSERT INTO demand_grids (name, data, updated_at) VALUES ({placeholder}, {placeholder}, {placeholder})
+                ON CONFLICT (name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            ''', (name, data, updated_at))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@timed_query
+def get_demand_grid(name, newer_than=None):
+    """
+    Retorna (bytes, updated_at) da grade `name`, ou None se ela não existe ou não mudou
+    depois de `newer_than` (assim, conferir uma grade que não mudou não traz o conteúdo).
+    """
+    conn = get_db_connection()
+    placeholder = _get_placeholder(conn)
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT data, updated_at FROM demand_grids WHERE name = {placeholder} AND updated_at > {placeholder}",
+                (name, -1.0 if newer_than is None else newer_than))
+            row = cursor.fetchone()
+            return (bytes(row[0]), row[1]) if row else None
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
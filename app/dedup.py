@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Quantos ids recentes guardar e por quanto tempo (o iFood reentrega eventos não confirmados).
+DEDUP_MAX_ITEMS = 20000
+DEDUP_TTL_S = 2 * 60 * 60
+
+
+class RecentIdCache:
+    """
+    Conjunto limitado de ids vistos recentemente, com expiração por tempo (TTL).
+    Os itens ficam em ordem de inserção, então tanto a expiração quanto o descarte
+    por tamanho removem sempre do início (O(1) por item).
+    """
+
+    def __init__(self, max_items=DEDUP_MAX_ITEMS, ttl=DEDUP_TTL_S, clock=time.monotonic):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict_expired(self, now):
+        while self._items:
+            key, added_at = next(iter(self._items.items()))
+            if now - added_at < self.ttl:
+                break
+            self._items.popitem(last=False)
+
+    def add(self, *keys):
+        with self._lock:
+            now = self._clock()
+            for key in keys:
+                self._items.pop(key, None)
+                self._items[key] = now
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def preload(self, items, wall_clock=time.time):
+        """
+        Carrega pares (id, visto_em) em epoch, do mais antigo para o mais novo: cada id expira
+        quando completaria o TTL contado desde que foi visto de fato, não desde a carga.
+        Os ids carregados entram antes dos que já estavam no cache (vistos depois, ao vivo), que
+        ficam com o horário mais recente.
+        """
+        with self._lock:
+            now = self._clock()
+            wall_now = wall_clock()
+            loaded = OrderedDict()
+            for key, seen_at in items:
+                if key not in self._items:
+                    loaded.pop(key, None)
+                    loaded[key] = now - max(0.0, wall_now - seen_at)
+            loaded.update(self._items)
+            self._items = loaded
+            self._evict_expired(now)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def seen_any(self, *keys):
+        """Retorna True se algum dos ids já foi visto (conta como um acerto ou uma falha)."""
+        with self._lock:
+            self._evict_expired(self._clock())
+            if any(key in self._items for key in keys if key is not None):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'dedup_hits': self.hits,
+                'dedup_misses': self.misses,
+                'dedup_hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'dedup_size': len(self._items),
+            }
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.database.manager import get_sealed_routes_after
+from app.routing.optimizer import haversine_distance
+
+logger = logging.getLogger(__name__)
+
+# --- HISTÓRICO COLUNAR (ANÁLISES OFFLINE) ---
+# As rotas fechadas e seus pedidos são copiados, de forma incremental, para arquivos .npy
+# particionados por dia (day=AAAA-MM-DD/part-NNNNNN-{routes,orders}.npy). As análises leem
+# esses arquivos com mmap em vez de consultar orders/routes/route_orders no banco de produção.
+# O manifest.json guarda o cursor (sealed_at, id) da última rota exportada e a lista de partes
+# de cada dia; ele é trocado por último, então uma exportação interrompida não duplica nada.
+
+HISTORY_DIR = os.getenv("MOTOROTAS_HISTORY_DIR", "history")
+# Fuso usado para separar os dias (padrão: horário de Fortaleza, UTC-3)
+HISTORY_TZ_OFFSET_H = float(os.getenv("MOTOROTAS_HISTORY_TZ_OFFSET", "-3"))
+EXPORT_BATCH_SIZE = 500
+# Rotas fechadas há menos que isso ficam para a próxima exportação: o sealed_at vem do relógio de
+# quem fecha, e uma transação em andamento pode confirmar uma rota com sealed_at atrás do cursor
+EXPORT_SETTLE_S = 60.0
+MANIFEST_VERSION = 1
+
+ROUTE_FIELDS = [('route_id', '<i8'), ('sealed_at', '<f8'), ('first_order_at', '<f8'), ('stops', '<i4'), ('km', '<f8')]
+ORDER_FIELDS = [('route_id', '<i8'), ('sequence', '<i4'), ('lat', '<f8'), ('lon', '<f8'), ('created_at', '<f8')]
+
+
+def _day_of(timestamp):
+    tz = timezone(timedelta(hours=HISTORY_TZ_OFFSET_H))
+    return datetime.fromtimestamp(timestamp, tz).date().isoformat()
+
+def _manifest_path(directory):
+    return os.path.join(directory, 'manifest.json')
+
+def read_manifest(directory):
+    try:
+        with open(_manifest_path(directory), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': MANIFEST_VERSION, 'cursor': [0.0, 0], 'next_part': 0, 'days': {}}
+
+def _write_manifest(directory, manifest):
+    tmp_path = _manifest_path(directory) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, _manifest_path(directory))
+
+def _save_array(path, array):
+    import numpy as np
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def _route_km(orders, restaurant_coords):
+    km, current = 0.0, restaurant_coords
+    for order in orders:
+        km += haversine_distance(current, order['coords'])
+        current = order['coords']
+    return km
+
+def _write_part(directory, day, part, routes, restaurant_coords):
+    """Grava uma parte (rotas + pedidos) de um dia e retorna o nome base dela."""
+    import numpy as np
+
+    route_rows = np.empty(len(routes), dtype=ROUTE_FIELDS)
+    order_rows = np.empty(sum(len(r['orders']) for r in routes), dtype=ORDER_FIELDS)
+    order_ids = []
+    row = 0
+    for index, route in enumerate(routes):
+        created = [o['created_at'] for o in route['orders'] if o.get('created_at')]
+        route_rows[index] = (route['id'], route['sealed_at'], min(created) if created else np.nan,
+                             len(route['orders']), _route_km(route['orders'], restaurant_coords))
+        for sequence, order in enumerate(route['orders'], start=1):
+            order_rows[row] = (route['id'], sequence, order['coords']['lat'], order['coords']['lon'],
+                               order.get('created_at') or np.nan)
+            order_ids.append(order['id'])
+            row += 1
+
+    day_dir = os.path.join(directory, f'day={day}')
+    os.makedirs(day_dir, exist_ok=True)
+    name = f'part-{part:06d}'
+    _save_array(os.path.join(day_dir, f'{name}-routes.npy'), route_rows)
+    _save_array(os.path.join(day_dir, f'{name}-orders.npy'), order_rows)
+    # Ids dos pedidos à parte: texto de largura fixa, alinhado linha a linha com orders
+    _save_array(os.path.join(day_dir, f'{name}-order_ids.npy'), np.array(order_ids, dtype=str))
+    return name
+
+def export_history(restaurant_coords, directory=HISTORY_DIR, batch_size=EXPORT_BATCH_SIZE, now=None):
+    """
+    Exporta as rotas fechadas depois do cursor do manifest e há pelo menos EXPORT_SETTLE_S.
+    Lê o banco em lotes pequenos (ordenados pelo índice de sealed_at) e retorna quantas rotas
+    foram exportadas.
+    """
+    until = (time.time() if now is None else now) - EXPORT_SETTLE_S
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    exported = 0
+    while True:
+        sealed_at, route_id = manifest['cursor']
+        routes = get_sealed_routes_after(sealed_at, route_id, until, batch_size)
+        if not routes:
+            break
+        by_day = {}
+        for route in routes:
+            by_day.setdefault(_day_of(route['sealed_at']), []).append(route)
+        for day, day_routes in sorted(by_day.items()):
+            name = _write_part(directory, day, manifest['next_part'], day_routes, restaurant_coords)
+            manifest['days'].setdefault(day, []).append(name)
+            manifest['next_part'] += 1
+        manifest['cursor'] = [routes[-1]['sealed_at'], routes[-1]['id']]
+        _write_manifest(directory, manifest)
+        exported += len(routes)
+    if exported:
+        logger.info("Histórico: %d rota(s) exportada(s) para %s.", exported, directory)
+    return exported
+
+def iter_parts(directory=HISTORY_DIR, table='routes', start_day=None, end_day=None):
+    """Percorre (dia, array com mmap) das partes de `table` ('routes', 'orders' ou 'order_ids') no intervalo de dias."""
+    import numpy as np
+
+    manifest = read_manifest(directory)
+    for day in sorted(manifest['days']):
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        for name in manifest['days'][day]:
+            yield day, np.load(os.path.join(directory, f'day={day}', f'{name}-{table}.npy'), mmap_mode='r')
+
+def compute_kpis(directory=HISTORY_DIR, start_day=None, end_day=None):
+    """
+    KPIs padrão direto dos arquivos: km por pedido, paradas por rota e minutos entre o primeiro
+    pedido e o fechamento da rota, no total e por dia.
+    """
+    import numpy as np
+
+    days = {}
+    for day, routes in iter_parts(directory, 'routes', start_day, end_day):
+        totals = days.setdefault(day, {'routes': 0, 'orders': 0, 'km': 0.0, 'minutes_to_seal': []})
+        totals['routes'] += len(routes)
+        totals['orders'] += int(routes['stops'].sum())
+        totals['km'] += float(routes['km'].sum())
+        waits = (routes['sealed_at'] - routes['first_order_at']) / 60
+        totals['minutes_to_seal'].append(waits[~np.isnan(waits)])
+
+    def summarize(routes, orders, km, waits):
+        waits = np.concatenate(waits) if waits else np.empty(0)
+        return {
+            'routes': routes,
+            'orders': orders,
+            'total_km': round(km, 3),
+            'km_per_order': round(km / orders, 4) if orders else 0.0,
+            'stops_per_route': round(orders / routes, 3) if routes else 0.0,
+            'minutes_to_seal_p50': round(float(np.median(waits)), 2) if len(waits) else None,
+        }
+
+    by_day = {day: summarize(t['routes'], t['orders'], t['km'], t['minutes_to_seal']) for day, t in days.items()}
+    result = summarize(sum(t['routes'] for t in days.values()), sum(t['orders'] for t in days.values()),
+                       sum(t['km'] for t in days.values()), [w for t in days.values() for w in t['minutes_to_seal']])
+    result['by_day'] = by_day
+    return result
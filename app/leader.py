@@ -0,0 +1,161 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+import zlib
+
+from app.database import manager
+
+# --- ELEIÇÃO DE LÍDER PARA OS WORKERS ---
+# No PostgreSQL, a liderança é um advisory lock de sessão mantido por uma conexão dedicada:
+# se o processo morre, a conexão cai e o lock é liberado na hora. No SQLite (desenvolvimento),
+# é uma linha na tabela `leases` com prazo de validade, renovada periodicamente.
+
+LEASE_TTL_S = float(os.getenv("MOTOROTAS_LEASE_TTL", "30"))
+# Intervalo entre tentativas de um worker em espera
+STANDBY_RETRY_S = float(os.getenv("MOTOROTAS_LEASE_RETRY", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def default_holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class _AdvisoryLock:
+    """Advisory lock do PostgreSQL preso a uma conexão própria."""
+
+    def __init__(self, name):
+        # pg_try_advisory_lock recebe um bigint: usa o CRC32 do nome
+        self.key = zlib.crc32(name.encode('utf-8'))
+        self._conn = None
+
+    def acquire(self):
+        if self._conn is not None:
+            try:
+                with self._conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")  # A conexão viva é a prova de que o lock continua nosso
+                return True
+            except Exception:
+                self._close()
+                return False
+
+        conn = manager.get_db_connection()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+            acquired = cursor.fetchone()[0]
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return acquired
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (self.key,))
+        except Exception:
+            pass  # Fechar a conexão libera o lock de qualquer forma
+        self._close()
+
+    def _close(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+class _LeaseRow:
+    """Lease com prazo na tabela `leases` (SQLite)."""
+
+    def __init__(self, name, holder, ttl):
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+
+    def acquire(self):
+        return manager.acquire_lease(self.name, self.holder, self.ttl)
+
+    def release(self):
+        manager.release_lease(self.name, self.holder)
+
+
+class LeaderLease:
+    """
+    Liderança exclusiva sobre um papel (ex.: 'collector'). try_acquire() obtém ou renova;
+    enquanto detida, uma thread renova a cada ttl/3. is_held() diz se o papel ainda é nosso.
+    """
+
+    def __init__(self, name, holder=None, ttl=LEASE_TTL_S, use_advisory_lock=None):
+        self.name = name
+        self.holder = holder or default_holder_id()
+        self.ttl = ttl
+        if use_advisory_lock is None:
+            use_advisory_lock = bool(os.getenv("DATABASE_URL"))
+        self._backend = _AdvisoryLock(name) if use_advisory_lock else _LeaseRow(name, self.holder, ttl)
+        self._held = threading.Event()
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def try_acquire(self):
+        try:
+            acquired = self._backend.acquire()
+        except Exception as e:
+            logger.warning("Lease '%s': erro ao falar com o banco: %s", self.name, e)
+            acquired = False
+        if acquired:
+            self._held.set()
+        else:
+            self._held.clear()
+        return acquired
+
+    def is_held(self):
+        return self._held.is_set()
+
+    def start_renewing(self):
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew_loop, name=f"lease-{self.name}", daemon=True)
+        self._renewer.start()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            if not self.try_acquire():
+                logger.warning("Lease '%s' perdido; deixando o papel.", self.name)
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join(timeout=5)
+            self._renewer = None
+        if self._held.is_set():
+            self._held.clear()
+            try:
+                self._backend.release()
+            except Exception as e:
+                logger.warning("Lease '%s': erro ao liberar: %s", self.name, e)
+
+
+def run_as_leader(leases, target, retry_interval=STANDBY_RETRY_S, stop_event=None):
+    """
+    Fica em espera até obter um dos leases (o primeiro livre da lista) e então roda
+    target(lease, should_run). Quando o lease é perdido, should_run() passa a retornar
+    False, target deve retornar e o worker volta para a espera.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        lease = next((candidate for candidate in leases if candidate.try_acquire()), None)
+        if lease is None:
+            stop_event.wait(retry_interval)
+            continue
+        logger.info("Lease '%s' obtido por %s.", lease.name, lease.holder)
+        lease.start_renewing()
+        try:
+            target(lease, lambda: lease.is_held() and not stop_event.is_set())
+        finally:
+            lease.release()
@@ -0,0 +1,170 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# --- LOGS ESTRUTURADOS E NÃO BLOQUEANTES ---
+# As threads do coletor e do processador só colocam o registro em uma fila; a formatação
+# (JSON) e a escrita no stdout acontecem em uma thread separada (QueueListener).
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (padrão) ou "text" para leitura humana no desenvolvimento
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Limite de mensagens de erro repetidas: no máximo RATE_LIMIT_BURST por janela de RATE_LIMIT_WINDOW_S
+RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_WINDOW_S = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+
+# Campos de correlação que aparecem em todas as linhas de log quando definidos
+CONTEXT_FIELDS = ('cycle_id', 'component', 'order_id', 'route_id', 'merchant_id')
+_context = contextvars.ContextVar('motorotas_log_context', default={})
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Adiciona campos de correlação (ex.: cycle_id) a todos os logs emitidos dentro do bloco."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copia os campos de correlação do contexto atual para o registro (na thread que loga)."""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita mensagens repetidas de WARNING para cima (mesmo logger + mesmo template).
+    Quando a janela vira, a próxima mensagem informa quantas foram suprimidas.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, window=RATE_LIMIT_WINDOW_S, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._clock = clock
+        self._state = {}  # chave -> [início da janela, emitidas, suprimidas]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = self._clock()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed_repeats = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos de correlação e os extras passados no log."""
+
+    def format(self, record):
+        payload = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legível para o terminal, com os campos de correlação no fim da linha."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        extras = [f"{key}={getattr(record, key)}" for key in CONTEXT_FIELDS if hasattr(record, key)]
+        return f"{line} [{' '.join(extras)}]" if extras else line
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que não formata na thread de origem: o registro vai para a fila como está
+    e toda a formatação acontece na thread do listener.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+_handler = None
+_atexit_registered = False
+_setup_lock = threading.Lock()
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+    """Configura o logger "app" (e todos os módulos abaixo dele). Idempotente; retorna o QueueListener."""
+    global _listener, _handler, _atexit_registered
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        handler.addFilter(RateLimitFilter())
+
+        app_logger = logging.getLogger('app')
+        app_logger.setLevel(level)
+        app_logger.addHandler(handler)
+        app_logger.propagate = False
+        _handler = handler
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        if not _atexit_registered:
+            atexit.register(shutdown_logging)
+            _atexit_registered = True
+        return _listener
+
+def shutdown_logging():
+    """Esvazia a fila e para a thread de escrita."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            app_logger = logging.getLogger('app')
+            app_logger.removeHandler(_handler)
+            app_logger.propagate = True
+            _handler = None
@@ -0,0 +1,47 @@
+import os
+import re
+
+from app.polling import AdaptivePollScheduler, TokenBucket
+
+# --- LOJAS (MERCHANTS) ---
+# Com IFOOD_MERCHANTS=loja_centro,loja_sul o coletor atende várias lojas no mesmo processo.
+# As credenciais de cada uma vêm de IFOOD_CLIENT_ID_<LOJA> / IFOOD_CLIENT_SECRET_<LOJA>
+# (nome em maiúsculas, ex.: IFOOD_CLIENT_ID_LOJA_CENTRO). Sem IFOOD_MERCHANTS, há uma única
+# loja 'default' com IFOOD_CLIENT_ID / IFOOD_CLIENT_SECRET, como antes.
+
+DEFAULT_MERCHANT_ID = 'default'
+# Limite de requisições por loja (cada loja tem o seu token e a sua cota no iFood)
+MERCHANT_RATE_LIMIT = float(os.getenv("IFOOD_MERCHANT_RATE_LIMIT", "10"))
+MERCHANT_BURST = int(os.getenv("IFOOD_MERCHANT_BURST", "20"))
+
+
+class Merchant:
+    """Uma loja: credenciais, token em cache, agendamento de polling e limite de taxa próprios."""
+
+    def __init__(self, merchant_id, client_id, client_secret, rate_limit=MERCHANT_RATE_LIMIT, burst=MERCHANT_BURST):
+        self.id = merchant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_manager = None   # Criado pelo coletor na primeira autenticação
+        self.poll_scheduler = AdaptivePollScheduler()
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.next_poll_at = 0.0     # time.monotonic() do próximo polling
+        self.orders_saved = 0
+
+    def __repr__(self):
+        return f"Merchant({self.id!r})"
+
+
+def _env_suffix(merchant_id):
+    return re.sub(r'[^A-Za-z0-9]', '_', merchant_id).upper()
+
+def load_merchants(default_client_id=None, default_client_secret=None):
+    """Lê as lojas configuradas no ambiente (ver o comentário no topo do módulo)."""
+    names = [name.strip() for name in os.getenv("IFOOD_MERCHANTS", "").split(',') if name.strip()]
+    if not names:
+        return [Merchant(DEFAULT_MERCHANT_ID, default_client_id, default_client_secret)]
+    merchants = []
+    for name in dict.fromkeys(names):
+        suffix = _env_suffix(name)
+        merchants.append(Merchant(name, os.getenv(f"IFOOD_CLIENT_ID_{suffix}"), os.getenv(f"IFOOD_CLIENT_SECRET_{suffix}")))
+    return merchants
@@ -0,0 +1,354 @@
+import bisect
+import math
+import threading
+import time
+from functools import wraps
+
+# --- MÉTRICAS NO FORMATO PROMETHEUS ---
+# Cada thread escreve no seu próprio "shard" (uma lista de números que só ela altera),
+# então o caminho quente (inc/observe) não usa lock nenhum. Os shards só são somados
+# quando alguém lê /metrics.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+STOP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+class _ShardedValues:
+    """Vetor de contadores com um shard por thread; a leitura soma todos os shards."""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []            # (thread, shard)
+        self._retired = [0] * size   # Soma dos shards de threads que já terminaram
+        self._lock = threading.Lock()  # Só para registrar shards e para a leitura
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = [0] * self._size
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def snapshot(self):
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # A thread morreu: ninguém mais escreve nesse shard, pode ser consolidado
+                    for i, value in enumerate(shard):
+                        self._retired[i] += value
+            self._shards = alive
+            totals = list(self._retired)
+            for _, shard in alive:
+                for i, value in enumerate(shard):
+                    totals[i] += value
+        return totals
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        self._unlabeled = None
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _default_child(self):
+        # Métrica sem labels: guarda o filho para não montar a chave a cada chamada
+        child = self._unlabeled
+        if child is None:
+            child = self._unlabeled = self.labels()
+        return child
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount=1):
+        self._values.shard()[0] += amount
+
+    def value(self):
+        return self._values.snapshot()[0]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default_child().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._format_labels(key)} {_format_value(child.value())}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value):
+        self._value = value  # Atribuição simples: atômica no CPython
+
+    def set_function(self, function):
+        """O valor passa a ser calculado na hora da leitura."""
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return math.nan
+        return self._value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default_child().set(value)
+
+    def set_function(self, function):
+        self._default_child().set_function(function)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._format_labels(key)} {_format_value(child.value())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Layout do shard: [contagem por bucket..., +Inf, soma]
+        self._values = _ShardedValues(len(buckets) + 2)
+
+    def observe(self, value):
+        shard = self._values.shard()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        values = self._values.snapshot()
+        return values[:-1], values[-1]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default_child().observe(value)
+
+    def time(self):
+        return self._default_child().time()
+
+    def _render_child(self, key, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else _format_value(bound)
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    """Context manager que mede a duração de um bloco em um histograma."""
+
+    def __init__(self, histogram_child):
+        self._child = histogram_child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+# --- REGISTRO GLOBAL ---
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+def counter(name, help_text, labelnames=()):
+    return _register(Counter(name, help_text, labelnames))
+
+def gauge(name, help_text, labelnames=()):
+    return _register(Gauge(name, help_text, labelnames))
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+def render_prometheus():
+    """Gera o texto no formato de exposição do Prometheus (versão 0.0.4)."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port, host='0.0.0.0', json_routes=None):
+    """
+    Serve GET /metrics em uma thread de fundo, para processos sem Flask (o worker).
+    `json_routes` ({caminho: função}) acrescenta endpoints que respondem o retorno da função em JSON.
+    Retorna o servidor (server.server_address traz a porta de fato, útil com port=0).
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    json_routes = dict(json_routes or {})
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                body = render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path in json_routes:
+                body = json.dumps(json_routes[path]()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+# --- MÉTRICAS DA APLICAÇÃO ---
+
+PROCESSOR_CYCLE_SECONDS = histogram(
+    'motorotas_processor_cycle_seconds', 'Duração de cada ciclo do processador de rotas.')
+PROCESSOR_ORDERS_ROUTED = histogram(
+    'motorotas_processor_orders_routed', 'Pedidos roteados por ciclo do processador.', buckets=COUNT_BUCKETS)
+PENDING_BACKLOG = gauge(
+    'motorotas_pending_backlog', 'Pedidos pendentes aguardando roteamento no último ciclo.')
+OPEN_ROUTES = gauge(
+    'motorotas_open_routes', 'Rotas abertas (status created) ao fim do último ciclo.')
+ROUTES_SEALED = counter(
+    'motorotas_routes_sealed_total', 'Rotas fechadas para novos pedidos, por motivo (stops, km, age, hold, released).',
+    labelnames=('reason',))
+HOLD_DECISIONS = counter(
+    'motorotas_hold_decisions_total',
+    'Decisões sobre rotas novas de uma parada: hold (espera um vizinho), release (sai já) ou no_data (sem grade).',
+    labelnames=('decision',))
+HOLD_OUTCOMES = counter(
+    'motorotas_hold_outcomes_total', 'Rotas em espera que ganharam outro pedido (joined) ou fecharam sozinhas (expired).',
+    labelnames=('outcome',))
+ROUTE_STOPS_AT_SEAL = histogram(
+    'motorotas_route_stops_at_seal', 'Paradas por rota no fechamento; held=yes para as que passaram pela espera curta.',
+    labelnames=('held',), buckets=STOP_BUCKETS)
+
+COLLECTOR_POLL_SECONDS = histogram(
+    'motorotas_collector_poll_seconds', 'Latência do polling de eventos no iFood.')
+COLLECTOR_EVENTS_PER_POLL = histogram(
+    'motorotas_collector_events_per_poll', 'Eventos recebidos por polling.', buckets=COUNT_BUCKETS)
+
+DB_QUERY_SECONDS = histogram(
+    'motorotas_db_query_seconds', 'Latência das funções de acesso ao banco.', labelnames=('function',))
+
+API_REQUEST_SECONDS = histogram(
+    'motorotas_api_request_seconds', 'Latência das requisições HTTP da API.',
+    labelnames=('endpoint', 'method', 'status'))
+
+
+def timed_query(function):
+    """Decorator que registra a latência de uma função do manager em DB_QUERY_SECONDS."""
+    child = DB_QUERY_SECONDS.labels(function.__name__)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - start)
+    return wrapper
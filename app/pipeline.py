@@ -0,0 +1,133 @@
+import os
+import queue
+import threading
+
+# --- PIPELINE EM MEMÓRIA ENTRE COLETOR E PROCESSADOR ---
+# Opcional: ativado com MOTOROTAS_PIPELINE=queue (coletor e processador no mesmo processo).
+# O banco continua sendo o registro durável; a fila só evita que o processador
+# varra a tabela de pedidos a cada ciclo.
+
+QUEUE_MAXSIZE = int(os.getenv("MOTOROTAS_QUEUE_SIZE", "1000"))
+# Quanto tempo o coletor espera por espaço na fila (backpressure) antes de desistir.
+PUT_TIMEOUT_S = float(os.getenv("MOTOROTAS_QUEUE_PUT_TIMEOUT", "2.0"))
+
+
+class OrderPipeline:
+    """
+    Fila limitada de pedidos recém-salvos.
+
+    - publish() bloqueia o coletor enquanto a fila estiver cheia (backpressure). Se o tempo
+      de espera estourar, o pedido fica só no banco e a fila pede um "replay".
+    - take_pending() entrega ao processador os pedidos da fila. Na primeira chamada
+      (reinício) e depois de um estouro ou falha, busca os pendentes no banco uma única vez.
+    - is_active() diz se coletor e processador deste processo estão de fato rodando (no worker,
+      se ele detém os dois leases). Inativa, a fila não recebe nada e o processador varre o
+      banco a cada ciclo; ao voltar a ficar ativa, começa com um replay.
+    """
+
+    def __init__(self, maxsize=QUEUE_MAXSIZE, put_timeout=PUT_TIMEOUT_S, is_active=None):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._put_timeout = put_timeout
+        self._is_active = is_active
+        self._replay_needed = threading.Event()
+        self._replay_needed.set()  # No início, reprocessa o que ficou pendente no banco
+        self._replayed_ids = set()
+        self._not_empty = threading.Event()
+        self.published = 0
+        self.overflows = 0
+        self.replays = 0
+
+    def active(self):
+        return self._is_active is None or self._is_active()
+
+    def publish(self, orders):
+        """Coloca pedidos na fila. Retorna quantos entraram antes de um eventual estouro."""
+        if not self.active():
+            # O processador que vai rotear esses pedidos (se houver) está em outro processo e lê o banco
+            return 0
+        published = 0
+        for order in orders:
+            try:
+                self._queue.put(order, timeout=self._put_timeout)
+            except queue.Full:
+                # O restante do lote já está salvo no banco: o próximo replay o recupera
+                self.overflows += 1
+                self._replay_needed.set()
+                break
+            published += 1
+            self._not_empty.set()
+        self.published += published
+        return published
+
+    def request_replay(self):
+        """Pede que o próximo ciclo do processador recarregue os pendentes do banco."""
+        self._replay_needed.set()
+        self._not_empty.set()
+
+    def wait_for_orders(self, timeout):
+        """Bloqueia até haver pedidos na fila (ou replay pendente), no máximo por `timeout` segundos."""
+        return self._not_empty.wait(timeout)
+
+    def _drain(self):
+        self._not_empty.clear()
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def take_pending(self, load_pending_from_db):
+        """
+        Retorna os pedidos a processar neste ciclo.
+        Em modo replay, usa os pendentes do banco mais os pedidos da fila que não vieram nele, e
+        descarta as cópias dos pedidos do banco que ainda chegarem pela fila.
+        """
+        if not self.active():
+            # Sem os dois papéis neste processo, a fila não enche: varre o banco, e o próximo ciclo ativo faz replay
+            self._replay_needed.set()
+            self._drain()
+            return load_pending_from_db()
+        if self._replay_needed.is_set():
+            self._replay_needed.clear()
+            self.replays += 1
+            # Esvazia a fila antes de ler o banco: um pedido publicado entre as duas etapas vem
+            # do banco (e a cópia dele, que chega depois na fila, é descartada pelos ids)
+            drained = self._drain()
+            pending = load_pending_from_db()
+            # Soma aos ids do replay anterior: a cópia atrasada de um pedido que ele trouxe pode
+            # ser drenada só agora, quando o pedido já não está mais pendente no banco
+            self._replayed_ids |= {order['id'] for order in pending}
+            return pending + [order for order in drained if order['id'] not in self._replayed_ids]
+
+        # Um pedido salvo antes do replay e publicado logo depois chegaria duas vezes; depois de
+        # uma drenagem normal, as cópias atrasadas já passaram e os ids podem ser esquecidos
+        taken = [order for order in self._drain() if order['id'] not in self._replayed_ids]
+        self._replayed_ids = set()
+        return taken
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+_pipeline = None
+
+def enable_pipeline(maxsize=QUEUE_MAXSIZE, is_active=None):
+    """
+    Ativa a fila em memória (coletor e processador precisam rodar no mesmo processo).
+    `is_active` diz, a cada uso, se os dois estão rodando aqui (ver OrderPipeline).
+    """
+    global _pipeline
+    _pipeline = OrderPipeline(maxsize=maxsize, is_active=is_active)
+    return _pipeline
+
+def disable_pipeline():
+    global _pipeline
+    _pipeline = None
+
+def get_pipeline():
+    """Retorna a fila ativa, ou None se o modo pipeline estiver desligado."""
+    return _pipeline
+
+def pipeline_enabled_from_env():
+    return os.getenv("MOTOROTAS_PIPELINE", "").lower() == "queue"
@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+
+# --- PARÂMETROS DO AGENDAMENTO ADAPTATIVO ---
+# Intervalo usado enquanto há eventos chegando.
+MIN_INTERVAL_S = 1.0
+# Intervalo inicial / depois de um ciclo ocioso isolado (mesmo valor do loop antigo).
+BASE_INTERVAL_S = 3.0
+# Intervalo máximo em períodos ociosos. O iFood exige polling pelo menos a cada 30s
+# para manter a loja aberta, então ficamos bem abaixo disso.
+MAX_IDLE_INTERVAL_S = 10.0
+# Fator de crescimento do intervalo a cada ciclo sem eventos.
+IDLE_GROWTH = 1.5
+# Backoff exponencial em falhas: BACKOFF_BASE_S * 2^(falhas - 1), limitado a MAX_BACKOFF_S.
+BACKOFF_BASE_S = 2.0
+MAX_BACKOFF_S = 60.0
+# Falhas consecutivas até abrir o circuito e tempo que ele fica aberto.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT_S = 60.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Disjuntor simples: depois de N falhas seguidas, "abre" e bloqueia novas tentativas
+    por um tempo. Passado esse tempo, libera uma tentativa de teste (meio-aberto);
+    se ela funcionar, fecha de novo, senão volta a abrir.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT_S, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self.consecutive_failures = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow_request(self):
+        return self.state != OPEN
+
+    def seconds_until_retry(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._state = CLOSED
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.times_opened += 1
+            self._state = OPEN
+            self._opened_at = self._clock()
+
+
+class AdaptivePollScheduler:
+    """
+    Decide quanto esperar até o próximo polling a partir do resultado do ciclo anterior:
+    - eventos chegando: acelera para MIN_INTERVAL_S;
+    - ciclos ociosos: desacelera gradualmente até MAX_IDLE_INTERVAL_S;
+    - falhas: backoff exponencial com jitter e, após várias falhas, circuito aberto.
+    """
+
+    def __init__(self, breaker=None, rng=None):
+        self.breaker = breaker or CircuitBreaker()
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.current_interval = BASE_INTERVAL_S
+        self.last_events = 0
+        self.total_polls = 0
+        self.total_failures = 0
+
+    def _backoff(self, failures):
+        ceiling = min(MAX_BACKOFF_S, BACKOFF_BASE_S * (2 ** (failures - 1)))
+        # "Equal jitter": metade fixa, metade aleatória, para não sincronizar com outros clientes
+        return ceiling / 2 + self._rng.uniform(0, ceiling / 2)
+
+    def next_delay(self, outcome):
+        """
+        Registra o resultado de um ciclo e retorna o tempo de espera (s) até o próximo.
+        outcome é o número de eventos recebidos, ou None se o ciclo falhou.
+        """
+        with self._lock:
+            self.total_polls += 1
+            if outcome is None:
+                self.total_failures += 1
+                self.breaker.record_failure()
+                if not self.breaker.allow_request():
+                    self.current_interval = self.breaker.seconds_until_retry()
+                else:
+                    self.current_interval = self._backoff(self.breaker.consecutive_failures)
+                return self.current_interval
+
+            self.breaker.record_success()
+            self.last_events = outcome
+            if outcome > 0:
+                self.current_interval = MIN_INTERVAL_S
+            else:
+                grown = max(self.current_interval, MIN_INTERVAL_S) * IDLE_GROWTH
+                self.current_interval = min(MAX_IDLE_INTERVAL_S, max(BASE_INTERVAL_S, grown))
+            return self.current_interval
+
+    def metrics(self):
+        """Retorna o estado atual do agendamento (taxa de polling e estado do disjuntor)."""
+        with self._lock:
+            interval = self.current_interval
+            return {
+                'poll_interval_seconds': round(interval, 3),
+                'polls_per_minute': round(60.0 / interval, 2) if interval > 0 else None,
+                'last_events': self.last_events,
+                'total_polls': self.total_polls,
+                'total_failures': self.total_failures,
+                'breaker_state': self.breaker.state,
+                'breaker_consecutive_failures': self.breaker.consecutive_failures,
+                'breaker_times_opened': self.breaker.times_opened,
+            }
+
+
+class TokenBucket:
+    """
+    Limite de taxa com rajada: `rate` requisições por segundo, acumulando até `burst`.
+    acquire() nunca falha: quem chega sem ficha reserva a próxima e espera a sua vez.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    def acquire(self):
+        """Consome uma ficha, esperando se necessário. Retorna quanto tempo esperou."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.throttled_seconds += wait
+        if wait > 0:
+            self._sleep(wait)
+        return wait
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+
+# --- GRAVAÇÃO DO FLUXO DE PEDIDOS ---
+# Com MOTOROTAS_RECORD_PATH definido, o coletor anexa cada pedido novo a um arquivo
+# (uma linha JSON por pedido: o instante t mais o pedido como foi gravado no banco — id, lat, lon,
+# merchant_id, ready_at, promised_at). O arquivo pode ser reproduzido depois com
+# scripts/replay_orders.py contra um banco de rascunho.
+
+RECORD_PATH = os.getenv("MOTOROTAS_RECORD_PATH", "")
+
+
+class OrderStreamRecorder:
+    """Arquivo append-only com o instante de chegada e os dados de cada pedido."""
+
+    def __init__(self, path, clock=time.time):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._clock = clock
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, orders):
+        """Grava um lote de pedidos ({'id', 'lat', 'lon', ...}, inteiros) com o mesmo instante de chegada."""
+        if not orders:
+            return
+        now = round(self._clock(), 3)
+        lines = ''.join(json.dumps(dict(o, t=now), separators=(',', ':')) + '\n' for o in orders)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()  # Um lote por linha de escrita: o arquivo nunca fica com linha pela metade
+            self.recorded += len(orders)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_recording(path):
+    """
+    Lê uma gravação e retorna os pedidos em ordem de chegada (linhas inválidas são ignoradas).
+    Os campos além de t, id, lat e lon voltam como foram gravados (ausentes nas gravações antigas).
+    """
+    orders = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                orders.append(dict(entry, t=float(entry['t']), id=str(entry['id']),
+                                   lat=float(entry['lat']), lon=float(entry['lon'])))
+            except (ValueError, KeyError, TypeError):
+                continue  # Ex.: última linha truncada por uma queda do processo
+    orders.sort(key=lambda o: o['t'])
+    return orders
+
+
+_recorder = None
+
+def enable_recorder(path=RECORD_PATH):
+    global _recorder
+    _recorder = OrderStreamRecorder(path)
+    return _recorder
+
+def disable_recorder():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+def get_recorder():
+    """Retorna o gravador ativo, ou None se a gravação estiver desligada."""
+    return _recorder
@@ -1,9 +1,12 @@
 import os
 import sys
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 
 # Ajuste de import para a nova estrutura
-from app.database.manager import get_all_created_routes
+from app.database.manager import get_all_created_routes, get_routes_geojson_fragments
+from app.routing.geojson import parse_bbox, feature_collection_from_fragments
+from app.metrics import render_prometheus
+from app.routing.profiling import PROFILER
 
 # Criação do Blueprint (em vez de app = Flask)
 api_bp = Blueprint('api', __name__)
@@ -19,5 +22,61 @@ def get_routes():
     except Exception as e:
         return jsonify({"error": "Ocorreu um erro ao buscar as rotas", "details": str(e)}), 500
 
+@api_bp.route('/api/routes.geojson', methods=['GET'])
+def get_routes_geojson():
+    """
+    Endpoint para o mapa do gestor: rotas como LineStrings e paradas como Points.
+    Aceita ?bbox=min_lon,min_lat,max_lon,max_lat para baixar apenas o que está na tela.
+    """
+    bbox = None
+    bbox_param = request.args.get('bbox')
+    if bbox_param:
+        try:
+            bbox = parse_bbox(bbox_param)
+        except ValueError as e:
+            return jsonify({"error": "Parâmetro bbox inválido", "details": str(e)}), 400
+
+    try:
+        fragments = get_routes_geojson_fragments(bbox)
+        body = feature_collection_from_fragments(fragments)
+        return Response(body, status=200, mimetype='application/geo+json')
+    except Exception as e:
+        return jsonify({"error": "Ocorreu um erro ao buscar as rotas", "details": str(e)}), 500
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas do processador, do coletor, do banco e da API no formato texto do Prometheus."""
+    return Response(render_prometheus(), status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _admin_authorized():
+    """Exige no header X-Admin-Token o valor de MOTOROTAS_ADMIN_TOKEN; sem token configurado, ninguém entra."""
+    expected = os.getenv("MOTOROTAS_ADMIN_TOKEN")
+    return bool(expected) and request.headers.get('X-Admin-Token') == expected
+
+@api_bp.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling():
+    """
+    Liga/desliga o profiler do processador e consulta os tempos por etapa.
+    POST {"enabled": true, "capture_cycles": 5, "sample_every": 1} grava dumps do cProfile
+    dos próximos ciclos com trabalho.
+    Só vale para o processador que roda neste processo (run.py); com o worker.py separado,
+    use os sinais do worker (ver worker.py).
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Não autorizado"}), 403
+
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        try:
+            PROFILER.configure(
+                enabled=payload.get('enabled'),
+                capture_cycles=payload.get('capture_cycles'),
+                sample_every=payload.get('sample_every'),
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": "Parâmetros inválidos", "details": str(e)}), 400
+
+    return jsonify(PROFILER.status()), 200
+
 # Nota: Removemos o bloco "if __name__ == '__main__':" daqui, 
 # pois ele agora vive no run.py na raiz do projeto.
\ No newline at end of file
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import time
+import uuid
+
+from app.database.manager import get_created_routes, get_routes_changed_since, get_routes_high_water_mark
+from app.routing.sharding import filter_shard
+
+logger = logging.getLogger(__name__)
+
+# --- ESTADO VIVO DO PROCESSADOR E CHECKPOINT ---
+# O processador mantém em memória as rotas abertas do seu setor e, a cada ciclo, relê do banco
+# só as rotas alteradas depois da marca d'água (routes.change_seq, um contador do banco que segue
+# a ordem dos commits). De tempos em tempos esse estado vai para disco: um .npy com os pedidos das
+# rotas (lido com mmap, sem parse) mais uma tabela JSON de ids. Ao reiniciar, o processador carrega o snapshot e reaplica só o que mudou
+# depois dele, em vez de recarregar todas as rotas abertas.
+
+CHECKPOINT_DIR = os.getenv("MOTOROTAS_CHECKPOINT_DIR")
+CHECKPOINT_INTERVAL_S = float(os.getenv("MOTOROTAS_CHECKPOINT_INTERVAL", "60"))
+SNAPSHOT_VERSION = 5
+# Recarga completa periódica, como rede de segurança para qualquer mudança perdida
+FULL_RESYNC_S = 300.0
+
+_ORDER_FIELDS = [('route_index', '<i4'), ('lat', '<f8'), ('lon', '<f8'), ('created_at', '<f8'),
+                 ('ready_at', '<f8'), ('promised_at', '<f8')]
+
+
+def _shard_tag(shard):
+    return 'all' if shard is None else f'{shard[0]}of{shard[1]}'
+
+def _table_path(directory, shard):
+    return os.path.join(directory, f'processor-{_shard_tag(shard)}.json')
+
+def _atomic_write(path, write):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def write_snapshot(directory, routes, high_water_mark, shard=None, distances=()):
+    """
+    Grava o snapshot das rotas abertas (e dos pares do cache de distâncias) em `directory`.
+    Os arrays recebem um nome novo a cada geração; a tabela de ids, que aponta para eles, é
+    trocada por último com os.replace, então um leitor nunca vê um snapshot pela metade.
+    """
+    import numpy as np
+
+    os.makedirs(directory, exist_ok=True)
+    token = uuid.uuid4().hex[:12]
+    tag = _shard_tag(shard)
+    orders_name = f'processor-{tag}-{token}-orders.npy'
+    distances_name = f'processor-{tag}-{token}-distances.npy'
+
+    orders = np.empty(sum(len(r['orders']) for r in routes), dtype=_ORDER_FIELDS)
+    order_ids = []
+    merchant_ids = []
+    row = 0
+    for index, route in enumerate(routes):
+        for order in route['orders']:
+            orders[row] = (index, order['coords']['lat'], order['coords']['lon'], order.get('created_at') or 0.0,
+                           order.get('ready_at') or 0.0, order.get('promised_at') or 0.0)
+            order_ids.append(order['id'])
+            merchant_ids.append(order.get('merchant_id'))
+            row += 1
+    distance_rows = np.array(distances, dtype='<f8').reshape(-1, 5)
+
+    _atomic_write(os.path.join(directory, orders_name), lambda f: np.save(f, orders))
+    _atomic_write(os.path.join(directory, distances_name), lambda f: np.save(f, distance_rows))
+
+    table_path = _table_path(directory, shard)
+    previous = _read_table(table_path)
+    table = {
+        'version': SNAPSHOT_VERSION,
+        'shard': list(shard) if shard is not None else None,
+        'high_water_mark': high_water_mark,
+        'written_at': time.time(),
+        'routes': [[route['id'], route.get('google_maps_link'), route.get('bearing')] for route in routes],
+        'order_ids': order_ids,
+        'merchant_ids': merchant_ids,
+        'orders_file': orders_name,
+        'distances_file': distances_name,
+    }
+    _atomic_write(table_path, lambda f: f.write(json.dumps(table).encode('utf-8')))
+
+    # Os arrays da geração anterior já não são referenciados
+    for name in (previous or {}).get('orders_file'), (previous or {}).get('distances_file'):
+        if name and name not in (orders_name, distances_name):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return table_path
+
+def _read_table(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_snapshot(directory, shard=None):
+    """
+    Carrega o snapshot do setor. Retorna {'routes', 'high_water_mark', 'distances'} ou None se
+    não houver snapshot utilizável (ausente, corrompido, de outra versão ou de outro setor).
+    """
+    import numpy as np
+
+    table = _read_table(_table_path(directory, shard))
+    if not table or table.get('version') != SNAPSHOT_VERSION:
+        return None
+    if table.get('shard') != (list(shard) if shard is not None else None):
+        return None
+    try:
+        orders = np.load(os.path.join(directory, table['orders_file']), mmap_mode='r')
+        distances = np.load(os.path.join(directory, table['distances_file']), mmap_mode='r')
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Snapshot do processador inutilizável: %s", e)
+        return None
+    if len(orders) != len(table['order_ids']):
+        return None
+
+    routes = [{'id': route_id, 'google_maps_link': link, 'bearing': bearing, 'orders': []}
+              for route_id, link, bearing in table['routes']]
+    columns = zip(orders['route_index'].tolist(), orders['lat'].tolist(), orders['lon'].tolist(),
+                  orders['created_at'].tolist(), orders['ready_at'].tolist(), orders['promised_at'].tolist(),
+                  table['order_ids'], table['merchant_ids'])
+    for route_index, lat, lon, created_at, ready_at, promised_at, order_id, merchant_id in columns:
+        # 0.0 no arquivo = campo ausente
+        routes[route_index]['orders'].append({
+            'id': order_id, 'coords': {'lat': lat, 'lon': lon}, 'created_at': created_at or None,
+            'merchant_id': merchant_id, 'ready_at': ready_at or None, 'promised_at': promised_at or None,
+        })
+    return {
+        'routes': routes,
+        'high_water_mark': table['high_water_mark'],
+        'distances': distances.tolist(),
+    }
+
+
+class LiveRoutes:
+    """Rotas abertas de um setor, mantidas entre ciclos e atualizadas pela marca d'água do banco."""
+
+    def __init__(self, origin, snapshot_dir=None, clock=time.monotonic):
+        self.origin = origin
+        self.snapshot_dir = snapshot_dir
+        self._clock = clock
+        self.routes = {}              # id da rota -> rota (mesmo formato de get_created_routes)
+        self.shard = None
+        self.high_water_mark = None   # None: ainda não carregado (ou invalidado)
+        self._full_sync_at = 0.0
+        self.restored = None          # Distâncias do snapshot, entregues uma vez ao cache
+
+    def invalidate(self):
+        """Força uma recarga completa no próximo refresh (ex.: depois de um erro no ciclo)."""
+        self.high_water_mark = None
+
+    def add(self, route):
+        self.routes[route['id']] = route
+
+    def discard(self, route_ids):
+        for route_id in route_ids:
+            self.routes.pop(route_id, None)
+
+    def refresh(self, shard=None):
+        """Atualiza o estado com o banco e retorna a lista de rotas abertas do setor."""
+        if shard != self.shard:
+            # Trocou de setor (outro lease): o estado anterior não serve
+            self.invalidate()
+            self.shard = shard
+        if self.high_water_mark is None and self.snapshot_dir:
+            self._warm_start(shard)
+        if self.high_water_mark is None or self._clock() - self._full_sync_at >= FULL_RESYNC_S:
+            self._full_load(shard)
+        else:
+            self._replay(shard)
+        return list(self.routes.values())
+
+    def _warm_start(self, shard):
+        started = time.perf_counter()
+        snapshot = load_snapshot(self.snapshot_dir, shard)
+        if snapshot is None:
+            return
+        self.routes = {route['id']: route for route in snapshot['routes']}
+        self.high_water_mark = snapshot['high_water_mark']
+        self.restored = snapshot['distances']
+        self._full_sync_at = self._clock()
+        logger.info("Processador: snapshot carregado em %.1f ms (%d rota(s) abertas).",
+                    (time.perf_counter() - started) * 1000, len(self.routes))
+
+    def _full_load(self, shard):
+        # A marca é lida antes das rotas: o que mudar no meio do caminho é reaplicado depois
+        high_water_mark = get_routes_high_water_mark()
+        _, routes = filter_shard([], get_created_routes(), self.origin, shard)
+        self.routes = {route['id']: route for route in routes}
+        self.high_water_mark = high_water_mark
+        self._full_sync_at = self._clock()
+
+    def _replay(self, shard):
+        changed = get_routes_changed_since(self.high_water_mark)
+        if not changed:
+            return
+        _, open_routes = filter_shard([], [r for r in changed if r['status'] == 'created'], self.origin, shard)
+        in_shard = {route['id'] for route in open_routes}
+        for route in changed:
+            self.high_water_mark = max(self.high_water_mark, route['change_seq'])
+            if route['id'] in in_shard:
+                self.routes[route['id']] = {key: route[key] for key in ('id', 'google_maps_link', 'status', 'bearing', 'orders')}
+            else:
+                self.routes.pop(route['id'], None)
+
+    def write_snapshot(self, shard=None, distances=()):
+        if not self.snapshot_dir or self.high_water_mark is None:
+            return None
+        return write_snapshot(self.snapshot_dir, list(self.routes.values()), self.high_water_mark, shard, distances)
@@ -0,0 +1,222 @@
+import io
+import json
+import logging
+import math
+import os
+import time
+
+from app.database.manager import get_orders_created_after, get_demand_grid, save_demand_grid
+from app.history import HISTORY_TZ_OFFSET_H
+
+logger = logging.getLogger(__name__)
+
+# --- GRADE DE DEMANDA E ESPERA CURTA ---
+# Um pedido sozinho abre uma rota nova que um vizinho chegando 40 s depois teria aproveitado.
+# Um job de fundo conta os pedidos do histórico por faixa do dia x célula (quadrados de
+# DEMAND_CELL_KM em volta do restaurante) e guarda a taxa de chegadas de cada célula somada às 8
+# vizinhas. A tabela é atualizada de forma incremental (cursor created_at, id) e gravada no banco
+# (tabela demand_grids), de onde os processadores de qualquer réplica a releem quando ela muda.
+# No fim de cada ciclo, cada rota nova que ficou com uma parada só consulta a taxa da sua célula
+# (O(1)): se a chance de chegar um vizinho dentro de HOLD_WINDOW_S for de pelo menos
+# HOLD_MIN_PROBABILITY, a rota fica aberta por essa janela (limitada pela folga dos prazos);
+# senão, é fechada na hora. Com HOLD_WINDOW_S = 0 (padrão), nada muda: a rota segue o prazo de idade.
+
+# Nome da grade na tabela demand_grids
+DEMAND_GRID_NAME = 'default'
+DEMAND_CELL_KM = float(os.getenv("MOTOROTAS_DEMAND_CELL_KM", "1.0"))
+DEMAND_RADIUS_KM = float(os.getenv("MOTOROTAS_DEMAND_RADIUS_KM", "15"))
+DEMAND_SLOT_MINUTES = int(os.getenv("MOTOROTAS_DEMAND_SLOT_MINUTES", "15"))
+DEMAND_UPDATE_INTERVAL_S = float(os.getenv("MOTOROTAS_DEMAND_UPDATE_INTERVAL", "300"))
+# Pedidos mais novos que isso ficam para a próxima atualização (inserções ainda em andamento)
+DEMAND_SETTLE_S = 60.0
+# Intervalo mínimo entre duas conferências da grade no banco pelo processador
+DEMAND_RELOAD_S = 60.0
+
+HOLD_WINDOW_S = float(os.getenv("MOTOROTAS_HOLD_WINDOW", "0"))
+HOLD_MIN_PROBABILITY = float(os.getenv("MOTOROTAS_HOLD_MIN_PROBABILITY", "0.5"))
+
+KM_PER_DEGREE = 111.32
+GRID_VERSION = 1
+
+
+class DemandGrid:
+    """Pedidos por faixa do dia x célula e a taxa de chegadas (por segundo) em volta de cada célula."""
+
+    def __init__(self, origin, cell_km=DEMAND_CELL_KM, radius_km=DEMAND_RADIUS_KM,
+                 slot_minutes=DEMAND_SLOT_MINUTES, tz_offset_h=None):
+        import numpy as np
+
+        self.origin = origin
+        self.cell_km = cell_km
+        self.radius_km = radius_km
+        self.slot_minutes = slot_minutes
+        self.tz_offset_h = HISTORY_TZ_OFFSET_H if tz_offset_h is None else tz_offset_h
+        self.half = int(math.ceil(radius_km / cell_km))
+        size = 2 * self.half + 1
+        self.counts = np.zeros((24 * 60 // slot_minutes, size, size), dtype='<f8')
+        self.rates = np.zeros_like(self.counts)
+        self.first_at = None
+        self.last_at = None
+        self.cursor = [0.0, '']
+        self._km_per_lon_degree = KM_PER_DEGREE * math.cos(math.radians(origin['lat']))
+
+    @property
+    def observed_days(self):
+        if self.first_at is None:
+            return 0.0
+        return max(1.0, (self.last_at - self.first_at) / 86400)
+
+    def _cell(self, lat, lon):
+        row = round((lat - self.origin['lat']) * KM_PER_DEGREE / self.cell_km) + self.half
+        col = round((lon - self.origin['lon']) * self._km_per_lon_degree / self.cell_km) + self.half
+        return row, col
+
+    def _slot(self, timestamp):
+        return int((timestamp + self.tz_offset_h * 3600) % 86400 // (self.slot_minutes * 60))
+
+    def add(self, orders):
+        """Soma pedidos ({'lat', 'lon', 'created_at'}) às contagens; os fora do raio são ignorados."""
+        import numpy as np
+
+        size = self.counts.shape[1]
+        slots, rows, cols = [], [], []
+        for order in orders:
+            if not order.get('created_at'):
+                continue
+            row, col = self._cell(order['lat'], order['lon'])
+            if 0 <= row < size and 0 <= col < size:
+                slots.append(self._slot(order['created_at']))
+                rows.append(row)
+                cols.append(col)
+            self.first_at = order['created_at'] if self.first_at is None else min(self.first_at, order['created_at'])
+            self.last_at = order['created_at'] if self.last_at is None else max(self.last_at, order['created_at'])
+        if slots:
+            np.add.at(self.counts, (slots, rows, cols), 1)
+        self._recompute_rates()
+
+    def _recompute_rates(self):
+        import numpy as np
+
+        if self.first_at is None:
+            return
+        padded = np.pad(self.counts, ((0, 0), (1, 1), (1, 1)))
+        size = self.counts.shape[1]
+        around = sum(padded[:, dr:dr + size, dc:dc + size] for dr in range(3) for dc in range(3))
+        self.rates = around / (self.observed_days * self.slot_minutes * 60)
+
+    def rate(self, coords, timestamp):
+        """Pedidos por segundo esperados em volta do ponto, na faixa do dia de `timestamp` (O(1))."""
+        row, col = self._cell(coords['lat'], coords['lon'])
+        size = self.counts.shape[1]
+        if not (0 <= row < size and 0 <= col < size):
+            return 0.0
+        return float(self.rates[self._slot(timestamp), row, col])
+
+    def _meta(self):
+        return {'version': GRID_VERSION, 'origin': self.origin, 'cell_km': self.cell_km, 'radius_km': self.radius_km,
+                'slot_minutes': self.slot_minutes, 'tz_offset_h': self.tz_offset_h,
+                'first_at': self.first_at, 'last_at': self.last_at, 'cursor': self.cursor}
+
+    def to_bytes(self):
+        """Contagens e cursor serializados (.npz comprimido: a maior parte das células é zero)."""
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, counts=self.counts, meta=np.array(json.dumps(self._meta())))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, origin=None):
+        """Grade serializada por to_bytes, ou None se ela foi feita para outra área/geometria."""
+        import numpy as np
+
+        with np.load(io.BytesIO(data)) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            counts = arrays['counts']
+        if meta.get('version') != GRID_VERSION or (origin is not None and meta['origin'] != origin):
+            return None
+        grid = cls(meta['origin'], meta['cell_km'], meta['radius_km'], meta['slot_minutes'], meta['tz_offset_h'])
+        if counts.shape != grid.counts.shape:
+            return None
+        grid.counts = counts
+        grid.first_at, grid.last_at, grid.cursor = meta['first_at'], meta['last_at'], meta['cursor']
+        grid._recompute_rates()
+        return grid
+
+
+def update_demand_grid(grid, batch_size=5000, now=None):
+    """Soma à grade os pedidos criados depois do cursor dela; retorna quantos foram lidos."""
+    until = (time.time() if now is None else now) - DEMAND_SETTLE_S
+    total = 0
+    while True:
+        orders = get_orders_created_after(grid.cursor[0], grid.cursor[1], until, batch_size)
+        if not orders:
+            break
+        grid.add(orders)
+        grid.cursor = [orders[-1]['created_at'], orders[-1]['id']]
+        total += len(orders)
+        if len(orders) < batch_size:
+            break
+    return total
+
+def load_demand_grid(origin, name=DEMAND_GRID_NAME):
+    """Grade gravada no banco, ou None se ainda não há nenhuma (ou ela é de outra área/geometria)."""
+    stored = get_demand_grid(name)
+    return DemandGrid.from_bytes(stored[0], origin) if stored else None
+
+def start_demand_loop(origin, interval=DEMAND_UPDATE_INTERVAL_S, should_run=None, name=DEMAND_GRID_NAME):
+    """Atualiza e grava a grade de demanda a cada `interval` segundos (enquanto should_run() for verdadeiro)."""
+    grid = load_demand_grid(origin, name) or DemandGrid(origin)
+    logger.info("Grade de demanda iniciada ('%s', atualizando a cada %ss)", name, interval)
+    while should_run is None or should_run():
+        try:
+            added = update_demand_grid(grid)
+            if added:
+                save_demand_grid(name, grid.to_bytes())
+                logger.info("Grade de demanda: %d pedido(s) novo(s), %.1f dia(s) de histórico.",
+                            added, grid.observed_days)
+        except Exception as e:
+            logger.exception("Grade de demanda: erro ao atualizar: %s", e)
+        time.sleep(interval)
+
+
+class DemandGridStore:
+    """Grade gravada pelo job de fundo, relida do banco pelo processador quando muda."""
+
+    def __init__(self, origin=None, name=DEMAND_GRID_NAME, reload_s=DEMAND_RELOAD_S, clock=time.monotonic):
+        self.origin = origin
+        self.name = name
+        self.reload_s = reload_s
+        self._clock = clock
+        self._grid = None
+        self._updated_at = None
+        self._checked_at = -math.inf
+
+    def get(self):
+        """A grade mais recente (ou None enquanto o job não gravou nenhuma)."""
+        now = self._clock()
+        if now - self._checked_at < self.reload_s:
+            return self._grid
+        self._checked_at = now
+        try:
+            stored = get_demand_grid(self.name, newer_than=self._updated_at)
+            if stored is not None:
+                self._grid = DemandGrid.from_bytes(stored[0], self.origin)
+                self._updated_at = stored[1]
+        except Exception as e:
+            logger.warning("Grade de demanda: falha ao ler '%s' do banco: %s", self.name, e)
+        return self._grid
+
+
+def hold_seconds(grid, coords, now, max_delay=math.inf, window=None, min_probability=None):
+    """
+    Por quanto tempo segurar uma rota de uma parada à espera de um vizinho: a janela (HOLD_WINDOW_S,
+    limitada a `max_delay`, o atraso que os prazos da rota aguentam) se a chance de chegar ao menos
+    um pedido em volta dentro dela for de pelo menos HOLD_MIN_PROBABILITY; senão, 0.
+    """
+    window = min(HOLD_WINDOW_S if window is None else window, max_delay)
+    min_probability = HOLD_MIN_PROBABILITY if min_probability is None else min_probability
+    if window <= 0:
+        return 0.0
+    probability = 1 - math.exp(-grid.rate(coords, now) * window)
+    return window if probability >= min_probability else 0.0
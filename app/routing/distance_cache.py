@@ -0,0 +1,117 @@
+import threading
+
+# --- CACHE DE DISTÂNCIAS ---
+# Restaurante -> pedido e âncora -> pedido são recalculados em todo _is_on_the_way,
+# is_candidate_for_route e reorder_route, ciclo após ciclo, para os mesmos pedidos.
+# A chave é o par de coordenadas exatas (as de um pedido não mudam enquanto ele existe),
+# o que sai mais barato que arredondar coordenadas e ainda é mais barato que o haversine.
+
+DISTANCE_CACHE_MAX_ITEMS = 50000
+
+
+class DistanceCache:
+    """
+    LRU aproximado e limitado de distâncias entre pares de pontos.
+
+    Duas gerações de dicionários: as entradas novas (ou usadas de novo) vão para a geração
+    recente; quando ela enche, vira a geração antiga e a antiga anterior é descartada inteira.
+    Um acerto custa uma ou duas consultas a dicionário, sem lock. retain() invalida os pares
+    dos pedidos que saíram das rotas abertas. Leituras e escritas vêm da thread do processador;
+    len() (lido por /metrics em outra thread) usa um contador e nunca percorre os dicionários.
+    """
+
+    def __init__(self, distance_function, max_items=DISTANCE_CACHE_MAX_ITEMS):
+        self._distance = distance_function
+        self.max_items = max_items
+        self._generation_size = max(1, max_items // 2)
+        self._recent = {}     # (lat1, lon1, lat2, lon2) -> km
+        self._old = {}
+        self._old_only = 0    # Pares só na geração antiga (len() = len(recente) + isso)
+        self._live = set()    # Pontos vivos informados no último retain()
+        self._lock = threading.Lock()  # Só para escrita (inserção, rotação e invalidação)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def distance(self, point1, point2):
+        key = (point1['lat'], point1['lon'], point2['lat'], point2['lon'])
+        value = self._recent.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        value = self._old.get(key)
+        if value is not None:
+            self.hits += 1
+            self._recent[key] = value  # Usada de novo: sobrevive à próxima rotação
+            self._old_only -= 1
+        else:
+            self.misses += 1
+            value = self._recent[key] = self._distance(point1, point2)
+        if len(self._recent) >= self._generation_size:
+            self._rotate()
+        return value
+
+    def _rotate(self):
+        with self._lock:
+            if len(self._recent) < self._generation_size:
+                return
+            self.evictions += self._old_only
+            self._old = self._recent
+            self._recent = {}
+            self._old_only = len(self._old)
+
+    def retain(self, live_points):
+        """
+        Informa os pontos (dicts com lat/lon) ainda em rotas abertas. Se algum ponto informado
+        na chamada anterior saiu, todos os pares que o envolvem são descartados.
+        """
+        live = {(p['lat'], p['lon']) for p in live_points}
+        gone = self._live - live
+        self._live = live
+        if not gone:
+            return
+        with self._lock:
+            for generation in (self._recent, self._old):
+                stale = [key for key in generation if key[:2] in gone or key[2:] in gone]
+                for key in stale:
+                    del generation[key]
+                self.invalidations += len(stale)
+            self._recount()
+
+    def _recount(self):
+        # Só na thread que escreve (a que também altera os dicionários)
+        self._old_only = len(self._old.keys() - self._recent.keys())
+
+    def items(self):
+        """Pares conhecidos como (lat1, lon1, lat2, lon2, km), mais recentes por último (para o checkpoint)."""
+        old, recent = self._old, self._recent
+        return [key + (km,) for key, km in old.items() if key not in recent] + [key + (km,) for key, km in recent.items()]
+
+    def preload(self, rows):
+        """Recarrega pares salvos por items() sem passar pelo haversine (partida a quente)."""
+        with self._lock:
+            for lat1, lon1, lat2, lon2, km in rows[-self._generation_size:]:
+                self._recent[(lat1, lon1, lat2, lon2)] = km
+            self._recount()
+
+    def clear(self):
+        with self._lock:
+            self._recent = {}
+            self._old = {}
+            self._old_only = 0
+            self._live = set()
+
+    def __len__(self):
+        return len(self._recent) + self._old_only
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self),
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
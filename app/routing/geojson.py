@@ -0,0 +1,86 @@
+import json
+import math
+
+# --- GEOMETRIA DAS ROTAS (GeoJSON) ---
+# A geometria de cada rota é calculada uma única vez, no momento em que a rota
+# é gravada, e guardada já serializada no banco. Assim o endpoint do mapa só
+# precisa concatenar strings em vez de montar GeoJSON a cada requisição.
+
+
+def order_coords(order):
+    """Retorna as coordenadas de um pedido, aceitando os formatos {'coords': ...} e {'lat', 'lon'}."""
+    if 'coords' in order:
+        return order['coords']
+    return {'lat': order['lat'], 'lon': order['lon']}
+
+def _position(coords):
+    """GeoJSON usa a ordem [longitude, latitude]."""
+    return [coords['lon'], coords['lat']]
+
+def build_route_features(route_id, orders, restaurant_coords=None):
+    """
+    Monta as features GeoJSON de uma rota: uma LineString com o trajeto
+    (saindo do restaurante, se informado) e um Point para cada parada.
+    """
+    positions = [_position(order_coords(o)) for o in orders]
+    if restaurant_coords:
+        positions.insert(0, _position(restaurant_coords))
+
+    features = []
+    if len(positions) >= 2:
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': positions},
+            'properties': {'kind': 'route', 'route_id': route_id, 'stops': len(orders)},
+        })
+
+    for sequence, order in enumerate(orders, start=1):
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': _position(order_coords(order))},
+            'properties': {'kind': 'stop', 'route_id': route_id, 'order_id': order['id'], 'sequence': sequence},
+        })
+    return features
+
+def compute_bbox(orders, restaurant_coords=None):
+    """Calcula o retângulo envolvente (min_lat, min_lon, max_lat, max_lon) de uma rota."""
+    points = [order_coords(o) for o in orders]
+    if restaurant_coords:
+        points.append(restaurant_coords)
+    if not points:
+        return None
+    lats = [p['lat'] for p in points]
+    lons = [p['lon'] for p in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+def serialize_route_geometry(route_id, orders, restaurant_coords=None):
+    """
+    Retorna (geojson, min_lat, min_lon, max_lat, max_lon) prontos para gravar na tabela routes.
+    O campo geojson guarda a lista de features já serializada.
+    """
+    features = build_route_features(route_id, orders, restaurant_coords)
+    bbox = compute_bbox(orders, restaurant_coords) or (None, None, None, None)
+    return (json.dumps(features, separators=(',', ':')),) + tuple(bbox)
+
+def parse_bbox(value):
+    """
+    Converte o parâmetro 'bbox' (min_lon,min_lat,max_lon,max_lat — ordem do padrão GeoJSON)
+    em uma tupla de floats. Levanta ValueError se o formato for inválido.
+    """
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bbox deve ter 4 valores: min_lon,min_lat,max_lon,max_lat")
+    if not all(math.isfinite(p) for p in parts):
+        raise ValueError("bbox deve ter apenas números finitos")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox com limites invertidos")
+    return min_lon, min_lat, max_lon, max_lat
+
+def feature_collection_from_fragments(fragments):
+    """
+    Junta listas de features já serializadas (uma por rota) em uma FeatureCollection,
+    sem desserializar nada.
+    """
+    bodies = [f[1:-1] for f in fragments if f and len(f) > 2]
+    return '{"type":"FeatureCollection","features":[' + ','.join(bodies) + ']}'
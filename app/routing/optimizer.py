@@ -1,6 +1,11 @@
 import math
+import os
+import time
 import urllib.parse
-import numpy as np
+import contextlib
+
+from app.routing.distance_cache import DistanceCache, DISTANCE_CACHE_MAX_ITEMS
+from app.routing.timing import route_schedule, feasible_positions
 
 # --- PARÂMETROS DE CONFIGURAÇÃO DO ALGORITMO ---
 # Ajuste estes valores para tornar o algoritmo mais ou menos rigoroso.
@@ -13,10 +18,13 @@ CORRIDOR_WIDTH_KM = 0.8
 # não pode exceder a distância (restaurante -> âncora) por mais que este valor.
 MAX_DETOUR_KM = 1.5
 
+# Contexto vazio usado quando find_best_route_for_order é chamado sem profiler
+_NO_STAGE = contextlib.nullcontext()
+
 
 # --- FUNÇÕES DE CÁLCULO GEOGRÁFICO ---
 
-def calculate_distance(point1, point2):
+def haversine_distance(point1, point2):
     """Calcula a distância em km entre duas coordenadas geográficas (lat, lon)."""
     R = 6371  # Raio da Terra em km
     lat1, lon1 = math.radians(point1['lat']), math.radians(point1['lon'])
@@ -31,6 +39,14 @@ def calculate_distance(point1, point2):
     distance = R * c
     return distance
 
+# Cache de distâncias usado por todo o otimizador (MOTOROTAS_DISTANCE_CACHE=0 desliga)
+DISTANCE_CACHE = DistanceCache(
+    haversine_distance, int(os.getenv("MOTOROTAS_DISTANCE_CACHE_SIZE", str(DISTANCE_CACHE_MAX_ITEMS))))
+if os.getenv("MOTOROTAS_DISTANCE_CACHE", "1") == "0":
+    calculate_distance = haversine_distance
+else:
+    calculate_distance = DISTANCE_CACHE.distance
+
 def is_candidate_for_route(restaurant_coords, route_orders, new_order_coords, corridor_width, max_detour):
     """Verifica se um novo pedido é um candidato viável para se juntar a uma rota existente."""
     if not route_orders:
@@ -137,8 +153,8 @@ def calculate_direction_penalty(route_orders, new_order, restaurant_coords):
     new_vec_y = new_order['coords']['lat'] - restaurant_coords['lat']
 
     # Normaliza os vetores
-    norm_avg = np.sqrt(avg_vec_x**2 + avg_vec_y**2)
-    norm_new = np.sqrt(new_vec_x**2 + new_vec_y**2)
+    norm_avg = math.sqrt(avg_vec_x**2 + avg_vec_y**2)
+    norm_new = math.sqrt(new_vec_x**2 + new_vec_y**2)
     
     if norm_avg == 0 or norm_new == 0:
         return 0
@@ -159,40 +175,96 @@ def calculate_direction_penalty(route_orders, new_order, restaurant_coords):
     return penalty * 5 
 
 
-def find_best_route_for_order(new_order, existing_routes, restaurant_coords):
+def _has_deadlines(orders):
+    return any(order.get('promised_at') for order in orders)
+
+def refresh_route_schedule(route, restaurant_coords, now):
+    """Recalcula e guarda em route['schedule'] as chegadas e folgas da rota (só se ela tiver prazos)."""
+    if _has_deadlines(route['orders']):
+        route['schedule'] = route_schedule(route['orders'], restaurant_coords, now, calculate_distance)
+    else:
+        route.pop('schedule', None)
+
+def _timed_positions(route, new_order, restaurant_coords, now):
+    """(horários da rota, posições viáveis para o pedido). Sem prazo algum, qualquer posição serve."""
+    orders = route['orders']
+    schedule = route.get('schedule')
+    if schedule is None:
+        if not new_order.get('promised_at') and not _has_deadlines(orders):
+            return None, range(len(orders) + 1)
+        schedule = route_schedule(orders, restaurant_coords, now, calculate_distance)
+    return schedule, feasible_positions(orders, schedule, new_order, restaurant_coords, now, calculate_distance)
+
+def _sequence_with_order(route_orders, new_order, positions, schedule, restaurant_coords, now):
+    """
+    Ordem de entrega com o novo pedido: a do vizinho mais próximo, se ela cumprir os prazos;
+    senão, a inserção viável (sem reordenar o resto) de menor distância total.
+    """
+    nearest = reorder_route(route_orders + [new_order], restaurant_coords)
+    if schedule is None or route_schedule(nearest, restaurant_coords, now, calculate_distance).is_feasible():
+        return nearest
+    inserted = (route_orders[:p] + [new_order] + route_orders[p:] for p in positions)
+    return min(inserted, key=lambda orders: get_route_total_distance(orders, restaurant_coords))
+
+def plan_route_orders(route, new_order, restaurant_coords, now=None):
+    """Nova ordem de entrega da rota com o pedido, respeitando os prazos (None se não houver como)."""
+    now = time.time() if now is None else now
+    schedule, positions = _timed_positions(route, new_order, restaurant_coords, now)
+    if not positions:
+        return None
+    return _sequence_with_order(route['orders'], new_order, positions, schedule, restaurant_coords, now)
+
+def find_best_route_for_order(new_order, existing_routes, restaurant_coords, profiler=None, now=None):
     """
     Avalia um novo pedido contra todas as rotas existentes e encontra a melhor opção
     baseada no menor custo (distância + penalidade direcional).
+    Rotas em que o pedido não cabe sem estourar algum prazo de entrega são descartadas antes
+    de qualquer outro cálculo (teste O(1) por posição de inserção, ver app/routing/timing.py).
+    Se um profiler for informado, o tempo de cada etapa é medido separadamente.
     """
     best_fit_route = None
     min_cost = float('inf')
-
-    for route in existing_routes:
-        if not is_candidate_for_route(restaurant_coords, route['orders'], new_order['coords'], CORRIDOR_WIDTH_KM, MAX_DETOUR_KM):
-            continue
-
-        # Calcula o custo de adicionar o novo pedido
-        original_ordered_route = reorder_route(route['orders'], restaurant_coords)
-        original_distance = get_route_total_distance(original_ordered_route, restaurant_coords)
-
-        potential_new_route_orders = route['orders'] + [new_order]
-        new_ordered_route = reorder_route(potential_new_route_orders, restaurant_coords)
-        new_distance = get_route_total_distance(new_ordered_route, restaurant_coords)
-        
-        added_distance = new_distance - original_distance
-        
-        # Calcula a penalidade direcional
-        penalty = calculate_direction_penalty(route['orders'], new_order, restaurant_coords)
-        
-        # O custo total é a distância adicionada mais a penalidade
-        total_cost = added_distance + penalty
-
-        if total_cost < min_cost:
-            min_cost = total_cost
-            best_fit_route = route
+    now = time.time() if now is None else now
+
+    with (profiler.stage('deadline_filter') if profiler else _NO_STAGE):
+        # Uma rota só leva pedidos de uma mesma loja
+        merchant_id = new_order.get('merchant_id')
+        timed_routes = []
+        for route in existing_routes:
+            if route['orders'] and route['orders'][0].get('merchant_id') != merchant_id:
+                continue
+            schedule, positions = _timed_positions(route, new_order, restaurant_coords, now)
+            if positions:
+                timed_routes.append((route, schedule, positions))
+
+    with (profiler.stage('candidate_filter') if profiler else _NO_STAGE):
+        candidate_routes = [
+            entry for entry in timed_routes
+            if is_candidate_for_route(restaurant_coords, entry[0]['orders'], new_order['coords'], CORRIDOR_WIDTH_KM, MAX_DETOUR_KM)
+        ]
+
+    with (profiler.stage('insertion_scoring') if profiler else _NO_STAGE):
+        for route, schedule, positions in candidate_routes:
+            # Calcula o custo de adicionar o novo pedido
+            original_ordered_route = reorder_route(route['orders'], restaurant_coords)
+            original_distance = get_route_total_distance(original_ordered_route, restaurant_coords)
+
+            new_ordered_route = _sequence_with_order(route['orders'], new_order, positions, schedule, restaurant_coords, now)
+            new_distance = get_route_total_distance(new_ordered_route, restaurant_coords)
+            
+            added_distance = new_distance - original_distance
+            
+            # Calcula a penalidade direcional
+            penalty = calculate_direction_penalty(route['orders'], new_order, restaurant_coords)
+            
+            # O custo total é a distância adicionada mais a penalidade
+            total_cost = added_distance + penalty
+
+            if total_cost < min_cost:
+                min_cost = total_cost
+                best_fit_route = route
 
     if best_fit_route and min_cost < (MAX_DETOUR_KM + 5): # Limiar de custo ajustado para incluir a penalidade
         return best_fit_route
     
     return None
-
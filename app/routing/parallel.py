@@ -0,0 +1,129 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.routing.optimizer import find_best_route_for_order, plan_route_orders, refresh_route_schedule
+from app.routing.sealing import RouteSealer
+from app.routing.sharding import bearing_of
+
+# --- ROTEAMENTO PARALELO POR SETOR ---
+# Num pico de pedidos, um único processador usa um núcleo só. Como pedidos em direções opostas
+# nunca dividem rota, o ciclo pode fatiar a área em volta do restaurante em setores angulares e
+# rotear cada setor em um processo filho; o processo principal junta os resultados e grava tudo
+# em uma transação. Pedidos e rotas perto da divisa entre dois setores (a menos de
+# SECTOR_MARGIN_DEG graus dela) poderiam se juntar a rotas do vizinho: eles ficam de fora dos
+# filhos e passam depois pelo caminho serial, contra todas as rotas abertas já atualizadas.
+
+PARALLEL_SECTORS = int(os.getenv("MOTOROTAS_PARALLEL_SECTORS", "1"))
+# Abaixo disso, o custo de enviar os pedidos aos filhos não compensa: o ciclo roda serial
+PARALLEL_MIN_ORDERS = int(os.getenv("MOTOROTAS_PARALLEL_MIN_ORDERS", "200"))
+# Largura da faixa de divisa. Os filhos só veem as rotas do interior do seu setor: um pedido do
+# interior nunca é testado contra as rotas da divisa (que cruzam ou encostam na divisa), mesmo que
+# uma delas estivesse mais perto. Quanto maior a margem, menos rotas de divisa, mas mais pedidos
+# no caminho serial.
+SECTOR_MARGIN_DEG = float(os.getenv("MOTOROTAS_SECTOR_MARGIN_DEG", "10"))
+# 'forkserver' evita fazer fork de um processo com threads (o worker roda coletor e processador em threads)
+START_METHOD = os.getenv("MOTOROTAS_PARALLEL_START_METHOD",
+                         "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+_EXECUTOR = None
+_EXECUTOR_WORKERS = 0
+
+
+def interior_sector(coords, origin, sector_count, margin_deg=SECTOR_MARGIN_DEG):
+    """Setor do ponto, ou None se ele estiver a menos de `margin_deg` graus de uma divisa (ou no restaurante)."""
+    dlat, dlon = coords['lat'] - origin['lat'], coords['lon'] - origin['lon']
+    if dlat == 0 and dlon == 0:
+        return None
+    width = 2 * math.pi / sector_count
+    # Mesmo plano (lon, lat) de sector_of em app/routing/sharding.py
+    angle = math.atan2(dlat, dlon) % (2 * math.pi)
+    index = int(angle / width) % sector_count
+    offset = angle - index * width
+    margin = math.radians(margin_deg)
+    if offset < margin or offset > width - margin:
+        return None
+    return index
+
+def split_by_sector(pending_orders, routes, origin, sector_count, margin_deg=SECTOR_MARGIN_DEG):
+    """
+    Separa o trabalho do ciclo em ([(pedidos, rotas)] por setor, pedidos da divisa, rotas da divisa).
+    Uma rota só vai para um setor se todos os seus pedidos estiverem no interior dele.
+    """
+    sectors = [([], []) for _ in range(sector_count)]
+    seam_orders, seam_routes = [], []
+    for order in pending_orders:
+        index = interior_sector(order['coords'], origin, sector_count, margin_deg)
+        (seam_orders if index is None else sectors[index][0]).append(order)
+    for route in routes:
+        indexes = {interior_sector(o['coords'], origin, sector_count, margin_deg) for o in route['orders']}
+        if len(indexes) == 1 and None not in indexes:
+            sectors[indexes.pop()][1].append(route)
+        else:
+            seam_routes.append(route)
+    return sectors, seam_orders, seam_routes
+
+def route_sector_orders(orders, routes, origin, now, max_stops, max_km):
+    """
+    Roda no processo filho: distribui os pedidos do setor entre as rotas dele, só em memória.
+    Retorna as rotas alteradas ou criadas ({'id', 'orders', 'sealed', 'bearing'}; id None para as
+    novas, que levam o ângulo do pedido que as abriu), na ordem em que foram tocadas. 'sealed' é o motivo do fechamento por capacidade, ou None.
+    """
+    sealer = RouteSealer(max_stops=max_stops, max_km=max_km)
+    for route in routes:
+        refresh_route_schedule(route, origin, now)
+    touched = {}
+    for order in orders:
+        route = find_best_route_for_order(order, routes, origin, now=now)
+        if route:
+            route['orders'] = plan_route_orders(route, order, origin, now)
+        else:
+            route = {'id': None, 'orders': [order], 'bearing': bearing_of(order['coords'], origin)}
+            routes.append(route)
+        refresh_route_schedule(route, origin, now)
+        touched[id(route)] = route
+        reason = sealer.capacity_reason(route, origin)
+        if reason is not None:
+            route['sealed'] = reason
+            routes.remove(route)
+    return [{'id': r['id'], 'orders': r['orders'], 'sealed': r.get('sealed'), 'bearing': r.get('bearing')}
+            for r in touched.values()]
+
+def _route_sector_task(args):
+    return route_sector_orders(*args)
+
+def _get_executor(workers):
+    global _EXECUTOR, _EXECUTOR_WORKERS
+    if _EXECUTOR is None or _EXECUTOR_WORKERS != workers:
+        shutdown_executor()
+        _EXECUTOR = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+        _EXECUTOR_WORKERS = workers
+    return _EXECUTOR
+
+def shutdown_executor():
+    """Encerra os processos filhos (são recriados no próximo ciclo paralelo)."""
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=True, cancel_futures=True)
+        _EXECUTOR = None
+
+def route_sectors(sectors, origin, now, max_stops, max_km):
+    """
+    Roteia cada setor com pedidos em um processo filho e retorna as listas de rotas tocadas
+    (uma por setor com pedidos). Os filhos são mantidos entre ciclos, e cada um conserva o seu
+    cache de distâncias.
+    """
+    # As rotas vão sem o 'schedule' (o filho recalcula) para não levar objetos do processador
+    tasks = [(orders, [{'id': r['id'], 'orders': r['orders']} for r in routes], origin, now, max_stops, max_km)
+             for orders, routes in sectors if orders]
+    if not tasks:
+        return []
+    executor = _get_executor(min(len(sectors), os.cpu_count() or 1))
+    try:
+        return list(executor.map(_route_sector_task, tasks))
+    except BrokenProcessPool:
+        # Um filho morreu: o pool não serve mais e é recriado no próximo ciclo
+        shutdown_executor()
+        raise
@@ -1,59 +1,349 @@
 import os
 import sys
 import time
+import math
+import itertools
+import logging
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database.manager import get_pending_orders, get_created_routes, create_new_route, update_route
-from app.routing.optimizer import find_best_route_for_order, reorder_route, create_google_maps_link
+from app.database.manager import get_pending_orders, create_new_route, update_route, seal_routes, apply_route_changes
+from app.routing.optimizer import (find_best_route_for_order, plan_route_orders, refresh_route_schedule,
+                                   create_google_maps_link, DISTANCE_CACHE)
+from app.pipeline import get_pipeline
+from app import metrics
+from app.metrics import (PROCESSOR_CYCLE_SECONDS, PROCESSOR_ORDERS_ROUTED, PENDING_BACKLOG, OPEN_ROUTES, ROUTES_SEALED,
+                         HOLD_DECISIONS, HOLD_OUTCOMES, ROUTE_STOPS_AT_SEAL)
+from app.routing.profiling import PROFILER
+from app.routing.sharding import bearing_of, filter_shard
+from app.routing import parallel, demand
+from app.routing.sealing import RouteSealer
+from app.routing.checkpoint import LiveRoutes, CHECKPOINT_DIR, CHECKPOINT_INTERVAL_S
+from app.logging_config import log_context
+
+logger = logging.getLogger(__name__)
+_cycle_ids = itertools.count(1)
 
 RESTAURANT_COORDS = {"lat": -3.783871639912979, "lon": -38.50082092785248}
 
-def processor_cycle():
-    """Executa um único ciclo de processamento de rotas."""
-    pending_orders = get_pending_orders()
+# Prazos de idade das rotas abertas deste processo
+SEALER = RouteSealer()
+# Rotas abertas do setor, mantidas entre ciclos (e salvas em CHECKPOINT_DIR, se configurado)
+LIVE_ROUTES = LiveRoutes(RESTAURANT_COORDS, CHECKPOINT_DIR)
+# Taxas de chegada por faixa do dia x célula, para a espera curta das rotas de uma parada
+DEMAND_GRID = demand.DemandGridStore(RESTAURANT_COORDS)
 
-    if not pending_orders:
-        return
+def _register_distance_cache_gauges():
+    """Expõe os acertos e o tamanho do cache de distâncias do otimizador em /metrics."""
+    lookups = metrics.gauge('motorotas_distance_cache_lookups', 'Consultas ao cache de distâncias.', ('result',))
+    lookups.labels('hit').set_function(lambda: DISTANCE_CACHE.hits)
+    lookups.labels('miss').set_function(lambda: DISTANCE_CACHE.misses)
+    metrics.gauge('motorotas_distance_cache_size', 'Pares de pontos no cache de distâncias.').set_function(
+        lambda: len(DISTANCE_CACHE))
+
+_register_distance_cache_gauges()
+
+def processor_cycle(shard=None):
+    """
+    Executa um único ciclo de processamento de rotas.
+    Com shard = (índice, total), processa só os pedidos e rotas desse setor (ver app/routing/sharding.py).
+    """
+    PROFILER.begin_cycle()
+    routed = 0
+    try:
+        with log_context(component='processor', cycle_id=next(_cycle_ids)), PROCESSOR_CYCLE_SECONDS.time():
+            routed = _processor_cycle(shard)
+    except Exception:
+        # O estado em memória pode ter ficado à frente do banco: recarrega tudo no próximo ciclo
+        LIVE_ROUTES.invalidate()
+        raise
+    finally:
+        PROFILER.end_cycle(did_work=routed > 0)
+
+def _processor_cycle(shard=None):
+    pipeline = get_pipeline()
+    with PROFILER.stage('load_pending'):
+        if pipeline is None:
+            pending_orders = get_pending_orders()
+        else:
+            # Modo pipeline: consome a fila do coletor em vez de varrer a tabela de pedidos
+            pending_orders = pipeline.take_pending(get_pending_orders)
+        pending_orders, _ = filter_shard(pending_orders, [], RESTAURANT_COORDS, shard)
+
+    PENDING_BACKLOG.set(len(pending_orders) + (pipeline.qsize() if pipeline is not None else 0))
+    with PROFILER.stage('load_routes'):
+        open_routes = _refresh_live_routes(shard)
+    open_routes = _seal_expired_routes(open_routes)
+    routed = 0
+    if pending_orders:
+        try:
+            if parallel.PARALLEL_SECTORS > 1 and len(pending_orders) >= parallel.PARALLEL_MIN_ORDERS:
+                routed = _route_orders_parallel(pending_orders, open_routes)
+            else:
+                routed = _route_orders(pending_orders, open_routes)
+        except Exception:
+            # Os pedidos já saíram da fila mas continuam 'pending' no banco: recupera no próximo ciclo
+            if pipeline is not None:
+                pipeline.request_replay()
+            raise
+    PROCESSOR_ORDERS_ROUTED.observe(routed)
+    # Uma vez por ciclo, mesmo sem pedidos novos (rotas fechadas por idade também saem):
+    # os pedidos que deixaram as rotas abertas saem do cache junto com os pares que os envolvem
+    DISTANCE_CACHE.retain([RESTAURANT_COORDS] + [o['coords'] for route in open_routes for o in route['orders']])
+    return routed
 
-    print(f"✅ Processador: {len(pending_orders)} pedido(s) pendente(s) encontrado(s). Otimizando...")
-    existing_routes = get_created_routes()
+def _route_orders(pending_orders, existing_routes, new_routes=None):
+    """
+    Distribui os pedidos pendentes entre as rotas existentes (abertas, do setor) ou novas.
+    As rotas criadas entram em `new_routes` (para a decisão de espera no fim do ciclo).
+    """
+    new_routes = [] if new_routes is None else new_routes
+    logger.info("Processador: %d pedido(s) pendente(s) encontrado(s). Otimizando...", len(pending_orders))
+    # Chegadas previstas e folgas das rotas com prazo, no instante deste ciclo
+    now = SEALER.now()
+    for route in existing_routes:
+        refresh_route_schedule(route, RESTAURANT_COORDS, now)
     
     for order in pending_orders:
-        best_route = find_best_route_for_order(order, existing_routes, RESTAURANT_COORDS)
+        best_route = find_best_route_for_order(order, existing_routes, RESTAURANT_COORDS, profiler=PROFILER, now=now)
         
         if best_route:
-            # CASO 1: Adiciona a uma rota existente
-            best_route['orders'].append(order)
-            best_route['orders'] = reorder_route(best_route['orders'], RESTAURANT_COORDS)
+            # CASO 1: Adiciona a uma rota existente (na ordem que cumpre os prazos)
+            with PROFILER.stage('reorder'):
+                best_route['orders'] = plan_route_orders(best_route, order, RESTAURANT_COORDS, now)
+                refresh_route_schedule(best_route, RESTAURANT_COORDS, now)
             best_route['google_maps_link'] = create_google_maps_link(RESTAURANT_COORDS, best_route['orders'])
-            update_route(best_route)
+            with PROFILER.stage('db_writes'):
+                update_route(best_route, RESTAURANT_COORDS)
+            logger.debug("Pedido adicionado a rota existente", extra={'order_id': order['id'], 'route_id': best_route['id']})
+            _note_route_grew(best_route)
+            _seal_if_full(best_route, existing_routes)
         else:
             # CASO 2: Cria uma nova rota
-            new_route_id = create_new_route(order, RESTAURANT_COORDS)
+            with PROFILER.stage('db_writes'):
+                new_route_id = create_new_route(order, RESTAURANT_COORDS)
             new_route_orders = [order]
             link = create_google_maps_link(RESTAURANT_COORDS, new_route_orders)
             
             new_route_data = {
                 'id': new_route_id,
                 'orders': new_route_orders,
-                'google_maps_link': link
+                'google_maps_link': link,
+                'bearing': bearing_of(order['coords'], RESTAURANT_COORDS),
             }
-            update_route(new_route_data)
+            with PROFILER.stage('db_writes'):
+                update_route(new_route_data, RESTAURANT_COORDS)
+            logger.debug("Nova rota criada", extra={'order_id': order['id'], 'route_id': new_route_id})
 
 
+            refresh_route_schedule(new_route_data, RESTAURANT_COORDS, now)
             existing_routes.append(new_route_data)
-            
-    print("   -> Ciclo de processamento concluído.")
+            LIVE_ROUTES.add(new_route_data)
+            SEALER.track(new_route_data)
+            new_routes.append(new_route_data)
+            _seal_if_full(new_route_data, existing_routes)
 
-def start_processor_loop():
-    """Inicia o loop infinito do processador de rotas."""
-    interval = 3
-    print(f"--- PROCESSADOR DE ROTAS INICIADO (verificando a cada {interval}s) ---")
-    while True:
-        try:
-            processor_cycle()
-            time.sleep(interval)
-        except Exception as e:
-            print(f"\n🚨 Processador: Erro inesperado no loop: {e}")
-            time.sleep(interval)
\ No newline at end of file
+    _finish_routing(existing_routes, new_routes, now)
+    return len(pending_orders)
+
+def _route_orders_parallel(pending_orders, existing_routes):
+    """
+    Pico de pedidos: roteia cada setor angular em um processo filho, grava o resultado de todos
+    em uma transação e depois passa os pedidos da divisa entre setores pelo caminho serial.
+    """
+    sectors, seam_orders, _ = parallel.split_by_sector(pending_orders, existing_routes, RESTAURANT_COORDS,
+                                                       parallel.PARALLEL_SECTORS)
+    logger.info("Processador: %d pedido(s) pendente(s) em %d setor(es) (%d na divisa). Otimizando em paralelo...",
+                len(pending_orders) - len(seam_orders), sum(1 for orders, _ in sectors if orders), len(seam_orders))
+    now = SEALER.now()
+    with PROFILER.stage('sector_workers'):
+        results = parallel.route_sectors(sectors, RESTAURANT_COORDS, now, SEALER.max_stops, SEALER.max_km)
+    changed = [route for result in results for route in result]
+    new_routes = []
+    for route in changed:
+        route['google_maps_link'] = create_google_maps_link(RESTAURANT_COORDS, route['orders'])
+    with PROFILER.stage('db_writes'):
+        route_ids = apply_route_changes(changed, RESTAURANT_COORDS)
+
+    # Só depois da gravação o estado em memória acompanha o banco
+    by_id = {route['id']: route for route in existing_routes}
+    for route, route_id in zip(changed, route_ids):
+        live = by_id.get(route_id)
+        if live is None:
+            live = {'id': route_id, 'orders': route['orders'], 'google_maps_link': route['google_maps_link'],
+                    'bearing': route['bearing']}
+        else:
+            live['orders'] = route['orders']
+            live['google_maps_link'] = route['google_maps_link']
+        if route_id in by_id:
+            _note_route_grew(live)
+        if route['sealed']:
+            _observe_sealed([live])
+            LIVE_ROUTES.discard([route_id])
+            if route_id in by_id:
+                existing_routes.remove(live)
+            ROUTES_SEALED.labels(route['sealed']).inc()
+            continue
+        refresh_route_schedule(live, RESTAURANT_COORDS, now)
+        if route_id not in by_id:
+            existing_routes.append(live)
+            LIVE_ROUTES.add(live)
+            SEALER.track(live)
+            new_routes.append(live)
+
+    if seam_orders:
+        return len(pending_orders) - len(seam_orders) + _route_orders(seam_orders, existing_routes, new_routes)
+    _finish_routing(existing_routes, new_routes, now)
+    return len(pending_orders)
+
+def _finish_routing(existing_routes, new_routes, now):
+    _decide_holds(new_routes, existing_routes, now)
+    OPEN_ROUTES.set(len(existing_routes))
+    logger.info("Ciclo de processamento concluído.", extra={'open_routes': len(existing_routes)})
+
+def reset_state(sealer=None, snapshot_dir=None):
+    """
+    Descarta o estado em memória (ex.: ao apontar para outro banco): heap de prazos e rotas
+    abertas são recarregados no próximo ciclo.
+    """
+    global SEALER, LIVE_ROUTES
+    SEALER = sealer if sealer is not None else RouteSealer()
+    LIVE_ROUTES = LiveRoutes(RESTAURANT_COORDS, snapshot_dir)
+
+def _refresh_live_routes(shard=None):
+    """Rotas abertas do setor: snapshot + mudanças depois dele na partida, só as mudanças nos demais ciclos."""
+    before = set(LIVE_ROUTES.routes)
+    routes = LIVE_ROUTES.refresh(shard)
+    # Fechadas por outro processo ou fora do setor agora: saem também dos prazos (e da espera)
+    for route_id in before - LIVE_ROUTES.routes.keys():
+        SEALER.forget(route_id)
+    if LIVE_ROUTES.restored is not None:
+        DISTANCE_CACHE.preload(LIVE_ROUTES.restored)
+        LIVE_ROUTES.restored = None
+    for route in routes:
+        SEALER.track(route)
+    return routes
+
+def _seal_if_full(route, existing_routes):
+    """Fecha a rota que atingiu o limite de paradas ou de km; ela sai das candidatas na hora."""
+    reason = SEALER.capacity_reason(route, RESTAURANT_COORDS)
+    if reason is None:
+        return
+    with PROFILER.stage('db_writes'):
+        seal_routes([route['id']])
+    _observe_sealed([route])
+    LIVE_ROUTES.discard([route['id']])
+    existing_routes.remove(route)
+    ROUTES_SEALED.labels(reason).inc()
+    logger.debug("Rota fechada", extra={'route_id': route['id'], 'reason': reason})
+
+def _seal_expired_routes(open_routes):
+    """
+    Fecha as rotas cujo pedido mais antigo passou da idade máxima, ou cuja espera curta acabou
+    sem vizinho (consulta só o topo do heap).
+    """
+    expired = SEALER.pop_expired()
+    if not expired:
+        return open_routes
+    with PROFILER.stage('db_writes'):
+        seal_routes(expired)
+    held_out = sum(1 for route_id in expired if route_id in SEALER.holding)
+    if held_out:
+        ROUTES_SEALED.labels('hold').inc(held_out)
+        HOLD_OUTCOMES.labels('expired').inc(held_out)
+    ROUTES_SEALED.labels('age').inc(len(expired) - held_out)
+    _observe_sealed([LIVE_ROUTES.routes[route_id] for route_id in expired if route_id in LIVE_ROUTES.routes])
+    for route_id in expired:
+        SEALER.forget(route_id)
+    LIVE_ROUTES.discard(expired)
+    logger.info("Processador: %d rota(s) fechada(s) por idade.", len(expired))
+    expired = set(expired)
+    return [route for route in open_routes if route['id'] not in expired]
+
+def _observe_sealed(routes):
+    """Registra as paradas das rotas fechadas (separando as que passaram pela espera) e as tira do SEALER."""
+    for route in routes:
+        ROUTE_STOPS_AT_SEAL.labels('yes' if route['id'] in SEALER.held else 'no').observe(len(route['orders']))
+        SEALER.forget(route['id'])
+
+def _note_route_grew(route):
+    """A rota ganhou um pedido: se estava em espera, a espera deu certo e ela volta ao prazo de idade."""
+    if SEALER.end_hold(route):
+        HOLD_OUTCOMES.labels('joined').inc()
+
+def _decide_holds(new_routes, existing_routes, now):
+    """
+    Rotas criadas neste ciclo que ficaram com uma parada só: esperam um vizinho por uma janela curta,
+    se a grade de demanda indicar que vale a pena, ou são fechadas na hora.
+    """
+    if demand.HOLD_WINDOW_S <= 0:
+        return
+    singles = [route for route in new_routes if len(route['orders']) == 1 and route['id'] in SEALER]
+    if not singles:
+        return
+    grid = DEMAND_GRID.get()
+    if grid is None:
+        # Sem histórico ainda: a rota segue o prazo de idade, como sem a espera
+        HOLD_DECISIONS.labels('no_data').inc(len(singles))
+        return
+    released = []
+    for route in singles:
+        schedule = route.get('schedule')
+        # Esperar até a saída prevista (pedido ainda na cozinha) não atrasa nada; além disso, gasta a folga
+        max_delay = schedule.slack[0] + schedule.departure - now if schedule is not None else math.inf
+        seconds = demand.hold_seconds(grid, route['orders'][0]['coords'], now, max_delay=max_delay)
+        if seconds > 0:
+            SEALER.hold(route['id'], seconds)
+            HOLD_DECISIONS.labels('hold').inc()
+        else:
+            released.append(route)
+            HOLD_DECISIONS.labels('release').inc()
+    if not released:
+        return
+    released_ids = [route['id'] for route in released]
+    with PROFILER.stage('db_writes'):
+        seal_routes(released_ids)
+    _observe_sealed(released)
+    LIVE_ROUTES.discard(released_ids)
+    ROUTES_SEALED.labels('released').inc(len(released))
+    released_ids = set(released_ids)
+    existing_routes[:] = [route for route in existing_routes if route['id'] not in released_ids]
+
+def write_checkpoint(shard=None):
+    """Grava o snapshot das rotas abertas e do cache de distâncias (sem CHECKPOINT_DIR, não faz nada)."""
+    try:
+        return LIVE_ROUTES.write_snapshot(shard, DISTANCE_CACHE.items())
+    except Exception as e:
+        logger.warning("Processador: falha ao gravar o snapshot: %s", e)
+        return None
+
+def start_processor_loop(interval=3, should_run=None, shard=None):
+    """
+    Inicia o loop do processador de rotas.
+    Roda para sempre, ou enquanto should_run() for verdadeiro (ex.: enquanto o worker detiver o lease).
+    """
+    logger.info("Processador de rotas iniciado (verificando a cada %ss)", interval, extra={'shard': shard})
+    last_checkpoint = time.monotonic()
+    try:
+        while should_run is None or should_run():
+            try:
+                processor_cycle(shard)
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL_S:
+                    write_checkpoint(shard)
+                    last_checkpoint = time.monotonic()
+                _wait_for_next_cycle(interval)
+            except Exception as e:
+                logger.exception("Processador: erro inesperado no loop: %s", e)
+                time.sleep(interval)
+    finally:
+        # Lease perdido ou desligamento: o próximo processador do setor parte deste ponto
+        write_checkpoint(shard)
+        parallel.shutdown_executor()
+
+def _wait_for_next_cycle(interval):
+    """No modo pipeline, acorda assim que chegar pedido novo na fila; senão, dorme o intervalo."""
+    pipeline = get_pipeline()
+    if pipeline is None:
+        time.sleep(interval)
+    else:
+        pipeline.wait_for_orders(interval)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import cProfile
+import os
+import time
+
+from app.metrics import histogram
+
+# --- PROFILER SOB DEMANDA DO PROCESSADOR ---
+# Ligado por MOTOROTAS_PROFILE=1 ou pelo endpoint /api/admin/profiling.
+# Desligado, cada ponto de medição custa só um "with" em um objeto que não faz nada.
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_PROFILE_DIR = os.getenv("MOTOROTAS_PROFILE_DIR", os.path.join(PROJECT_ROOT, 'profiles'))
+
+# Etapas de todo ciclo; os ciclos paralelos (app/routing/parallel.py) medem também 'sector_workers',
+# a espera pelos processos filhos dos setores
+STAGES = ('load_pending', 'load_routes', 'deadline_filter', 'candidate_filter', 'insertion_scoring', 'reorder', 'db_writes')
+
+STAGE_SECONDS = histogram(
+    'motorotas_processor_stage_seconds', 'Tempo por etapa do ciclo do processador (só com o profiler ligado).',
+    labelnames=('stage',))
+
+
+class _NullStage:
+    """Ponto de medição desligado: entra e sai sem fazer nada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profiler.add(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class CycleProfiler:
+    """
+    Mede o tempo de cada etapa do ciclo do processador e, opcionalmente, grava um
+    dump do cProfile dos próximos N ciclos (um a cada `sample_every`) em disco.
+    """
+
+    def __init__(self, enabled=False, profile_dir=DEFAULT_PROFILE_DIR):
+        self.enabled = enabled
+        self.profile_dir = profile_dir
+        self.capture_remaining = 0
+        self.sample_every = 1
+        self.cycles = 0
+        self.totals = {}        # etapa -> [chamadas, segundos] desde que foi ligado
+        self.last_cycle = {}    # etapa -> segundos no último ciclo medido
+        self.dumps = []
+        self._current = None
+        self._cprofile = None
+        self._cycles_seen_for_sampling = 0
+
+    def configure(self, enabled=None, capture_cycles=None, sample_every=None, profile_dir=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+            if self.enabled:
+                self.totals = {}
+        if sample_every is not None:
+            self.sample_every = max(1, int(sample_every))
+        if capture_cycles is not None:
+            self.capture_remaining = max(0, int(capture_cycles))
+            self._cycles_seen_for_sampling = 0
+        if profile_dir:
+            self.profile_dir = profile_dir
+
+    def stage(self, name):
+        """Context manager que mede uma etapa (no-op com o profiler desligado)."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        if self._current is not None:
+            self._current[name] = self._current.get(name, 0.0) + seconds
+
+    def begin_cycle(self):
+        if not self.enabled:
+            return
+        self._current = {}
+        if self.capture_remaining > 0:
+            sampled = self._cycles_seen_for_sampling % self.sample_every == 0
+            self._cycles_seen_for_sampling += 1
+            if sampled:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+
+    def end_cycle(self, did_work):
+        """Fecha o ciclo. Ciclos sem pedidos não contam para a captura do cProfile."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if did_work:
+                self._dump(self._cprofile)
+                self.capture_remaining -= 1
+            self._cprofile = None
+
+        if self._current is None:
+            return
+        if did_work:
+            self.cycles += 1
+            self.last_cycle = self._current
+            for name, seconds in self._current.items():
+                entry = self.totals.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+                STAGE_SECONDS.labels(name).observe(seconds)
+        self._current = None
+
+    def _dump(self, profile):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"processor-cycle-{time.strftime('%Y%m%d-%H%M%S')}-{self.cycles + 1}.prof")
+        profile.dump_stats(path)
+        self.dumps.append(path)
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'cycles_measured': self.cycles,
+            'capture_remaining': self.capture_remaining,
+            'sample_every': self.sample_every,
+            'profile_dir': self.profile_dir,
+            'dumps': self.dumps[-20:],
+            'last_cycle_seconds': {k: round(v, 6) for k, v in self.last_cycle.items()},
+            'stages': {
+                name: {'cycles': count, 'total_seconds': round(total, 6), 'avg_seconds': round(total / count, 6)}
+                for name, (count, total) in self.totals.items()
+            },
+        }
+
+
+PROFILER = CycleProfiler(enabled=os.getenv("MOTOROTAS_PROFILE", "") == "1")
+if os.getenv("MOTOROTAS_PROFILE_CAPTURE"):
+    PROFILER.configure(capture_cycles=os.getenv("MOTOROTAS_PROFILE_CAPTURE"))
@@ -0,0 +1,109 @@
+import heapq
+import math
+import os
+import time
+
+from app.routing.optimizer import get_route_total_distance
+
+# --- FECHAMENTO ("SELAGEM") DE ROTAS ---
+# Uma rota 'created' deixa de receber pedidos (vira 'sealed') quando atinge o número máximo
+# de paradas, a distância máxima ou quando o pedido mais antigo dela passa da idade limite.
+# Os prazos de idade ficam em um heap: conferir o que venceu custa O(log n) por rota vencida,
+# sem varrer todas as rotas abertas a cada ciclo.
+# Uma rota nova de uma parada pode ficar "em espera" (ver app/routing/demand.py): o prazo dela passa
+# a ser uma janela curta e, se ela ganhar outro pedido, volta ao prazo de idade.
+
+MAX_STOPS_PER_ROUTE = int(os.getenv("MOTOROTAS_MAX_STOPS", "6"))
+MAX_ROUTE_KM = float(os.getenv("MOTOROTAS_MAX_ROUTE_KM", "20"))
+# Idade máxima (s) do pedido mais antigo de uma rota aberta
+MAX_ROUTE_AGE_S = float(os.getenv("MOTOROTAS_MAX_ROUTE_AGE", str(15 * 60)))
+
+# 'hold': a espera acabou sem vizinho; 'released': a rota de uma parada saiu sem esperar
+SEAL_REASONS = ('stops', 'km', 'age', 'hold', 'released')
+
+
+class RouteSealer:
+    """Heap de prazos (pedido mais antigo + idade máxima) das rotas abertas."""
+
+    def __init__(self, max_stops=MAX_STOPS_PER_ROUTE, max_km=MAX_ROUTE_KM, max_age=MAX_ROUTE_AGE_S, clock=time.time):
+        self.max_stops = max_stops
+        self.max_km = max_km
+        self.max_age = max_age
+        self._clock = clock
+        self._heap = []        # (prazo, id da rota)
+        self._deadlines = {}   # id da rota -> prazo vigente (entradas do heap fora daqui são descartadas)
+        self._age_deadlines = {}  # id da rota -> prazo de idade (a espera nunca passa dele)
+        self.holding = set()   # rotas em espera agora
+        self.held = set()      # rotas que passaram pela espera (ainda abertas)
+
+    def now(self):
+        """Instante atual no relógio do fechamento (o ciclo do processador usa o mesmo)."""
+        return self._clock()
+
+    def track(self, route):
+        """Passa a acompanhar a rota (O(1) se ela já é conhecida, O(log n) se é nova)."""
+        if route['id'] in self._deadlines:
+            return
+        now = self._clock()
+        oldest = min((order.get('created_at') or now for order in route['orders']), default=now)
+        deadline = oldest + self.max_age
+        self._deadlines[route['id']] = deadline
+        self._age_deadlines[route['id']] = deadline
+        heapq.heappush(self._heap, (deadline, route['id']))
+
+    def forget(self, route_id):
+        # A entrada no heap fica para trás e é ignorada quando chegar ao topo
+        self._deadlines.pop(route_id, None)
+        self._age_deadlines.pop(route_id, None)
+        self.holding.discard(route_id)
+        self.held.discard(route_id)
+
+    def hold(self, route_id, seconds):
+        """Troca o prazo da rota por agora + `seconds` (sem passar do prazo de idade): a espera curta por um vizinho."""
+        deadline = min(self._clock() + seconds, self._age_deadlines.get(route_id, math.inf))
+        self._deadlines[route_id] = deadline
+        heapq.heappush(self._heap, (deadline, route_id))
+        self.holding.add(route_id)
+        self.held.add(route_id)
+
+    def end_hold(self, route):
+        """A rota ganhou outro pedido: volta ao prazo de idade. Retorna True se ela estava em espera."""
+        if route['id'] not in self.holding:
+            return False
+        self.holding.discard(route['id'])
+        del self._deadlines[route['id']]
+        del self._age_deadlines[route['id']]
+        self.track(route)
+        return True
+
+    def __contains__(self, route_id):
+        return route_id in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def capacity_reason(self, route, restaurant_coords):
+        """Motivo para selar a rota por capacidade ('stops' ou 'km'), ou None."""
+        if len(route['orders']) >= self.max_stops:
+            return 'stops'
+        if get_route_total_distance(route['orders'], restaurant_coords) >= self.max_km:
+            return 'km'
+        return None
+
+    def pop_expired(self):
+        """Remove e retorna os ids das rotas cujo prazo de idade já venceu."""
+        now = self._clock()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, route_id = heapq.heappop(self._heap)
+            if self._deadlines.get(route_id) == deadline:
+                del self._deadlines[route_id]
+                self._age_deadlines.pop(route_id, None)
+                expired.append(route_id)
+        return expired
+
+    def next_deadline(self):
+        """Prazo mais próximo entre as rotas acompanhadas (ou None)."""
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
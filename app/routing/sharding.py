@@ -0,0 +1,49 @@
+import math
+
+# --- DIVISÃO DA ÁREA EM SETORES ANGULARES ---
+# Cada processador cuida de um setor angular em volta do restaurante: os pedidos do setor e as
+# rotas que nasceram nele. Os setores NÃO são independentes: o produto escalar em _is_on_the_way
+# só impede a junção de pedidos a 90° ou mais um do outro, então dois pedidos dos dois lados de
+# uma divisa (com qualquer número de setores maior que 1) poderiam dividir rota. Ao fatiar, essas
+# junções na divisa se perdem; em troca, cada rota tem um único dono.
+# O dono de uma rota sai do 'bearing' gravado quando ela é criada (ângulo do primeiro pedido, em
+# graus) e nunca muda: reordenar os pedidos não passa a rota para outro processador.
+
+
+def bearing_of(coords, origin):
+    """Ângulo do ponto (0 <= graus < 360) visto do restaurante, no plano (lon, lat) do otimizador."""
+    return math.degrees(math.atan2(coords['lat'] - origin['lat'], coords['lon'] - origin['lon'])) % 360.0
+
+def sector_of_bearing(bearing, sector_count):
+    """Índice do setor (0..sector_count-1) de um ângulo em graus."""
+    if sector_count <= 1:
+        return 0
+    return int(bearing / (360.0 / sector_count)) % sector_count
+
+def sector_of(coords, origin, sector_count):
+    """Índice do setor (0..sector_count-1) em que o ponto cai, medido a partir do restaurante."""
+    if sector_count <= 1:
+        return 0
+    return sector_of_bearing(bearing_of(coords, origin), sector_count)
+
+def route_sector(route, origin, sector_count):
+    """
+    Setor da rota pelo 'bearing' gravado na criação. Rotas criadas antes da coluna existir
+    (bearing None) caem no setor do primeiro pedido, como antes.
+    """
+    if route.get('bearing') is not None:
+        return sector_of_bearing(route['bearing'], sector_count)
+    return sector_of(route['orders'][0]['coords'], origin, sector_count) if route['orders'] else 0
+
+def filter_shard(pending_orders, routes, origin, shard):
+    """
+    Mantém só os pedidos e rotas do setor `shard` = (índice, total).
+    Sem shard, devolve tudo (um único processador cuida da área inteira).
+    """
+    if shard is None or shard[1] <= 1:
+        return pending_orders, routes
+    index, count = shard
+    return (
+        [o for o in pending_orders if sector_of(o['coords'], origin, count) == index],
+        [r for r in routes if route_sector(r, origin, count) == index],
+    )
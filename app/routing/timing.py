@@ -0,0 +1,98 @@
+import math
+import os
+
+# --- PRAZOS DE ENTREGA ---
+# Cada pedido pode ter um horário em que fica pronto (ready_at) e um horário prometido ao
+# cliente (promised_at), ambos em epoch. A rota sai do restaurante quando todos os seus pedidos
+# estão prontos e visita as paradas na ordem, a uma velocidade média fixa. Para cada parada a
+# rota guarda o horário de chegada previsto e a folga à frente (forward slack): quanto a parada
+# e todas as seguintes ainda podem atrasar sem estourar nenhum prazo. Com isso, testar a
+# inserção de um pedido em uma posição custa O(1), sem simular a rota de novo.
+# Pedidos sem horários não têm prazo (folga infinita) e ficam prontos na hora.
+
+COURIER_SPEED_KMH = float(os.getenv("MOTOROTAS_COURIER_SPEED_KMH", "25"))
+SERVICE_TIME_S = float(os.getenv("MOTOROTAS_SERVICE_TIME", "120"))
+# Usados pelo coletor quando o iFood não informa os horários do pedido
+DEFAULT_PREP_TIME_S = float(os.getenv("MOTOROTAS_DEFAULT_PREP_TIME", str(10 * 60)))
+DEFAULT_PROMISE_S = float(os.getenv("MOTOROTAS_DEFAULT_PROMISE", str(45 * 60)))
+
+INF = math.inf
+
+
+def travel_seconds(km):
+    return km / COURIER_SPEED_KMH * 3600
+
+def _ready(order, now):
+    return max(now, order.get('ready_at') or now)
+
+def _promised(order):
+    return order.get('promised_at') or INF
+
+
+class RouteSchedule:
+    """Horários previstos de uma rota em um instante `now`: saída, chegadas e folgas por parada."""
+
+    __slots__ = ('departure', 'arrivals', 'slack')
+
+    def __init__(self, departure, arrivals, slack):
+        self.departure = departure
+        self.arrivals = arrivals   # chegada prevista em cada parada
+        self.slack = slack         # slack[i] = min(prazo - chegada) das paradas i..fim; slack[n] = inf
+
+    @property
+    def has_deadlines(self):
+        return self.slack[0] != INF
+
+    def is_feasible(self):
+        return self.slack[0] >= 0
+
+
+def route_schedule(orders, restaurant_coords, now, distance):
+    """Simula a rota (O(n)) e retorna o seu RouteSchedule."""
+    departure = max((_ready(order, now) for order in orders), default=now)
+    arrivals = []
+    t = departure
+    location = restaurant_coords
+    for order in orders:
+        t += travel_seconds(distance(location, order['coords']))
+        arrivals.append(t)
+        t += SERVICE_TIME_S
+        location = order['coords']
+    slack = [INF] * (len(orders) + 1)
+    for i in range(len(orders) - 1, -1, -1):
+        slack[i] = min(_promised(orders[i]) - arrivals[i], slack[i + 1])
+    return RouteSchedule(departure, arrivals, slack)
+
+def feasible_positions(orders, schedule, new_order, restaurant_coords, now, distance):
+    """
+    Posições (0..n) em que o pedido pode entrar na rota sem estourar nenhum prazo.
+    Cada posição custa O(1): o atraso que a inserção causa nas paradas seguintes é comparado
+    com a folga à frente delas. Os cortes mais baratos vêm antes de qualquer cálculo de distância.
+    """
+    n = len(orders)
+    promised = _promised(new_order)
+    # Se o pedido fica pronto depois da saída prevista, a rota inteira atrasa
+    departure_delay = max(0.0, _ready(new_order, now) - schedule.departure)
+    if departure_delay > schedule.slack[0]:
+        return []
+    if promised == INF and not schedule.has_deadlines:
+        return range(n + 1)
+    departure = schedule.departure + departure_delay
+    if departure + travel_seconds(distance(restaurant_coords, new_order['coords'])) > promised:
+        return []  # Nem indo direto ao cliente chega a tempo
+
+    positions = []
+    for p in range(n + 1):
+        previous = restaurant_coords if p == 0 else orders[p - 1]['coords']
+        leaves_previous = departure if p == 0 else schedule.arrivals[p - 1] + departure_delay + SERVICE_TIME_S
+        to_new = travel_seconds(distance(previous, new_order['coords']))
+        if leaves_previous + to_new > promised:
+            continue
+        if p < n:
+            following = orders[p]['coords']
+            detour = (to_new + SERVICE_TIME_S + travel_seconds(distance(new_order['coords'], following))
+                      - travel_seconds(distance(previous, following)))
+            if departure_delay + detour > schedule.slack[p]:
+                continue
+        positions.append(p)
+    return positions
@@ -0,0 +1,99 @@
+import threading
+import time
+
+# Renova o token quando faltar menos que isso (em segundos) para ele expirar.
+REFRESH_MARGIN_S = 300
+# Espera antes de tentar de novo quando a renovação em segundo plano falha.
+RETRY_AFTER_FAILURE_S = 30
+
+
+class TokenManager:
+    """
+    Guarda o access token OAuth em cache junto com a sua validade.
+
+    - get_token() só faz a requisição de autenticação quando não há token válido.
+    - refresh(stale_token) é "single-flight": chamadas simultâneas esperam a mesma
+      renovação em vez de cada uma disparar a sua própria requisição.
+    - start_background_refresh() renova o token pouco antes de ele expirar, para
+      que o ciclo do coletor nunca pague a latência da autenticação.
+
+    fetch_token é uma função que retorna (token, expires_in_segundos) ou None em caso de falha.
+    """
+
+    def __init__(self, fetch_token, refresh_margin=REFRESH_MARGIN_S, clock=time.time):
+        self._fetch_token = fetch_token
+        self._refresh_margin = refresh_margin
+        self._clock = clock
+        self._token = None
+        self._expires_at = 0.0
+        self._margin = refresh_margin   # Margem do token atual (nunca mais que metade da validade)
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.refresh_count = 0
+
+    def _is_fresh(self):
+        return self._token is not None and self._clock() < self._expires_at - self._margin
+
+    def get_token(self):
+        """Retorna um token válido, renovando apenas se necessário."""
+        if self._is_fresh():
+            return self._token
+        return self.refresh()
+
+    def refresh(self, stale_token=None):
+        """
+        Renova o token. Se stale_token for informado (ex.: após um 401), só renova se o
+        token atual ainda for esse; caso outra thread já tenha renovado, reaproveita o novo.
+        """
+        with self._refresh_lock:
+            if stale_token is not None:
+                if self._token is not None and self._token != stale_token:
+                    return self._token
+            elif self._is_fresh():
+                return self._token
+
+            result = self._fetch_token()
+            self.refresh_count += 1
+            if not result:
+                # Renovação antecipada que falhou: o token atual ainda vale até expirar de fato
+                # (após um 401, ao contrário, ele foi recusado e não serve mais)
+                if stale_token is None and self._token is not None and self._clock() < self._expires_at:
+                    return self._token
+                return None
+
+            token, expires_in = result
+            self._token = token
+            self._expires_at = self._clock() + expires_in
+            # Um token que vale menos que a margem seria renovado sem parar: usa metade da validade
+            self._margin = min(self._refresh_margin, expires_in / 2)
+            return token
+
+    def seconds_until_refresh(self):
+        """Tempo até o momento em que o token deve ser renovado proativamente."""
+        if self._token is None:
+            return 0.0
+        return max(0.0, self._expires_at - self._margin - self._clock())
+
+    def start_background_refresh(self):
+        """Inicia uma thread que renova o token pouco antes de ele expirar."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._background_loop, name="token-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _background_loop(self):
+        while not self._stop_event.is_set():
+            if self._stop_event.wait(self.seconds_until_refresh()):
+                return
+            # Força a renovação mesmo que o token ainda esteja dentro da margem
+            token = self.refresh(stale_token=self._token) if self._token else self.refresh()
+            if token is None:
+                self._stop_event.wait(RETRY_AFTER_FAILURE_S)
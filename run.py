@@ -1,13 +1,26 @@
+import logging
 import threading
 from app import create_app
-from app.collector import start_collector_loop
+from flask import jsonify
+from app.collector import start_collector_loop, get_collector_metrics
 from app.routing.processor import start_processor_loop
+from app.pipeline import enable_pipeline, pipeline_enabled_from_env
+from app.recorder import enable_recorder, RECORD_PATH
 
 app = create_app()
+logger = logging.getLogger('app.run')
 
 if __name__ == "__main__":
     # Inicia threads (mesma lógica que você já tinha)
-    print("Iniciando serviços de fundo...")
+    logger.info("Iniciando serviços de fundo...")
+    if pipeline_enabled_from_env():
+        enable_pipeline()
+        logger.info("Modo pipeline ativo: coletor entrega pedidos ao processador por uma fila em memória.")
+    if RECORD_PATH:
+        enable_recorder(RECORD_PATH)
+        logger.info("Gravando o fluxo de pedidos em %s", RECORD_PATH)
+    # Aqui o coletor roda no mesmo processo do Flask: o estado dele pode ser servido pela API
+    app.add_url_rule('/api/collector/metrics', 'collector_metrics', lambda: jsonify(get_collector_metrics()))
     threading.Thread(target=start_collector_loop, daemon=True).start()
     threading.Thread(target=start_processor_loop, daemon=True).start()
     
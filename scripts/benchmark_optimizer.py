@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.database.manager as manager
+from app.routing import optimizer
+from app.routing import processor
+from scripts.synthetic_orders import generate_orders
+
+RESTAURANT_COORDS = processor.RESTAURANT_COORDS
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_SEED = 42
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# Regressão tolerada em relação ao baseline (25%)
+DEFAULT_THRESHOLD = 0.25
+# Tempo máximo por etapa; etapas que estouram são medidas sobre os pedidos já processados
+DEFAULT_BUDGET_S = 20.0
+# Quantos pedidos entram no banco entre dois ciclos do processador
+PROCESSOR_CHUNK = 100
+
+# Métricas comparadas com o baseline: True = maior é melhor, False = menor é melhor
+TRACKED_METRICS = {
+    'find_best_ops_per_s': True,
+    'reorder_ops_per_s': True,
+    'processor_orders_per_s': True,
+    'km_per_order': False,
+    'peak_alloc_kb': False,
+}
+
+
+def bench_assignment(orders, budget_s):
+    """
+    Roteia os pedidos um a um em memória (como o processador faz), medindo separadamente
+    o tempo de find_best_route_for_order e de reorder_route.
+    """
+    routes = []
+    find_time = reorder_time = 0.0
+    find_calls = reorder_calls = 0
+    started = time.perf_counter()
+    for order in orders:
+        t0 = time.perf_counter()
+        best = optimizer.find_best_route_for_order(order, routes, RESTAURANT_COORDS)
+        find_time += time.perf_counter() - t0
+        find_calls += 1
+        if best:
+            best['orders'].append(order)
+            t0 = time.perf_counter()
+            best['orders'] = optimizer.reorder_route(best['orders'], RESTAURANT_COORDS)
+            reorder_time += time.perf_counter() - t0
+            reorder_calls += 1
+        else:
+            routes.append({'id': len(routes) + 1, 'orders': [order]})
+        if time.perf_counter() - started > budget_s:
+            break
+
+    total_km = sum(optimizer.get_route_total_distance(r['orders'], RESTAURANT_COORDS) for r in routes)
+    return {
+        'routed': find_calls,
+        'truncated': find_calls < len(orders),
+        'routes': len(routes),
+        'total_km': round(total_km, 3),
+        'km_per_order': round(total_km / find_calls, 4) if find_calls else 0.0,
+        'find_best_ops_per_s': round(find_calls / find_time, 2) if find_time else 0.0,
+        'reorder_ops_per_s': round(reorder_calls / reorder_time, 2) if reorder_time else 0.0,
+    }
+
+def bench_allocations(orders, sample=200):
+    """
+    Pico de memória alocada (KB) ao rotear uma amostra dos pedidos. O cache de distâncias
+    começa vazio: o que as etapas anteriores deixaram nele não entra (nem sai) da conta.
+    """
+    sample_orders = orders[:sample]
+    optimizer.DISTANCE_CACHE.clear()
+    tracemalloc.start()
+    try:
+        routes = []
+        for order in sample_orders:
+            best = optimizer.find_best_route_for_order(order, routes, RESTAURANT_COORDS)
+            if best:
+                best['orders'] = optimizer.reorder_route(best['orders'] + [order], RESTAURANT_COORDS)
+            else:
+                routes.append({'id': len(routes) + 1, 'orders': [order]})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+@contextlib.contextmanager
+def in_memory_database():
+    """Aponta o manager para um SQLite em memória compartilhado durante o benchmark."""
+    uri = f"file:motorotas_bench_{os.getpid()}_{time.time_ns()}?mode=memory&cache=shared"
+    keeper = sqlite3.connect(uri, uri=True)  # Mantém o banco vivo entre as conexões
+
+    def get_bench_connection():
+        conn = sqlite3.connect(uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    original = manager.get_db_connection
+    manager.get_db_connection = get_bench_connection
+    processor.reset_state()
+    try:
+        manager.setup_database()
+        yield
+    finally:
+        manager.get_db_connection = original
+        processor.reset_state()
+        keeper.close()
+
+def bench_processor(orders, budget_s):
+    """Roda processor_cycle completos contra um banco em memória, inserindo os pedidos em lotes."""
+    processed = 0
+    cycle_time = 0.0
+    with in_memory_database(), contextlib.redirect_stdout(io.StringIO()):
+        for start in range(0, len(orders), PROCESSOR_CHUNK):
+            chunk = orders[start:start + PROCESSOR_CHUNK]
+            manager.save_new_orders([{'id': o['id'], **o['coords']} for o in chunk])
+            t0 = time.perf_counter()
+            processor.processor_cycle()
+            cycle_time += time.perf_counter() - t0
+            processed += len(chunk)
+            if cycle_time > budget_s:
+                break
+    return {
+        'processor_orders': processed,
+        'processor_truncated': processed < len(orders),
+        'processor_orders_per_s': round(processed / cycle_time, 2) if cycle_time else 0.0,
+    }
+
+def run_suite(sizes, seed=DEFAULT_SEED, budget_s=DEFAULT_BUDGET_S, radius_km=5.0, distribution='uniform'):
+    """Roda todas as etapas para cada tamanho. Retorna {str(tamanho): métricas}."""
+    results = {}
+    for size in sizes:
+        orders = generate_orders(RESTAURANT_COORDS, size, radius_km, distribution, seed=seed)
+        metrics = {'orders': size}
+        metrics.update(bench_assignment(orders, budget_s))
+        metrics['peak_alloc_kb'] = bench_allocations(orders)
+        metrics.update(bench_processor(orders, budget_s))
+        results[str(size)] = metrics
+    return results
+
+def compare_with_baseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Retorna a lista de regressões (mensagens) em relação ao baseline."""
+    regressions = []
+    for size, metrics in results.items():
+        base = baseline.get(size)
+        if not base:
+            continue
+        for name, higher_is_better in TRACKED_METRICS.items():
+            # A qualidade só é comparável quando os dois rodaram sobre todos os pedidos
+            if name == 'km_per_order' and (metrics.get('truncated') or base.get('truncated')):
+                continue
+            current, reference = metrics.get(name), base.get(name)
+            if not current or not reference:
+                continue
+            if higher_is_better and current < reference * (1 - threshold):
+                regressions.append(f"[{size}] {name}: {current} < {reference} (-{(1 - current / reference):.0%})")
+            elif not higher_is_better and current > reference * (1 + threshold):
+                regressions.append(f"[{size}] {name}: {current} > {reference} (+{(current / reference - 1):.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do otimizador de rotas com pedidos sintéticos.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_S, help="Tempo máximo (s) por etapa.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--update-baseline', action='store_true', help="Grava os resultados como novo baseline.")
+    args = parser.parse_args()
+
+    print(f"--- BENCHMARK DO OTIMIZADOR (seed={args.seed}, tamanhos={args.sizes}) ---")
+    results = run_suite(args.sizes, seed=args.seed, budget_s=args.budget)
+    for size, metrics in results.items():
+        print(f"\n-> {size} pedidos")
+        for name, value in metrics.items():
+            print(f"   {name}: {value}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline atualizado em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNenhum baseline encontrado. Rode com --update-baseline para criar um.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regressão(ões) acima de {args.threshold:.0%}:")
+        for message in regressions:
+            print(f"   {message}")
+        return 1
+    print(f"\n✅ Nenhuma regressão acima de {args.threshold:.0%} em relação ao baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import argparse
+import math
+import os
+import sys
+import time
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routing.demand import DEMAND_GRID_NAME, HOLD_WINDOW_S, DemandGrid, load_demand_grid, update_demand_grid
+from app.routing.processor import RESTAURANT_COORDS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Atualiza (ou reconstrói) a grade de demanda usada na espera curta das rotas de uma parada.")
+    parser.add_argument('--rebuild', action='store_true', help="Ignora a grade salva e relê todo o histórico.")
+    parser.add_argument('--at', nargs=2, type=float, metavar=('LAT', 'LON'),
+                        help="Mostra a taxa de chegadas em volta do ponto, agora.")
+    args = parser.parse_args()
+
+    from app.database.manager import setup_database, save_demand_grid
+    setup_database()
+    grid = None if args.rebuild else load_demand_grid(RESTAURANT_COORDS)
+    grid = grid or DemandGrid(RESTAURANT_COORDS)
+    added = update_demand_grid(grid)
+    save_demand_grid(DEMAND_GRID_NAME, grid.to_bytes())
+    print(f"{added} pedido(s) novo(s); {grid.observed_days:.1f} dia(s) de histórico na grade '{DEMAND_GRID_NAME}'")
+
+    if args.at:
+        now = time.time()
+        rate = grid.rate({'lat': args.at[0], 'lon': args.at[1]}, now)
+        print(f"   {rate * 3600:.2f} pedido(s)/hora em volta do ponto nesta faixa do dia")
+        if HOLD_WINDOW_S > 0:
+            print(f"   ao menos um vizinho em {HOLD_WINDOW_S:.0f} s: {1 - math.exp(-rate * HOLD_WINDOW_S):.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import sys
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.history import HISTORY_DIR, export_history, compute_kpis
+from app.routing.processor import RESTAURANT_COORDS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta as rotas fechadas para o histórico colunar e/ou calcula os KPIs a partir dele.")
+    parser.add_argument('--dir', default=HISTORY_DIR, help="Diretório do histórico (MOTOROTAS_HISTORY_DIR).")
+    parser.add_argument('--no-export', action='store_true', help="Só calcula os KPIs, sem ler o banco.")
+    parser.add_argument('--kpis', action='store_true', help="Mostra km por pedido, paradas por rota etc.")
+    parser.add_argument('--from', dest='start_day', help="Primeiro dia (AAAA-MM-DD) dos KPIs.")
+    parser.add_argument('--to', dest='end_day', help="Último dia (AAAA-MM-DD) dos KPIs.")
+    parser.add_argument('--json', action='store_true', help="Imprime os KPIs em JSON.")
+    args = parser.parse_args()
+
+    if not args.no_export:
+        from app.database.manager import setup_database
+        setup_database()
+        exported = export_history(RESTAURANT_COORDS, args.dir)
+        print(f"{exported} rota(s) exportada(s) para {args.dir}")
+    if not args.kpis:
+        return 0
+
+    kpis = compute_kpis(args.dir, args.start_day, args.end_day)
+    if args.json:
+        print(json.dumps(kpis, indent=2))
+        return 0
+    by_day = kpis.pop('by_day')
+    print("--- KPIs DO HISTÓRICO ---")
+    for name, value in kpis.items():
+        print(f"   {name}: {value}")
+    for day, day_kpis in by_day.items():
+        print(f"   {day}: {day_kpis['routes']} rotas, {day_kpis['km_per_order']} km/pedido, "
+              f"{day_kpis['stops_per_route']} paradas/rota")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.synthetic_orders import generate_random_coords_batch, DISTRIBUTIONS
+
+RESTAURANT_COORDS = {"lat": -3.783871639912979, "lon": -38.50082092785248}
+
+# O iFood devolve no máximo 100 eventos por polling
+MAX_EVENTS_PER_POLL = 100
+
+
+class SimulatorState:
+    """
+    Estado do simulador: gera pedidos a uma taxa fixa e guarda os eventos ainda não
+    confirmados (que são reentregues a cada polling, como no iFood).
+    O pedido i (a partir de 0) chega em started_at + i/rate; ele só é materializado no
+    primeiro polling depois disso, mas guarda o horário de chegada programado.
+    """
+
+    def __init__(self, rate=2.0, radius_km=5.0, distribution='uniform', latency_ms=0.0,
+                 error_rate=0.0, seed=None, max_orders=None, base_coords=RESTAURANT_COORDS, clock=time.time):
+        self.rate = rate
+        self.radius_km = radius_km
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.max_orders = max_orders
+        self.base_coords = base_coords
+        self._clock = clock
+        self._np_rng = np.random.default_rng(seed)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.orders = {}            # order_id -> {'lat', 'lon', 'emitted_at'}
+        self.pending_events = {}    # event_id -> evento (ainda não confirmado)
+        self.stats = {'polls': 0, 'details': 0, 'acks': 0, 'auth': 0, 'injected_errors': 0}
+
+    def start(self):
+        self.started_at = self._clock()
+
+    def _emit_due_orders(self):
+        """Cria os pedidos que já deveriam ter chegado, de acordo com a taxa configurada."""
+        if self.started_at is None:
+            return
+        # Pedidos 0..due-1 já chegaram (o pedido i chega em started_at + i/rate)
+        due = int((self._clock() - self.started_at) * self.rate) + 1
+        if self.max_orders is not None:
+            due = min(due, self.max_orders)
+        first = len(self.orders)
+        missing = due - first
+        if missing <= 0:
+            return
+        lats, lons = generate_random_coords_batch(self.base_coords, missing, self.radius_km,
+                                                  self.distribution, rng=self._np_rng)
+        for index, (lat, lon) in enumerate(zip(lats, lons), start=first):
+            emitted_at = self.started_at + index / self.rate
+            order_id = str(uuid.uuid4())
+            self.orders[order_id] = {'lat': float(lat), 'lon': float(lon), 'emitted_at': emitted_at}
+            event_id = str(uuid.uuid4())
+            self.pending_events[event_id] = {
+                'id': event_id, 'code': 'PLC', 'fullCode': 'PLACED', 'orderId': order_id,
+                'createdAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(emitted_at)),
+            }
+
+    def poll(self):
+        with self._lock:
+            self.stats['polls'] += 1
+            self._emit_due_orders()
+            return list(self.pending_events.values())[:MAX_EVENTS_PER_POLL]
+
+    def order_details(self, order_id):
+        with self._lock:
+            self.stats['details'] += 1
+            return self.orders.get(order_id)
+
+    def acknowledge(self, event_ids):
+        with self._lock:
+            self.stats['acks'] += len(event_ids)
+            for event_id in event_ids:
+                self.pending_events.pop(event_id, None)
+
+    def inject_faults(self):
+        """Aplica a latência configurada e decide se esta requisição deve falhar."""
+        if self.latency_ms:
+            # Latência com variação exponencial em torno da média
+            time.sleep(self._rng.expovariate(1.0 / self.latency_ms) / 1000.0)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            with self._lock:
+                self.stats['injected_errors'] += 1
+            return True
+        return False
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """Implementa os endpoints do iFood usados por app/collector.py."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        state = self.server.state
+        if state.inject_faults():
+            return self._send_json(500, {'message': 'erro simulado'})
+
+        if self.path.endswith('/order/v1.0/events:polling'):
+            events = state.poll()
+            return self._send_json(200, events) if events else self._send_json(204)
+
+        if '/order/v1.0/orders/' in self.path:
+            order_id = self.path.rsplit('/', 1)[-1]
+            order = state.order_details(order_id)
+            if not order:
+                return self._send_json(404, {'message': 'pedido não encontrado'})
+            return self._send_json(200, {
+                'id': order_id,
+                'orderType': 'DELIVERY',
+                'delivery': {'deliveryAddress': {'coordinates': {'latitude': order['lat'], 'longitude': order['lon']}}},
+            })
+
+        self._send_json(404, {'message': 'rota desconhecida'})
+
+    def do_POST(self):
+        state = self.server.state
+        body = self._read_body()
+
+        if self.path.endswith('/authentication/v1.0/oauth/token'):
+            state.stats['auth'] += 1
+            return self._send_json(200, {'accessToken': str(uuid.uuid4()), 'type': 'bearer', 'expiresIn': 21600})
+
+        if state.inject_faults():
+            return self._send_json(500, {'message': 'erro simulado'})
+
+        if self.path.endswith('/order/v1.0/events/acknowledgment'):
+            state.acknowledge([item['id'] for item in json.loads(body or b'[]')])
+            return self._send_json(202)
+
+        self._send_json(404, {'message': 'rota desconhecida'})
+
+
+def start_simulator(state, host='127.0.0.1', port=0):
+    """Sobe o simulador em uma thread de fundo. Retorna (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), SimulatorHandler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name="ifood-simulator", daemon=True).start()
+    state.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Simulador local da API de pedidos do iFood.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=2.0, help="Pedidos por segundo.")
+    parser.add_argument('--radius', type=float, default=5.0, help="Raio (km) em volta do restaurante.")
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latência média injetada por requisição.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fração de requisições que devolvem 500.")
+    parser.add_argument('--max-orders', type=int, default=None, help="Para de gerar pedidos após esse total.")
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+def state_from_args(args):
+    return SimulatorState(rate=args.rate, radius_km=args.radius, distribution=args.distribution,
+                          latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed,
+                          max_orders=args.max_orders)
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    server, base_url = start_simulator(state_from_args(args), args.host, args.port)
+    print(f"--- SIMULADOR DO IFOOD RODANDO EM {base_url} ---")
+    print(f"Use IFOOD_BASE_API_URL={base_url} para apontar o coletor para ele.")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   -> {len(server.state.orders)} pedido(s) gerado(s), estatísticas: {server.state.stats}")
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# O teste de carga sempre usa um SQLite descartável, nunca o banco de produção
+os.environ.pop("DATABASE_URL", None)
+
+import app.database.manager as manager
+from scripts.ifood_simulator import build_arg_parser, state_from_args, start_simulator
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+def run_load_test(args):
+    """
+    Sobe o simulador, aponta o coletor para ele e roda o pipeline completo
+    (coletor -> BD -> processador -> API) contra um banco temporário.
+    Retorna um dicionário com throughput e latências pedido->rota.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="motorotas_load_")
+    manager.DB_PATH = os.path.join(scratch_dir, 'load_test.db')
+
+    import app.collector as collector
+    from app import create_app
+    from app.routing.processor import start_processor_loop
+
+    sim_state = state_from_args(args)
+    # O total é fixado antes de começar: rate * duration (ou menos, com --max-orders)
+    total = int(args.rate * args.duration)
+    sim_state.max_orders = total if args.max_orders is None else min(args.max_orders, total)
+    server, base_url = start_simulator(sim_state)
+    collector.BASE_API_URL = base_url
+    collector.reset_http_clients()
+
+    flask_app = create_app()
+    client = flask_app.test_client()
+
+    threading.Thread(target=collector.start_collector_loop, daemon=True).start()
+    threading.Thread(target=start_processor_loop, kwargs={'interval': args.processor_interval}, daemon=True).start()
+
+    # Observa a API e anota quando cada pedido aparece em uma rota
+    routed_at = {}
+    started = time.time()
+    deadline = started + args.duration
+    drain_deadline = deadline + args.drain
+    while True:
+        now = time.time()
+        response = client.get('/api/routes')
+        seen_at = time.time()
+        for route in response.get_json() or []:
+            for order in route['orders']:
+                routed_at.setdefault(order['id'], seen_at)
+
+        if now >= deadline and (len(routed_at) >= sim_state.max_orders or now >= drain_deadline):
+            break
+        time.sleep(args.observe_interval)
+
+    elapsed = time.time() - started
+    latencies = [
+        routed_at[order_id] - order['emitted_at']
+        for order_id, order in sim_state.orders.items() if order_id in routed_at
+    ]
+    server.shutdown()
+
+    return {
+        'emitted': len(sim_state.orders),
+        'routed': len(routed_at),
+        'elapsed_s': elapsed,
+        'orders_per_s': len(routed_at) / elapsed if elapsed else 0.0,
+        'latency_p50_s': _percentile(latencies, 50),
+        'latency_p99_s': _percentile(latencies, 99),
+        'simulator': dict(sim_state.stats),
+        'db_path': manager.DB_PATH,
+    }
+
+def main():
+    parser = build_arg_parser()
+    parser.description = "Teste de carga ponta a ponta usando o simulador local do iFood."
+    parser.add_argument('--duration', type=float, default=30.0, help="Tempo (s) gerando pedidos.")
+    parser.add_argument('--drain', type=float, default=30.0, help="Tempo máximo (s) esperando o backlog ser roteado.")
+    parser.add_argument('--processor-interval', type=float, default=3.0)
+    parser.add_argument('--observe-interval', type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"--- TESTE DE CARGA: {args.rate} pedido(s)/s por {args.duration}s ({args.distribution}) ---")
+    result = run_load_test(args)
+
+    print("\n--- Resultado ---")
+    print(f"Pedidos gerados:      {result['emitted']}")
+    print(f"Pedidos roteados:     {result['routed']}")
+    print(f"Throughput:           {result['orders_per_s']:.2f} pedidos/s")
+    print(f"Latência p50:         {result['latency_p50_s']:.2f}s (pedido gerado -> visível em /api/routes)")
+    print(f"Latência p99:         {result['latency_p99_s']:.2f}s")
+    print(f"Simulador:            {result['simulator']}")
+    print(f"Banco temporário:     {result['db_path']}")
+
+if __name__ == "__main__":
+    main()
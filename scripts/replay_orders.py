@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Adiciona o diretório raiz do projeto ao sys.path para resolver os imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.database.manager as manager
+from app.recorder import load_recording
+from app.routing import optimizer
+from app.routing import processor
+from app.routing.sealing import RouteSealer
+from scripts.benchmark_optimizer import in_memory_database
+
+RESTAURANT_COORDS = processor.RESTAURANT_COORDS
+# Intervalo do processador em produção (segundos no tempo da gravação)
+DEFAULT_INTERVAL_S = 3.0
+MIN_SPEED, MAX_SPEED = 1.0, 100.0
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+def replay(orders, speed=10.0, interval=DEFAULT_INTERVAL_S, sleep=time.sleep, sealer_limits=None):
+    """
+    Reproduz uma gravação contra um banco em memória.
+
+    O tempo da gravação é comprimido por `speed`: a cada `interval` segundos gravados
+    (interval / speed segundos reais) entram no banco os pedidos que chegaram nesse
+    intervalo e roda um processor_cycle, que também enxerga o relógio da gravação (prazos
+    de entrega, espera curta e idade das rotas). Retorna throughput, latência dos ciclos e a
+    qualidade das rotas geradas. `sealer_limits` sobrescreve os limites de fechamento das rotas
+    (max_stops, max_km, max_age).
+    """
+    if not MIN_SPEED <= speed <= MAX_SPEED:
+        raise ValueError(f"speed deve estar entre {MIN_SPEED:g} e {MAX_SPEED:g}")
+
+    cycle_latencies = []
+    # O fechamento de rotas por idade segue o relógio da gravação, não o relógio real
+    virtual_clock = [orders[0]['t'] if orders else 0.0]
+    with in_memory_database():
+        processor.reset_state(RouteSealer(clock=lambda: virtual_clock[0], **(sealer_limits or {})))
+        started = time.perf_counter()
+        if orders:
+            next_index = 0
+            while next_index < len(orders):
+                cycle_started = time.perf_counter()
+                virtual_clock[0] += interval
+                virtual_now = virtual_clock[0]
+                batch_end = next_index
+                while batch_end < len(orders) and orders[batch_end]['t'] <= virtual_now:
+                    batch_end += 1
+                if batch_end > next_index:
+                    # Pedido como o coletor gravou (prazos e loja inclusos), chegando no instante gravado
+                    manager.save_new_orders([dict(o, created_at=o['t']) for o in orders[next_index:batch_end]])
+                    next_index = batch_end
+
+                t0 = time.perf_counter()
+                processor.processor_cycle()
+                cycle_latencies.append(time.perf_counter() - t0)
+
+                # Mantém o ritmo da gravação comprimida; ciclos lentos simplesmente atrasam o relógio
+                remaining = interval / speed - (time.perf_counter() - cycle_started)
+                if remaining > 0 and next_index < len(orders):
+                    sleep(remaining)
+        elapsed = time.perf_counter() - started
+        routes = manager.get_all_created_routes()
+
+    total_km = sum(optimizer.get_route_total_distance(r['orders'], RESTAURANT_COORDS) for r in routes)
+    routed = sum(len(r['orders']) for r in routes)
+    return {
+        'orders': len(orders),
+        'recorded_span_s': round(orders[-1]['t'] - orders[0]['t'], 3) if orders else 0.0,
+        'speed': speed,
+        'cycles': len(cycle_latencies),
+        'elapsed_s': round(elapsed, 3),
+        'orders_per_s': round(len(orders) / elapsed, 2) if elapsed else 0.0,
+        'cycle_p50_s': round(_percentile(cycle_latencies, 50), 6),
+        'cycle_p99_s': round(_percentile(cycle_latencies, 99), 6),
+        'cycle_max_s': round(max(cycle_latencies), 6) if cycle_latencies else 0.0,
+        'routes': len(routes),
+        'routed_orders': routed,
+        'km_per_order': round(total_km / routed, 4) if routed else 0.0,
+        'stops_per_route': round(routed / len(routes), 3) if routes else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz uma gravação do fluxo de pedidos contra um banco de rascunho.")
+    parser.add_argument('recording', help="Arquivo gravado com MOTOROTAS_RECORD_PATH.")
+    parser.add_argument('--speed', type=float, default=10.0, help=f"Compressão do tempo ({MIN_SPEED:g}x a {MAX_SPEED:g}x).")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL_S,
+                        help="Intervalo entre ciclos do processador, no tempo da gravação.")
+    parser.add_argument('--corridor-km', type=float, help="Sobrescreve CORRIDOR_WIDTH_KM do otimizador.")
+    parser.add_argument('--max-detour-km', type=float, help="Sobrescreve MAX_DETOUR_KM do otimizador.")
+    parser.add_argument('--max-stops', type=int, help="Sobrescreve MOTOROTAS_MAX_STOPS.")
+    parser.add_argument('--max-route-km', type=float, help="Sobrescreve MOTOROTAS_MAX_ROUTE_KM.")
+    parser.add_argument('--max-route-age', type=float, help="Sobrescreve MOTOROTAS_MAX_ROUTE_AGE (segundos).")
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON.")
+    args = parser.parse_args()
+
+    if args.corridor_km is not None:
+        optimizer.CORRIDOR_WIDTH_KM = args.corridor_km
+    if args.max_detour_km is not None:
+        optimizer.MAX_DETOUR_KM = args.max_detour_km
+
+    orders = load_recording(args.recording)
+    sealer_limits = {name: value for name, value in (
+        ('max_stops', args.max_stops), ('max_km', args.max_route_km), ('max_age', args.max_route_age)
+    ) if value is not None}
+    results = replay(orders, speed=args.speed, interval=args.interval, sealer_limits=sealer_limits)
+    results['corridor_km'] = optimizer.CORRIDOR_WIDTH_KM
+    results['max_detour_km'] = optimizer.MAX_DETOUR_KM
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"--- REPLAY DE {args.recording} ({args.speed:g}x) ---")
+    for name, value in results.items():
+        print(f"   {name}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Roda em um processo novo (imports frios), como um worker do gunicorn recém-criado
+_CHILD_CODE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+done = time.perf_counter()
+timings = {'import_app': imported - started, 'create_app': done - imported, 'cold_start_total': done - started}
+timings.update({'create_app.' + k: v for k, v in flask_app.extensions['motorotas_startup_seconds'].items()})
+print(json.dumps({'timings': timings, 'heavy_modules': sorted(m for m in ('numpy', 'psycopg2') if m in sys.modules)}))
+"""
+
+
+def _parse_importtime(stderr, top):
+    """Soma o tempo próprio (self) de cada módulo da saída de -X importtime por pacote de primeiro nível, em ms."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def profile_startup(top=10):
+    """Mede o cold start de create_app() em um processo novo. Retorna etapas e imports mais caros."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD_CODE],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['top_imports_ms'] = _parse_importtime(result.stderr, top)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Quebra do tempo de inicialização da aplicação (cold start).")
+    parser.add_argument('--runs', type=int, default=3, help="Processos medidos (o primeiro pode aplicar o esquema).")
+    parser.add_argument('--top', type=int, default=10, help="Quantos pacotes mostrar no ranking de imports.")
+    args = parser.parse_args()
+
+    print("--- INICIALIZAÇÃO DA APLICAÇÃO ---")
+    for run in range(1, args.runs + 1):
+        report = profile_startup(args.top)
+        print(f"\n-> Execução {run}")
+        for name, seconds in report['timings'].items():
+            print(f"   {name}: {seconds * 1000:.1f} ms")
+        print(f"   módulos pesados carregados: {', '.join(report['heavy_modules']) or 'nenhum'}")
+    print("\nPacotes com mais tempo de import (última execução):")
+    for package, ms in report['top_imports_ms']:
+        print(f"   {package}: {ms:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+
+# 1 grau de latitude é ~111km. 1km é ~0.009 graus (mesma aproximação de create_test_order.py).
+KM_IN_DEGREES = 0.009
+EARTH_RADIUS_KM = 6371
+
+DISTRIBUTIONS = ('uniform', 'hotspots')
+
+
+def haversine_km(base_coords, lats, lons):
+    """Versão vetorizada de calculate_distance: distância (km) de base_coords até cada ponto."""
+    lat1, lon1 = math.radians(base_coords['lat']), math.radians(base_coords['lon'])
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def generate_random_coords_batch(base_coords, count, radius_km=5.0, distribution='uniform', rng=None,
+                                 hotspots=3, hotspot_std_km=0.6):
+    """
+    Versão vetorizada de generate_random_coords: gera `count` coordenadas dentro do raio,
+    usando rejection sampling em lotes (numpy) em vez de um ponto por vez.
+
+    distribution:
+      - 'uniform':  pontos espalhados uniformemente no quadrado e filtrados pelo círculo;
+      - 'hotspots': pontos concentrados em alguns bairros (gaussianas) dentro do raio.
+
+    Retorna dois arrays (lats, lons) arredondados a 6 casas, como o gerador original.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Distribuição desconhecida: {distribution}. Use uma de {DISTRIBUTIONS}.")
+    rng = rng if rng is not None else np.random.default_rng()
+    radius_in_degrees = radius_km * KM_IN_DEGREES
+
+    if distribution == 'hotspots':
+        centers_lat, centers_lon = generate_random_coords_batch(base_coords, hotspots, radius_km * 0.8, rng=rng)
+
+    lats, lons = [], []
+    remaining = count
+    while remaining > 0:
+        batch = max(16, int(remaining * 1.4))  # O círculo ocupa ~78% do quadrado
+        if distribution == 'uniform':
+            cand_lat = base_coords['lat'] + rng.uniform(-radius_in_degrees, radius_in_degrees, batch)
+            cand_lon = base_coords['lon'] + rng.uniform(-radius_in_degrees, radius_in_degrees, batch)
+        else:
+            which = rng.integers(0, hotspots, batch)
+            spread = hotspot_std_km * KM_IN_DEGREES
+            cand_lat = centers_lat[which] + rng.normal(0, spread, batch)
+            cand_lon = centers_lon[which] + rng.normal(0, spread, batch)
+
+        inside = haversine_km(base_coords, cand_lat, cand_lon) <= radius_km
+        cand_lat, cand_lon = cand_lat[inside][:remaining], cand_lon[inside][:remaining]
+        lats.append(cand_lat)
+        lons.append(cand_lon)
+        remaining -= len(cand_lat)
+
+    return np.round(np.concatenate(lats), 6), np.round(np.concatenate(lons), 6)
+
+def generate_orders(base_coords, count, radius_km=5.0, distribution='uniform', seed=None, prefix='pedido'):
+    """Gera uma lista de pedidos no formato usado pelo otimizador ({'id', 'coords'}), reprodutível pela seed."""
+    rng = np.random.default_rng(seed)
+    lats, lons = generate_random_coords_batch(base_coords, count, radius_km, distribution, rng=rng)
+    return [
+        {'id': f'{prefix}_{i:06d}', 'coords': {'lat': float(lat), 'lon': float(lon)}}
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    ]
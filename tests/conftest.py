@@ -0,0 +1,11 @@
+import pytest
+
+from app.routing import processor
+
+
+@pytest.fixture(autouse=True)
+def reset_processor_state():
+    """O processador guarda rotas abertas e prazos entre ciclos; cada teste usa um banco novo."""
+    processor.reset_state()
+    yield
+    processor.reset_state()
@@ -1,6 +1,8 @@
 import pytest
 import os
 import sqlite3
+import subprocess
+import sys
 import app.database.manager 
 from app import create_app
 
@@ -62,4 +64,116 @@ def test_get_routes_with_data(client):
     assert response.status_code == 200
     assert len(response.json) == 1
     # Agora a lista não estará vazia
-    assert response.json[0]['orders'][0]['id'] == 'pedido_teste_api'
\ No newline at end of file
+    assert response.json[0]['orders'][0]['id'] == 'pedido_teste_api'
+
+def test_get_routes_geojson(client):
+    """Verifica se o endpoint GeoJSON devolve a LineString da rota e os Points das paradas."""
+    from app.database.manager import create_new_route, save_new_order, update_route
+
+    restaurant = {'lat': -3.78, 'lon': -38.50}
+    order_a = {'id': 'geo_a', 'coords': {'lat': -3.80, 'lon': -38.51}}
+    order_b = {'id': 'geo_b', 'coords': {'lat': -3.82, 'lon': -38.52}}
+    for o in (order_a, order_b):
+        save_new_order({'id': o['id'], 'lat': o['coords']['lat'], 'lon': o['coords']['lon']})
+
+    route_id = create_new_route(order_a, restaurant)
+    update_route({'id': route_id, 'orders': [order_a, order_b]}, restaurant)
+
+    response = client.get('/api/routes.geojson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/geo+json'
+
+    data = response.get_json(force=True)
+    assert data['type'] == 'FeatureCollection'
+    lines = [f for f in data['features'] if f['geometry']['type'] == 'LineString']
+    points = [f for f in data['features'] if f['geometry']['type'] == 'Point']
+    assert len(lines) == 1
+    assert lines[0]['geometry']['coordinates'][0] == [-38.50, -3.78]  # parte do restaurante
+    assert [p['properties']['order_id'] for p in points] == ['geo_a', 'geo_b']
+
+def test_get_routes_geojson_bbox_filter(client):
+    """Verifica se o filtro bbox usa os limites gravados para descartar rotas fora da tela."""
+    from app.database.manager import create_new_route, save_new_order
+
+    near = {'id': 'perto_bbox', 'lat': -3.79, 'lon': -38.50}
+    far = {'id': 'longe_bbox', 'lat': -3.30, 'lon': -38.00}
+    for o in (near, far):
+        save_new_order(o)
+        create_new_route(o, None)
+
+    response = client.get('/api/routes.geojson?bbox=-38.6,-3.9,-38.4,-3.7')
+    assert response.status_code == 200
+    order_ids = {f['properties'].get('order_id') for f in response.get_json(force=True)['features']}
+    assert order_ids == {'perto_bbox'}
+
+    response = client.get('/api/routes.geojson?bbox=abc')
+    assert response.status_code == 400
+    for bbox in ('nan,-3.9,-38.4,-3.7', '-38.6,-inf,-38.4,-3.7', '-38.6,-3.9,inf,-3.7'):
+        assert client.get(f'/api/routes.geojson?bbox={bbox}').status_code == 400
+
+def test_setup_database_fills_routes_without_geometry(client, tmp_path, monkeypatch):
+    """Rotas gravadas antes da geometria pré-calculada (geojson NULL) ganham a geometria na migração."""
+    from app.database.manager import create_new_route, save_new_order, _insert_route
+
+    order = {'id': 'antigo', 'lat': -3.79, 'lon': -38.50}
+    save_new_order(order)
+    route_id = create_new_route(order, None)
+    conn = sqlite3.connect(str(tmp_path / "test_db_api" / "api_test.db"))
+    empty_id = _insert_route(conn.cursor(), False)  # Rota sem pedidos
+    conn.execute("UPDATE routes SET geojson = NULL, min_lat = NULL, min_lon = NULL, max_lat = NULL, max_lon = NULL")
+    conn.commit()
+
+    monkeypatch.setattr(app.database.manager, 'SCHEMA_VERSION', app.database.manager.SCHEMA_VERSION + 1)
+    assert app.database.manager.setup_database() is True
+    assert dict(conn.execute("SELECT id, geojson FROM routes WHERE id = ?", (empty_id,)).fetchall()) == {empty_id: '[]'}
+    conn.close()
+
+    response = client.get('/api/routes.geojson?bbox=-38.6,-3.9,-38.4,-3.7')
+    features = response.get_json(force=True)['features']
+    assert [(f['properties']['route_id'], f['properties']['order_id']) for f in features] == [(route_id, 'antigo')]
+
+def test_collector_metrics_are_not_served_by_the_web_process(client):
+    """O coletor roda no worker: o serviço web não inventa um estado do coletor."""
+    assert client.get('/api/collector/metrics').status_code == 404
+
+def test_web_process_does_not_load_the_collector(tmp_path):
+    """O gunicorn não importa o coletor: o /metrics dele não mostra um coletor parado de mentira."""
+    code = (
+        "import sys\n"
+        "import app.database.manager as manager\n"
+        f"manager.DB_PATH = {str(tmp_path / 'web.db')!r}\n"
+        "from app import create_app\n"
+        "body = create_app().test_client().get('/metrics').get_data(as_text=True)\n"
+        "assert 'app.collector' not in sys.modules\n"
+        "assert 'motorotas_collector_poll_interval_seconds' not in body\n"
+        "assert 'motorotas_collector_breaker_open' not in body\n"
+    )
+    env = {k: v for k, v in os.environ.items() if k != 'DATABASE_URL'}
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', code], cwd=project_root, env=env, check=True, timeout=60)
+
+def test_metrics_endpoint(client):
+    """Verifica se /metrics expõe as métricas no formato do Prometheus."""
+    client.get('/api/routes')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+
+    body = response.get_data(as_text=True)
+    assert '# TYPE motorotas_processor_cycle_seconds histogram' in body
+    assert 'motorotas_db_query_seconds_count{function="get_all_created_routes"}' in body
+    assert 'motorotas_api_request_seconds_count{endpoint="/api/routes",method="GET",status="200"}' in body
+
+def test_admin_profiling_toggle(client, monkeypatch):
+    """Verifica se o profiler pode ser ligado pelo endpoint e se o token de admin é exigido."""
+    from app.routing.profiling import PROFILER
+    monkeypatch.setattr(PROFILER, 'enabled', False)
+    monkeypatch.delenv('MOTOROTAS_ADMIN_TOKEN', raising=False)
+    assert client.get('/api/admin/profiling').status_code == 403  # Sem token configurado, fica fechado
+    monkeypatch.setenv('MOTOROTAS_ADMIN_TOKEN', 'segredo')
+
+    assert client.post('/api/admin/profiling', json={'enabled': True}).status_code == 403
+
+    response = client.post('/api/admin/profiling', json={'enabled': True}, headers={'X-Admin-Token': 'segredo'})
+    assert response.status_code == 200
+    assert response.json['enabled'] is True
@@ -0,0 +1,28 @@
+from scripts.benchmark_optimizer import run_suite, compare_with_baseline, RESTAURANT_COORDS
+from scripts.synthetic_orders import generate_orders, haversine_km
+
+
+def test_synthetic_orders_are_reproducible_and_inside_radius():
+    """A mesma seed gera a mesma nuvem de pedidos, sempre dentro do raio."""
+    first = generate_orders(RESTAURANT_COORDS, 500, radius_km=3.0, seed=7)
+    second = generate_orders(RESTAURANT_COORDS, 500, radius_km=3.0, seed=7)
+    assert first == second
+
+    lats = [o['coords']['lat'] for o in first]
+    lons = [o['coords']['lon'] for o in first]
+    assert haversine_km(RESTAURANT_COORDS, lats, lons).max() <= 3.0
+
+
+def test_small_suite_runs_and_detects_regressions():
+    """A suíte roda em um tamanho pequeno e acusa regressões acima do limiar."""
+    results = run_suite([50], budget_s=5)
+    metrics = results['50']
+    assert metrics['routed'] == 50 and not metrics['truncated']
+    assert metrics['processor_orders'] == 50
+    assert metrics['total_km'] > 0
+
+    assert compare_with_baseline(results, results) == []
+
+    slower = {'50': dict(metrics, find_best_ops_per_s=metrics['find_best_ops_per_s'] * 2)}
+    regressions = compare_with_baseline(results, slower, threshold=0.25)
+    assert len(regressions) == 1 and 'find_best_ops_per_s' in regressions[0]
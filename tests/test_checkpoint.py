@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+import pytest
+
+import app.database.manager
+from app.database.manager import setup_database, save_new_orders, create_new_route, seal_routes, update_route
+from app.routing import checkpoint
+from app.routing import processor
+from app.routing.checkpoint import write_snapshot, load_snapshot
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "checkpoint.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+
+
+def _order(order_id, i, created_at=None, merchant_id=None):
+    base = processor.RESTAURANT_COORDS
+    return {'id': order_id, 'coords': {'lat': base['lat'] + 0.01 * i, 'lon': base['lon']}, 'created_at': created_at,
+            'merchant_id': merchant_id, 'ready_at': None, 'promised_at': created_at and created_at + 2700}
+
+
+def test_snapshot_round_trip_replaces_the_previous_generation(tmp_path):
+    """Rotas, pedidos e distâncias voltam iguais; a geração anterior dos arrays é apagada."""
+    routes = [
+        {'id': 7, 'google_maps_link': 'link-7', 'bearing': 90.0, 'orders': [_order('A', 1, 100.0), _order('B', 2, 110.0)]},
+        {'id': 9, 'google_maps_link': 'link-9', 'bearing': 270.0, 'orders': [_order('C', -1, merchant_id='loja_sul')]},
+    ]
+    distances = [[-3.78, -38.5, -3.77, -38.5, 1.11]]
+    write_snapshot(str(tmp_path), routes[:1], 10.0, shard=(1, 2))
+    write_snapshot(str(tmp_path), routes, 42.5, shard=(1, 2), distances=distances)
+
+    snapshot = load_snapshot(str(tmp_path), shard=(1, 2))
+    assert snapshot['high_water_mark'] == 42.5
+    assert snapshot['routes'] == routes
+    assert snapshot['distances'] == distances
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.npy')]) == 2
+    assert load_snapshot(str(tmp_path), shard=(0, 2)) is None
+
+
+def test_warm_start_replays_only_changes_after_the_snapshot(db_test_file, tmp_path, monkeypatch):
+    """Depois do snapshot, uma rota foi fechada e outra criada: o reinício aplica só essas mudanças."""
+    snapshot_dir = str(tmp_path / "snapshots")
+    processor.reset_state(snapshot_dir=snapshot_dir)
+    save_new_orders([{'id': 'A', 'lat': processor.RESTAURANT_COORDS['lat'] + 0.01, 'lon': processor.RESTAURANT_COORDS['lon']}])
+    processor.processor_cycle()
+    assert processor.write_checkpoint() is not None
+    (first_route,) = processor.LIVE_ROUTES.routes
+
+    # Mudanças feitas por outro processo depois do snapshot
+    seal_routes([first_route])
+    save_new_orders([{'id': 'B', 'lat': processor.RESTAURANT_COORDS['lat'] - 0.01, 'lon': processor.RESTAURANT_COORDS['lon']}])
+    second_route = create_new_route(_order('B', -1), processor.RESTAURANT_COORDS)
+
+    # Reinício: nada de recarga completa, só snapshot + mudanças
+    def full_load_forbidden():
+        raise AssertionError("recarga completa no reinício")
+    monkeypatch.setattr(checkpoint, 'get_created_routes', full_load_forbidden)
+    processor.reset_state(snapshot_dir=snapshot_dir)
+
+    routes = processor.LIVE_ROUTES.refresh()
+    assert [(route['id'], [o['id'] for o in route['orders']]) for route in routes] == [(second_route, ['B'])]
+
+
+def test_changes_written_with_a_late_clock_are_not_missed(db_test_file, monkeypatch):
+    """A marca d'água segue a ordem dos commits, não o relógio de quem grava; rotas que saem deixam os prazos."""
+    base = processor.RESTAURANT_COORDS
+    save_new_orders([{'id': 'A', 'lat': base['lat'] + 0.01, 'lon': base['lon']},
+                     {'id': 'B', 'lat': base['lat'] + 0.02, 'lon': base['lon']}])
+    processor.processor_cycle()
+    (route_id,) = processor.LIVE_ROUTES.routes
+    assert route_id in processor.SEALER
+
+    # Outro processo, com o relógio 10 minutos atrasado, muda a rota
+    real_time = app.database.manager.time.time
+    monkeypatch.setattr(app.database.manager.time, 'time', lambda: real_time() - 600)
+    update_route({'id': route_id, 'orders': [_order('B', 2), _order('A', 1)], 'google_maps_link': 'outro'},
+                 base)
+    monkeypatch.setattr(app.database.manager.time, 'time', real_time)
+    processor._refresh_live_routes()
+    assert [o['id'] for o in processor.LIVE_ROUTES.routes[route_id]['orders']] == ['B', 'A']
+
+    seal_routes([route_id])
+    assert processor._refresh_live_routes() == []
+    assert route_id not in processor.SEALER
+
+
+def test_sealing_an_already_sealed_route_is_not_a_change(db_test_file):
+    """Só as rotas que o UPDATE de fato fechou ganham um change_seq novo."""
+    from app.database.manager import get_routes_changed_since, get_routes_high_water_mark
+
+    base = processor.RESTAURANT_COORDS
+    save_new_orders([{'id': 'A', 'lat': base['lat'], 'lon': base['lon']},
+                     {'id': 'B', 'lat': base['lat'] + 0.01, 'lon': base['lon']}])
+    first = create_new_route(_order('A', 0), processor.RESTAURANT_COORDS)
+    second = create_new_route(_order('B', 1), processor.RESTAURANT_COORDS)
+    seal_routes([first])
+    mark = get_routes_high_water_mark()
+
+    seal_routes([first, second])
+    assert [r['id'] for r in get_routes_changed_since(mark)] == [second]
+    mark = get_routes_high_water_mark()
+    seal_routes([first, second])
+    assert get_routes_high_water_mark() == mark
@@ -0,0 +1,306 @@
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app.collector as collector
+import app.database.manager
+from app.database.manager import setup_database, get_pending_orders
+
+DETAIL_DELAY_S = 0.2
+
+
+class StubIfoodHandler(BaseHTTPRequestHandler):
+    """Servidor falso que imita os endpoints do iFood usados pelo coletor."""
+    protocol_version = 'HTTP/1.1'  # Necessário para o keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _is_authorized(self):
+        token = self.headers.get('Authorization', '').replace('Bearer ', '')
+        return token not in self.server.state['revoked_tokens']
+
+    def do_GET(self):
+        state = self.server.state
+        state['connections'].add(self.client_address)
+        if not self._is_authorized():
+            self._send_json(401, {})
+        elif self.path.endswith('/events:polling'):
+            self._send_json(200, state['events'])
+        elif '/orders/' in self.path:
+            with state['lock']:
+                state['detail_requests'] += 1
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            time.sleep(DETAIL_DELAY_S)
+            with state['lock']:
+                state['in_flight'] -= 1
+            order_id = self.path.rsplit('/', 1)[-1]
+            self._send_json(200, {
+                'id': order_id,
+                'delivery': {'deliveryAddress': {'coordinates': {'latitude': -3.8, 'longitude': -38.5}}},
+            })
+        else:
+            self._send_json(404, {})
+
+    def do_POST(self):
+        state = self.server.state
+        state['connections'].add(self.client_address)
+        body = self._read_body()
+        if self.path.endswith('/oauth/token'):
+            with state['lock']:
+                state['token_requests'] += 1
+                token = f"token-{state['token_requests']}"
+                state['client_ids'].append(urllib.parse.parse_qs(body.decode())['clientId'][0])
+            self._send_json(200, {'accessToken': token, 'expiresIn': 21600})
+        elif self.path.endswith('/events/acknowledgment'):
+            state['acked'].extend(item['id'] for item in json.loads(body))
+            self._send_json(202)
+        else:
+            self._send_json(404, {})
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubIfoodHandler)
+    server.state = {
+        'events': [], 'acked': [], 'connections': set(),
+        'lock': threading.Lock(), 'in_flight': 0, 'max_in_flight': 0,
+        'token_requests': 0, 'revoked_tokens': set(), 'detail_requests': 0, 'client_ids': [],
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(collector, 'BASE_API_URL', f'http://127.0.0.1:{server.server_address[1]}')
+    monkeypatch.setattr(collector, 'CLIENT_ID', 'cliente-principal')
+    monkeypatch.delenv('IFOOD_MERCHANTS', raising=False)
+    collector.reset_http_clients()
+    collector.reset_seen_cache()
+    yield server
+    collector.reset_http_clients()
+    collector.reset_seen_cache()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'collector_test.db')
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    return db_file
+
+
+def test_fetch_order_details_batch_is_concurrent_and_pooled(stub_server, monkeypatch):
+    """Os detalhes devem ser buscados em paralelo, respeitando o limite por host e reaproveitando conexões."""
+    monkeypatch.setattr(collector, 'MAX_REQUESTS_PER_HOST', 4)
+    order_ids = [f'pedido_{i}' for i in range(8)]
+
+    start = time.perf_counter()
+    results = collector.fetch_order_details_batch('token', order_ids)
+    elapsed = time.perf_counter() - start
+
+    assert set(results) == set(order_ids)
+    # Sequencial levaria 8 * 0.2s = 1.6s; com 4 em paralelo, ~0.4s
+    assert elapsed < len(order_ids) * DETAIL_DELAY_S / 2
+    assert stub_server.state['max_in_flight'] <= 4
+    # Keep-alive: no máximo uma conexão por requisição simultânea
+    assert len(stub_server.state['connections']) <= 4
+
+
+def test_throttled_merchant_waits_without_holding_a_host_slot(stub_server, monkeypatch):
+    """A ficha do limite de taxa é pedida antes da vaga do host: a espera de uma loja não ocupa conexão."""
+    monkeypatch.setattr(collector, 'MAX_REQUESTS_PER_HOST', 1)
+    merchant = collector.get_merchants()[0]
+    details_url = f"{collector.BASE_API_URL}/order/v1.0/orders/pedido_1"
+    slots_free = []
+    acquire = merchant.rate_limiter.acquire
+
+    def watching_acquire():
+        semaphore = collector._host_semaphore(details_url)
+        slots_free.append(semaphore.acquire(blocking=False))
+        if slots_free[-1]:
+            semaphore.release()
+        return acquire()
+
+    monkeypatch.setattr(merchant.rate_limiter, 'acquire', watching_acquire)
+    assert collector.get_order_details('token', 'pedido_1', merchant)['id'] == 'pedido_1'
+    assert slots_free == [True]
+
+
+def test_collector_cycle_saves_batch_and_acknowledges(stub_server, db):
+    """Um ciclo completo salva o lote inteiro e confirma apenas os eventos de pedidos salvos."""
+    stub_server.state['events'] = [
+        {'id': f'evento_{i}', 'orderId': f'pedido_{i}'} for i in range(5)
+    ] + [{'id': 'evento_sem_pedido'}]
+
+    collector.collector_cycle()
+
+    pending_ids = {o['id'] for o in get_pending_orders()}
+    assert pending_ids == {f'pedido_{i}' for i in range(5)}
+    assert sorted(stub_server.state['acked']) == sorted(f'evento_{i}' for i in range(5))
+
+
+def test_redelivered_events_are_dropped_before_fetching(stub_server, db):
+    """Eventos reentregues são confirmados de novo sem buscar detalhes nem gravar no banco."""
+    stub_server.state['events'] = [{'id': f'evento_{i}', 'orderId': f'pedido_{i}'} for i in range(3)]
+    collector.collector_cycle()
+    assert stub_server.state['detail_requests'] == 3
+
+    # Mesmos eventos + um evento novo de um pedido já salvo
+    stub_server.state['events'].append({'id': 'evento_confirmado', 'orderId': 'pedido_0'})
+    stub_server.state['acked'].clear()
+    collector.collector_cycle()
+
+    assert stub_server.state['detail_requests'] == 3
+    assert sorted(stub_server.state['acked']) == ['evento_0', 'evento_1', 'evento_2', 'evento_confirmado']
+    metrics = collector.get_collector_metrics()
+    assert metrics['dedup_hits'] == 4
+    assert metrics['dedup_misses'] == 3
+
+
+def test_seen_cache_is_seeded_from_db(stub_server, db):
+    """Após um reinício, pedidos já gravados não são buscados de novo."""
+    app.database.manager.save_new_order({'id': 'pedido_antigo', 'lat': -3.8, 'lon': -38.5})
+    stub_server.state['events'] = [{'id': 'evento_reentregue', 'orderId': 'pedido_antigo'}]
+
+    collector.collector_cycle()
+
+    assert stub_server.state['detail_requests'] == 0
+    assert stub_server.state['acked'] == ['evento_reentregue']
+
+
+def test_seen_cache_is_shared_and_retries_only_the_preload(db, monkeypatch):
+    """Pollings simultâneos usam um único cache; se o banco falhar, o cache vazio fica e só a carga é refeita."""
+    calls = []
+
+    def flaky_recent_order_times(ttl, limit):
+        calls.append(1)
+        time.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError("banco fora do ar")
+        return [('pedido_antigo', time.time())]
+
+    monkeypatch.setattr(collector, 'get_recent_order_times', flaky_recent_order_times)
+    monkeypatch.setattr(collector, 'SEEN_CACHE_PRELOAD_RETRY_S', 0.2)
+    collector.reset_seen_cache()
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            caches = list(pool.map(lambda _: collector.get_seen_cache(), range(4)))
+        assert all(cache is caches[0] for cache in caches)
+        assert len(calls) == 1
+        caches[0].add('o:visto_ao_vivo')
+
+        assert collector.get_seen_cache() is caches[0] and len(calls) == 1  # Antes do intervalo, não tenta
+        time.sleep(0.25)
+        cache = collector.get_seen_cache()
+        assert cache is caches[0] and len(calls) == 2
+        assert cache.seen_any('o:visto_ao_vivo') and cache.seen_any('o:pedido_antigo')
+        collector.get_seen_cache()
+        assert len(calls) == 2
+    finally:
+        collector.reset_seen_cache()
+
+
+def test_collector_reuses_cached_token(stub_server, db):
+    """O token é pedido uma única vez para vários ciclos."""
+    for _ in range(3):
+        collector.collector_cycle()
+    assert stub_server.state['token_requests'] == 1
+
+
+def test_collector_refreshes_token_once_on_401(stub_server, db):
+    """Um 401 provoca uma única renovação, compartilhada por todas as requisições do lote."""
+    stub_server.state['events'] = [{'id': f'evento_{i}', 'orderId': f'pedido_{i}'} for i in range(6)]
+    collector.get_ifood_token()
+    stub_server.state['revoked_tokens'].add('token-1')
+
+    collector.collector_cycle()
+
+    assert stub_server.state['token_requests'] == 2
+    assert len(get_pending_orders()) == 6
+
+
+@pytest.fixture
+def two_merchants(monkeypatch):
+    monkeypatch.setenv('IFOOD_MERCHANTS', 'loja_centro,loja-sul')
+    monkeypatch.setenv('IFOOD_CLIENT_ID_LOJA_CENTRO', 'cliente-centro')
+    monkeypatch.setenv('IFOOD_CLIENT_ID_LOJA_SUL', 'cliente-sul')
+    collector.reset_http_clients()
+    return collector.get_merchants()
+
+
+def test_each_merchant_has_its_own_token_and_tags_its_orders(stub_server, db, two_merchants):
+    """Cada loja autentica com as suas credenciais e os pedidos saem marcados com a loja."""
+    centro, sul = two_merchants
+    stub_server.state['events'] = [{'id': 'evento_1', 'orderId': 'pedido_1'}]
+    collector.collector_cycle(centro)
+    stub_server.state['events'] = [{'id': 'evento_2', 'orderId': 'pedido_2'}]
+    collector.collector_cycle(sul)
+    collector.collector_cycle(centro)
+
+    assert stub_server.state['client_ids'] == ['cliente-centro', 'cliente-sul']
+    assert {o['id']: o['merchant_id'] for o in get_pending_orders()} == {'pedido_1': 'loja_centro', 'pedido_2': 'loja-sul'}
+    assert collector.get_collector_metrics()['merchants']['loja-sul']['orders_saved'] == 1
+
+
+def test_busy_merchant_handles_a_bounded_batch_per_cycle(stub_server, db, monkeypatch):
+    """Acima do limite por ciclo, o excedente fica sem confirmação e volta no próximo polling."""
+    monkeypatch.setattr(collector, 'MAX_EVENTS_PER_CYCLE', 2)
+    stub_server.state['events'] = [{'id': f'evento_{i}', 'orderId': f'pedido_{i}'} for i in range(5)]
+
+    collector.collector_cycle()
+    assert stub_server.state['detail_requests'] == 2
+    assert sorted(stub_server.state['acked']) == ['evento_0', 'evento_1']
+
+    collector.collector_cycle()
+    assert len(get_pending_orders()) == 4
+
+
+def test_collector_loop_polls_every_merchant(stub_server, db, two_merchants):
+    """O loop consulta todas as lojas, cada uma com o seu agendamento."""
+    deadline = time.monotonic() + 5
+
+    def should_run():
+        return time.monotonic() < deadline and not all(m.poll_scheduler.total_polls for m in two_merchants)
+
+    collector.start_collector_loop(should_run=should_run)
+
+    assert all(m.poll_scheduler.total_polls >= 1 for m in two_merchants)
+    assert sorted(stub_server.state['client_ids']) == ['cliente-centro', 'cliente-sul']
+
+
+def test_order_times_use_ifood_fields_or_defaults():
+    """O horário prometido vem de deliveryDateTime; sem ele, o coletor estima a partir do recebimento."""
+    details = {'preparationStartDateTime': '2026-01-01T12:00:00Z',
+               'delivery': {'deliveryDateTime': '2026-01-01T12:40:00.000Z'}}
+    ready_at, promised_at = collector.order_times(details, received_at=0.0)
+    assert promised_at == 1767271200.0 and ready_at == 1767268800.0 + collector.DEFAULT_PREP_TIME_S
+
+    assert collector.order_times({'delivery': {}}, received_at=100.0) == (
+        100.0 + collector.DEFAULT_PREP_TIME_S, 100.0 + collector.DEFAULT_PROMISE_S)
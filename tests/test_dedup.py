@@ -0,0 +1,59 @@
+from app.dedup import RecentIdCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ids_expire_after_ttl():
+    """Ids somem do cache depois do TTL."""
+    clock = FakeClock()
+    cache = RecentIdCache(max_items=10, ttl=60, clock=clock)
+    cache.add('a')
+
+    clock.now = 30
+    assert cache.seen_any('a')
+    clock.now = 61
+    assert not cache.seen_any('a')
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_is_bounded():
+    """Com o cache cheio, os ids mais antigos são descartados primeiro."""
+    cache = RecentIdCache(max_items=3, ttl=60)
+    cache.add('a', 'b', 'c', 'd')
+
+    assert len(cache) == 3
+    assert not cache.seen_any('a')
+    assert cache.seen_any('x', 'd')
+
+
+def test_preload_keeps_real_ages_and_order():
+    """Pedidos pré-carregados expiram pelo horário em que chegaram; no limite, sobram os mais novos."""
+    clock = FakeClock()
+    cache = RecentIdCache(max_items=2, ttl=60, clock=clock)
+    cache.preload([('velho', 900.0), ('meio', 950.0), ('novo', 990.0)], wall_clock=lambda: 1000.0)
+
+    assert not cache.seen_any('velho')
+    assert cache.seen_any('meio')
+    clock.now = 15  # 'meio' completa 60 s desde que chegou
+    assert not cache.seen_any('meio')
+    assert cache.seen_any('novo')
+
+
+def test_preload_after_live_ids_keeps_them_newest():
+    """Um pré-carregamento atrasado entra antes dos ids já vistos ao vivo, sem apagá-los."""
+    clock = FakeClock()
+    cache = RecentIdCache(max_items=10, ttl=60, clock=clock)
+    clock.now = 100
+    cache.add('ao_vivo', 'repetido')
+    cache.preload([('velho', 950.0), ('repetido', 960.0)], wall_clock=lambda: 1000.0)
+
+    clock.now = 111  # 'velho' completa 60 s; os vistos ao vivo ainda valem
+    assert not cache.seen_any('velho')
+    assert cache.seen_any('ao_vivo')
+    assert cache.seen_any('repetido')
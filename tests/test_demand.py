@@ -0,0 +1,125 @@
+import sqlite3
+import time
+
+import pytest
+
+import app.database.manager
+from app.database.manager import setup_database, save_new_orders, get_created_routes, save_demand_grid
+from app.metrics import HOLD_DECISIONS, HOLD_OUTCOMES, ROUTE_STOPS_AT_SEAL
+from app.routing import processor, demand
+from app.routing.demand import DemandGrid, DemandGridStore, load_demand_grid, update_demand_grid
+from app.routing.sealing import RouteSealer
+
+RESTAURANT = processor.RESTAURANT_COORDS
+NORTH = {'lat': RESTAURANT['lat'] + 0.027, 'lon': RESTAURANT['lon']}   # ~3 km ao norte
+SOUTH = {'lat': RESTAURANT['lat'] - 0.027, 'lon': RESTAURANT['lon']}
+WEST = {'lat': RESTAURANT['lat'], 'lon': RESTAURANT['lon'] - 0.027}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "demand.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+
+
+def _orders(prefix, coords, times):
+    return [{'id': f'{prefix}{i}', 'lat': coords['lat'], 'lon': coords['lon'], 'created_at': t}
+            for i, t in enumerate(times)]
+
+
+def test_grid_reads_only_new_orders_and_survives_a_reload(db_test_file):
+    """Cada atualização lê só o que veio depois do cursor; a taxa vale para a célula e as vizinhas; a grade volta igual do banco."""
+    day = 86400
+    now = 1767279600.0  # 2026-01-01 12:00 em UTC-3
+    save_new_orders(_orders('a', NORTH, [now - 2 * day, now - day, now + 300]))
+    grid = DemandGrid(RESTAURANT, tz_offset_h=-3)
+
+    assert update_demand_grid(grid, batch_size=1, now=now + 330) == 2   # o último ainda não assentou (DEMAND_SETTLE_S)
+    assert update_demand_grid(grid, now=now + 400) == 1
+    assert update_demand_grid(grid, now=now + 400) == 0
+    assert grid.observed_days == pytest.approx(2.0, abs=0.01)
+
+    per_slot = 3 / (grid.observed_days * 15 * 60)
+    beside = {'lat': NORTH['lat'] + 0.009, 'lon': NORTH['lon']}   # ~1 km: célula vizinha
+    assert grid.rate(NORTH, now) == pytest.approx(per_slot)
+    assert grid.rate(beside, now) == pytest.approx(per_slot)
+    assert grid.rate(SOUTH, now) == 0.0
+    assert grid.rate(NORTH, now + 3600) == 0.0
+
+    assert load_demand_grid(RESTAURANT) is None
+    save_demand_grid('default', grid.to_bytes())
+    loaded = load_demand_grid(RESTAURANT)
+    assert loaded.rate(NORTH, now) == grid.rate(NORTH, now)
+    assert loaded.cursor == grid.cursor
+    assert load_demand_grid(SOUTH) is None
+
+
+def test_single_stop_routes_wait_only_where_a_neighbour_is_likely(db_test_file, monkeypatch):
+    """Ao norte (movimentado) a rota espera e recebe o vizinho; ao sul (parado) ela sai na hora."""
+    clock = FakeClock()
+    grid = DemandGrid(RESTAURANT)
+    history = [clock.now - d * 86400 for d in (1, 2, 3) for _ in range(10)]
+    grid.add(_orders('h', NORTH, history) + _orders('w', WEST, history))
+    save_demand_grid('default', grid.to_bytes())
+    monkeypatch.setattr(demand, 'HOLD_WINDOW_S', 90.0)
+    monkeypatch.setattr(processor, 'DEMAND_GRID', DemandGridStore(RESTAURANT, reload_s=0))
+    processor.reset_state(sealer=RouteSealer(clock=clock))
+    decisions = {d: HOLD_DECISIONS.labels(d).value() for d in ('hold', 'release')}
+    joined = HOLD_OUTCOMES.labels('joined').value()
+    held_stops = ROUTE_STOPS_AT_SEAL.labels('yes').snapshot()[1]
+
+    save_new_orders(_orders('n', NORTH, [None]) + _orders('s', SOUTH, [None]))
+    processor.processor_cycle()
+    open_routes = get_created_routes()
+    assert [[o['id'] for o in r['orders']] for r in open_routes] == [['n0']]
+    assert processor.SEALER.holding == {open_routes[0]['id']}
+    assert HOLD_DECISIONS.labels('hold').value() == decisions['hold'] + 1
+    assert HOLD_DECISIONS.labels('release').value() == decisions['release'] + 1
+
+    save_new_orders(_orders('m', {'lat': NORTH['lat'] + 0.003, 'lon': NORTH['lon']}, [None]))
+    processor.processor_cycle()
+    assert [len(r['orders']) for r in get_created_routes()] == [2]
+    assert processor.SEALER.holding == set()
+    assert HOLD_OUTCOMES.labels('joined').value() == joined + 1
+
+    # Sem vizinho, a espera acaba na janela (e não na idade máxima da rota)
+    save_new_orders(_orders('x', WEST, [None]))
+    processor.processor_cycle()
+    assert len(processor.SEALER.holding) == 1
+    clock.now += 91
+    processor.processor_cycle()
+    assert processor.SEALER.holding == set()
+    assert [len(r['orders']) for r in get_created_routes()] == [2]
+    assert ROUTE_STOPS_AT_SEAL.labels('yes').snapshot()[1] == held_stops + 1
+
+
+def test_hold_never_outlasts_the_age_deadline():
+    """A espera troca o prazo da rota, mas nunca para depois da idade máxima do pedido dela."""
+    clock = FakeClock()
+    sealer = RouteSealer(max_age=600, clock=clock)
+    sealer.track({'id': 1, 'orders': [{'created_at': clock.now - 580}]})
+    sealer.track({'id': 2, 'orders': [{'created_at': clock.now}]})
+    sealer.hold(1, 90)
+    sealer.hold(2, 90)
+
+    clock.now += 20
+    assert sealer.pop_expired() == [1]
+    clock.now += 70
+    assert sealer.pop_expired() == [2]
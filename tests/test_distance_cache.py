@@ -0,0 +1,94 @@
+from app.routing.distance_cache import DistanceCache
+from app.routing import optimizer
+
+
+def _point(i):
+    return {'lat': -3.78 + i * 0.001, 'lon': -38.50}
+
+
+def _counting_cache(max_items):
+    calls = []
+
+    def distance(p1, p2):
+        calls.append((p1['lat'], p2['lat']))
+        return optimizer.haversine_distance(p1, p2)
+
+    return DistanceCache(distance, max_items=max_items), calls
+
+
+def test_repeated_pairs_are_computed_once():
+    """O mesmo par só passa pelo haversine uma vez; a taxa de acerto aparece nas estatísticas."""
+    cache, calls = _counting_cache(max_items=100)
+    origin = _point(0)
+    for _ in range(3):
+        for i in range(1, 5):
+            assert cache.distance(origin, _point(i)) == optimizer.haversine_distance(origin, _point(i))
+
+    assert len(calls) == 4
+    assert cache.stats()['hits'] == 8 and cache.stats()['hit_rate'] == round(8 / 12, 4)
+
+
+def test_cache_is_bounded_and_keeps_recently_used_pairs():
+    """Com o limite estourado, os pares usados recentemente sobrevivem e os esquecidos saem."""
+    cache, calls = _counting_cache(max_items=4)
+    origin = _point(0)
+    cache.distance(origin, _point(1))
+    cache.distance(origin, _point(2))      # Geração recente cheia: vira a antiga
+    cache.distance(origin, _point(1))      # Usado de novo: volta para a recente
+    cache.distance(origin, _point(3))
+    cache.distance(origin, _point(4))      # Nova rotação: o par com o ponto 2 é descartado
+
+    assert len(cache) <= 4
+    calls.clear()
+    cache.distance(origin, _point(1))
+    cache.distance(origin, _point(2))
+    assert calls == [(origin['lat'], _point(2)['lat'])]
+
+
+def test_pairs_of_orders_that_left_the_open_routes_are_invalidated():
+    """Quando um pedido sai das rotas abertas, todos os pares com ele saem do cache."""
+    cache, _ = _counting_cache(max_items=100)
+    origin, a, b = _point(0), _point(1), _point(2)
+    cache.distance(origin, a)
+    cache.distance(a, b)
+    cache.distance(origin, b)
+    cache.retain([origin, a, b])
+
+    cache.retain([origin, b])  # O pedido "a" foi para uma rota fechada
+    assert len(cache) == 1
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_optimizer_distances_go_through_the_cache():
+    """calculate_distance do otimizador usa o cache de forma transparente."""
+    before = optimizer.DISTANCE_CACHE.hits
+    p1, p2 = {'lat': -3.7001, 'lon': -38.4001}, {'lat': -3.7101, 'lon': -38.4101}
+    first = optimizer.calculate_distance(p1, p2)
+    assert optimizer.calculate_distance(p1, p2) == first
+    assert optimizer.DISTANCE_CACHE.hits == before + 1
+
+
+def test_size_counter_matches_the_distinct_pairs():
+    """len() vem de um contador (lido sem percorrer os dicionários) e bate com os pares distintos."""
+    import random
+
+    cache, _ = _counting_cache(max_items=8)
+    rng = random.Random(5)
+    points = [_point(i) for i in range(6)]
+    for step in range(300):
+        cache.distance(rng.choice(points), rng.choice(points))
+        if step % 50 == 49:
+            cache.retain(rng.sample(points, 4))
+        assert len(cache) == len(cache._recent.keys() | cache._old.keys())
+
+
+def test_idle_processor_cycles_still_trim_the_cache(monkeypatch):
+    """Um ciclo sem pedidos novos também informa os pontos vivos ao cache."""
+    from app.routing import processor
+
+    calls = []
+    monkeypatch.setattr(processor, 'get_pending_orders', lambda: [])
+    monkeypatch.setattr(processor, '_refresh_live_routes', lambda shard=None: [])
+    monkeypatch.setattr(processor.DISTANCE_CACHE, 'retain', lambda points: calls.append(list(points)))
+    processor.processor_cycle()
+    assert calls == [[processor.RESTAURANT_COORDS]]
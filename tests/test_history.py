@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+import app.database.manager
+from app import history
+from app.database.manager import setup_database, save_new_orders, create_new_route, update_route, seal_routes
+from app.routing.optimizer import haversine_distance
+
+RESTAURANT = {'lat': -3.78, 'lon': -38.50}
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "history.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+
+
+def _sealed_route(order_ids, created_at, sealed_at):
+    orders = [{'id': order_id, 'coords': {'lat': RESTAURANT['lat'] + 0.01 * (i + 1), 'lon': RESTAURANT['lon']},
+               'created_at': created_at} for i, order_id in enumerate(order_ids)]
+    save_new_orders([{'id': o['id'], 'lat': o['coords']['lat'], 'lon': o['coords']['lon'], 'created_at': created_at}
+                     for o in orders])
+    route_id = create_new_route(orders[0], RESTAURANT)
+    update_route({'id': route_id, 'orders': orders, 'google_maps_link': ''}, RESTAURANT)
+    seal_routes([route_id], sealed_at=sealed_at)
+    return orders
+
+
+def test_export_is_incremental_and_partitioned_by_day(db_test_file, tmp_path, monkeypatch):
+    """Rotas fechadas vão para o dia do fechamento (UTC-3); uma segunda exportação só leva as novas."""
+    monkeypatch.setattr(history, 'HISTORY_TZ_OFFSET_H', -3.0)
+    out = str(tmp_path / "history")
+    day1 = 1767236400.0  # 2026-01-01 00:00 em UTC-3
+    _sealed_route(['A', 'B'], day1 + 600, day1 + 1200)
+    _sealed_route(['C'], day1 + 86400 + 60, day1 + 86400 + 360)
+
+    assert history.export_history(RESTAURANT, out, batch_size=1) == 2
+    assert history.export_history(RESTAURANT, out) == 0
+    _sealed_route(['D', 'E'], day1 + 86400 + 100, day1 + 86400 + 700)
+    assert history.export_history(RESTAURANT, out) == 1
+    # Fechada agora: espera EXPORT_SETTLE_S antes de sair
+    _sealed_route(['F'], day1 + 86400 + 800, day1 + 86400 + 900)
+    assert history.export_history(RESTAURANT, out, now=day1 + 86400 + 930) == 0
+    assert history.export_history(RESTAURANT, out, now=day1 + 86400 + 961) == 1
+
+    manifest = history.read_manifest(out)
+    assert sorted(manifest['days']) == ['2026-01-01', '2026-01-02']
+    assert len(manifest['days']['2026-01-02']) == 3
+    ids = [list(ids) for _, ids in history.iter_parts(out, 'order_ids')]
+    assert ids == [['A', 'B'], ['C'], ['D', 'E'], ['F']]
+
+
+def test_kpis_from_the_files(db_test_file, tmp_path):
+    """km por pedido e paradas por rota batem com as rotas exportadas."""
+    out = str(tmp_path / "history")
+    day1 = 1767236400.0
+    orders_ab = _sealed_route(['A', 'B'], day1, day1 + 600)
+    orders_c = _sealed_route(['C'], day1, day1 + 1200)
+    history.export_history(RESTAURANT, out)
+
+    km = (haversine_distance(RESTAURANT, orders_ab[0]['coords'])
+          + haversine_distance(orders_ab[0]['coords'], orders_ab[1]['coords'])
+          + haversine_distance(RESTAURANT, orders_c[0]['coords']))
+    kpis = history.compute_kpis(out)
+    assert kpis['routes'] == 2 and kpis['orders'] == 3
+    assert kpis['km_per_order'] == round(km / 3, 4)
+    assert kpis['stops_per_route'] == 1.5
+    assert kpis['minutes_to_seal_p50'] == 15.0
+    assert history.compute_kpis(out, start_day='2026-01-02')['routes'] == 0
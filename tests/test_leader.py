@@ -0,0 +1,129 @@
+import sqlite3
+import threading
+
+import pytest
+
+import app.database.manager
+from app.database.manager import (setup_database, acquire_lease, release_lease, save_new_orders, get_all_created_routes,
+                                  get_created_routes, update_route)
+from app.leader import LeaderLease, run_as_leader
+from app.routing.processor import processor_cycle, RESTAURANT_COORDS
+from app.routing.sharding import sector_of, filter_shard
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "leader.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    return db_file
+
+
+def test_lease_row_is_exclusive_until_it_expires(db_test_file):
+    """Só um dono por vez; o lease expirado (ou liberado) pode ser tomado por outro worker."""
+    assert acquire_lease('collector', 'A', ttl=30, now=100)
+    assert not acquire_lease('collector', 'B', ttl=30, now=110)
+    assert acquire_lease('collector', 'A', ttl=30, now=120)  # Renovação: vale até 150
+    assert not acquire_lease('collector', 'B', ttl=30, now=140)
+    assert acquire_lease('collector', 'B', ttl=30, now=151)
+
+    release_lease('collector', 'A')  # Não é mais de A: nada muda
+    assert not acquire_lease('collector', 'A', ttl=30, now=160)
+    release_lease('collector', 'B')
+    assert acquire_lease('collector', 'A', ttl=30, now=161)
+
+
+def test_only_one_worker_runs_the_collector(db_test_file):
+    """Dois workers disputando o papel: só um executa, e o outro assume quando o primeiro sai."""
+    stops = {'worker-1': threading.Event(), 'worker-2': threading.Event()}
+    running = []
+    first_may_leave = threading.Event()
+
+    def target(lease, should_run):
+        running.append(lease.holder)
+        if lease.holder == 'worker-1':
+            first_may_leave.wait(5)
+        stops[lease.holder].set()  # Cada worker roda o papel uma vez e encerra
+
+    def start(holder):
+        lease = LeaderLease('collector', holder, use_advisory_lock=False)
+        thread = threading.Thread(target=run_as_leader, args=([lease], target),
+                                  kwargs={'retry_interval': 0.01, 'stop_event': stops[holder]})
+        thread.start()
+        return thread
+
+    worker_1 = start('worker-1')
+    while not running:
+        pass
+    worker_2 = start('worker-2')
+
+    stops['worker-2'].wait(0.1)
+    assert running == ['worker-1']  # worker-2 continua em espera
+    first_may_leave.set()
+    worker_1.join(5)
+    worker_2.join(5)
+    assert running == ['worker-1', 'worker-2']
+
+
+def test_sharded_processors_only_route_their_sector(db_test_file):
+    """Com 2 setores, cada processador só cria rotas para os pedidos do seu lado."""
+    east = {'id': 'E1', 'lat': RESTAURANT_COORDS['lat'] + 0.01, 'lon': RESTAURANT_COORDS['lon'] + 0.01}
+    west = {'id': 'W1', 'lat': RESTAURANT_COORDS['lat'] - 0.01, 'lon': RESTAURANT_COORDS['lon'] - 0.01}
+    save_new_orders([east, west])
+    east_sector = sector_of(east, RESTAURANT_COORDS, 2)
+    assert sector_of(west, RESTAURANT_COORDS, 2) != east_sector
+
+    processor_cycle(shard=(east_sector, 2))
+    routed = [order['id'] for route in get_all_created_routes() for order in route['orders']]
+    assert routed == ['E1']
+
+    processor_cycle(shard=(1 - east_sector, 2))
+    routed = sorted(order['id'] for route in get_all_created_routes() for order in route['orders'])
+    assert routed == ['E1', 'W1']
+
+
+def test_route_keeps_the_sector_it_was_created_in(db_test_file):
+    """Reordenar a rota (outro pedido em primeiro) não a passa para o processador de outro setor."""
+    north = {'id': 'N1', 'lat': RESTAURANT_COORDS['lat'] + 0.02, 'lon': RESTAURANT_COORDS['lon'] - 0.001}
+    north_east = {'id': 'N2', 'lat': RESTAURANT_COORDS['lat'] + 0.01, 'lon': RESTAURANT_COORDS['lon'] + 0.012}
+    save_new_orders([north, north_east])
+    assert sector_of(north, RESTAURANT_COORDS, 4) != sector_of(north_east, RESTAURANT_COORDS, 4)
+
+    processor_cycle(shard=(sector_of(north, RESTAURANT_COORDS, 4), 4))
+    route = get_created_routes()[0]
+    route['orders'] = [{'id': 'N2', 'coords': {'lat': north_east['lat'], 'lon': north_east['lon']}}] + route['orders']
+    update_route(route, RESTAURANT_COORDS)
+
+    routes = get_created_routes()
+    for index in range(4):
+        _, owned = filter_shard([], routes, RESTAURANT_COORDS, (index, 4))
+        assert [r['id'] for r in owned] == ([route['id']] if index == sector_of(north, RESTAURANT_COORDS, 4) else [])
+
+
+def test_worker_records_the_order_stream_where_the_collector_runs(db_test_file, tmp_path, monkeypatch):
+    """Com MOTOROTAS_RECORD_PATH, o worker que roda o coletor liga a gravação; o do processador, não."""
+    import worker
+    import app.recorder
+    from app.recorder import get_recorder, disable_recorder
+
+    path = str(tmp_path / 'fluxo.jsonl')
+    monkeypatch.setattr(app.recorder, 'RECORD_PATH', path)
+    stop_event = threading.Event()
+    stop_event.set()
+    try:
+        for thread in worker.start_worker('processor', shards=1, stop_event=stop_event):
+            thread.join(5)
+        assert get_recorder() is None
+
+        for thread in worker.start_worker('collector', shards=1, stop_event=stop_event):
+            thread.join(5)
+        assert get_recorder().path == path
+    finally:
+        disable_recorder()
@@ -0,0 +1,62 @@
+import io
+import json
+import logging
+import threading
+
+from app.logging_config import JsonFormatter, RateLimitFilter, log_context, setup_logging, shutdown_logging
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ThreadRecordingStream(io.StringIO):
+    """Guarda também a thread que fez cada escrita."""
+
+    def __init__(self):
+        super().__init__()
+        self.writer_threads = set()
+
+    def write(self, text):
+        self.writer_threads.add(threading.current_thread().name)
+        return super().write(text)
+
+
+def test_json_lines_carry_context_fields():
+    """Cada linha é um JSON com os campos de correlação do ciclo e os extras do log."""
+    stream = ThreadRecordingStream()
+    shutdown_logging()
+    setup_logging(level='DEBUG', log_format='json', stream=stream)
+    try:
+        with log_context(component='processor', cycle_id=7):
+            logging.getLogger('app.routing.processor').debug("Nova rota criada", extra={'order_id': 'P1', 'route_id': 3})
+    finally:
+        shutdown_logging()  # Esvazia a fila antes de ler o stream
+
+    line = json.loads(stream.getvalue().strip())
+    assert line['msg'] == "Nova rota criada"
+    assert (line['component'], line['cycle_id'], line['order_id'], line['route_id']) == ('processor', 7, 'P1', 3)
+    # A escrita acontece na thread do listener, não na thread que logou
+    assert threading.current_thread().name not in stream.writer_threads
+
+
+def test_repeated_errors_are_rate_limited():
+    """Depois do limite, o mesmo erro é suprimido até a janela virar; a próxima linha conta os suprimidos."""
+    clock = FakeClock()
+    rate_filter = RateLimitFilter(burst=2, window=60, clock=clock)
+
+    def record(level=logging.ERROR):
+        return logging.LogRecord('app.collector', level, __file__, 1, "Coletor: erro %s", ('x',), None)
+
+    assert [rate_filter.filter(record()) for _ in range(5)] == [True, True, False, False, False]
+    assert rate_filter.filter(record(logging.INFO))  # Abaixo de WARNING nunca é limitado
+
+    clock.now = 61
+    after_window = record()
+    assert rate_filter.filter(after_window)
+    assert after_window.suppressed_repeats == 3
+    assert json.loads(JsonFormatter().format(after_window))['suppressed_repeats'] == 3
@@ -77,4 +77,33 @@ def test_get_pending_orders(db_test_file):
     
     pending = get_pending_orders()
     assert len(pending) == 1
-    assert pending[0]['id'] == 'pendente'
\ No newline at end of file
+    assert pending[0]['id'] == 'pendente'
+def test_save_new_orders_batch(db_test_file):
+    """Verifica se o lote é salvo de uma vez e ignora pedidos já existentes."""
+    from app.database.manager import save_new_orders
+    save_new_order({'id': 'ja_existe', 'lat': 1.0, 'lon': 1.0})
+
+    inserted = save_new_orders([
+        {'id': 'ja_existe', 'lat': 1.0, 'lon': 1.0},
+        {'id': 'novo_1', 'lat': 2.0, 'lon': 2.0},
+        {'id': 'novo_2', 'lat': 3.0, 'lon': 3.0},
+    ])
+    assert inserted == ['novo_1', 'novo_2']
+    assert len(get_pending_orders()) == 3
+
+def test_setup_database_skips_when_schema_version_matches(db_test_file, monkeypatch):
+    """Com a versão gravada igual à atual, o setup não reaplica o esquema; com versão nova, reaplica."""
+    assert setup_database() is False
+
+    monkeypatch.setattr(app.database.manager, 'SCHEMA_VERSION', app.database.manager.SCHEMA_VERSION + 1)
+    assert setup_database() is True
+    assert setup_database() is False
+
+def test_app_import_does_not_load_heavy_modules():
+    """Subir a aplicação com SQLite não carrega psycopg2 nem numpy."""
+    import subprocess
+    code = "import sys, app.routes, app.routing.optimizer; print(sorted(m for m in ('numpy', 'psycopg2') if m in sys.modules))"
+    env = {k: v for k, v in os.environ.items() if k != 'DATABASE_URL'}
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, check=True, env=env).stdout
+    assert output.strip() == '[]'
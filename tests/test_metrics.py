@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, timed_query, DB_QUERY_SECONDS, PROCESSOR_CYCLE_SECONDS, start_metrics_server
+
+
+def test_counter_sums_shards_from_all_threads():
+    """Cada thread escreve no seu shard; a leitura soma tudo, inclusive de threads já encerradas."""
+    counter = Counter('teste_total', 'Contador de teste.')
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter.labels().value() == 8000
+    assert counter.render()[-1] == 'teste_total 8000'
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Os buckets são cumulativos (le) e terminam em +Inf com a contagem total."""
+    histogram = Histogram('teste_segundos', 'Histograma de teste.', labelnames=('etapa',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels('a').observe(value)
+
+    lines = histogram.render()
+    assert 'teste_segundos_bucket{etapa="a",le="0.1"} 2' in lines
+    assert 'teste_segundos_bucket{etapa="a",le="1.0"} 3' in lines
+    assert 'teste_segundos_bucket{etapa="a",le="+Inf"} 4' in lines
+    assert 'teste_segundos_count{etapa="a"} 4' in lines
+    assert 'teste_segundos_sum{etapa="a"} 3.65' in lines
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    state = {'value': 1}
+    gauge = Gauge('teste_gauge', 'Gauge de teste.')
+    gauge.set_function(lambda: state['value'])
+    state['value'] = 7
+    assert gauge.render()[-1] == 'teste_gauge 7'
+
+
+def test_timed_query_records_latency_per_function():
+    @timed_query
+    def consulta_de_teste():
+        return 42
+
+    assert consulta_de_teste() == 42
+    counts, _ = DB_QUERY_SECONDS.labels('consulta_de_teste').snapshot()
+    assert sum(counts) == 1
+
+
+def test_metrics_server_exposes_the_registry_without_flask():
+    """O worker serve /metrics por conta própria, com as métricas do processo dele."""
+    import urllib.error
+    import urllib.request
+
+    PROCESSOR_CYCLE_SECONDS.observe(0.01)
+    server = start_metrics_server(0, host='127.0.0.1')
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+            body = response.read().decode()
+            assert response.headers['Content-Type'].startswith('text/plain')
+        assert 'motorotas_processor_cycle_seconds_count' in body
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base_url}/outra", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_worker_serves_the_collector_status_where_the_collector_runs():
+    """O estado do coletor em JSON sai do servidor de métricas do worker que roda o coletor."""
+    import json
+    import urllib.request
+
+    import worker
+
+    assert worker.worker_json_routes('processor') == {}
+    server = start_metrics_server(0, host='127.0.0.1', json_routes=worker.worker_json_routes('collector'))
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/api/collector/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers['Content-Type'] == 'application/json'
+            status = json.loads(response.read())
+        assert status['breaker_state'] == 'closed'
+        assert status['poll_interval_seconds'] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
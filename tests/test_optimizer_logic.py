@@ -1,5 +1,5 @@
 import pytest
-from app.routing.optimizer import calculate_distance, reorder_route
+from app.routing.optimizer import calculate_distance, reorder_route, find_best_route_for_order
 
 def test_calculate_distance_accuracy():
     """Testa se o cálculo de distância está preciso (margem de erro pequena)."""
@@ -28,4 +28,13 @@ def test_reorder_route_simple():
     # A ordem correta deve ser: Perto -> Médio -> Longe
     assert ordered[0]['id'] == 'perto'
     assert ordered[1]['id'] == 'medio'
-    assert ordered[2]['id'] == 'longe'
\ No newline at end of file
+    assert ordered[2]['id'] == 'longe'
+
+def test_routes_do_not_mix_merchants():
+    """Um pedido de outra loja não entra em uma rota, mesmo estando no caminho."""
+    restaurant = {"lat": -3.783871, "lon": -38.500820}
+    route = {"id": 1, "orders": [{"id": "A", "coords": {"lat": -3.805, "lon": -38.505}, "merchant_id": "loja_centro"}]}
+    same_way = {"lat": -3.815, "lon": -38.508}
+
+    assert find_best_route_for_order({"id": "B", "coords": same_way, "merchant_id": "loja_centro"}, [route], restaurant) is route
+    assert find_best_route_for_order({"id": "C", "coords": same_way, "merchant_id": "loja_sul"}, [route], restaurant) is None
@@ -0,0 +1,85 @@
+import math
+import random
+import sqlite3
+
+import pytest
+
+import app.database.manager
+from app.database.manager import setup_database, save_new_orders, get_pending_orders, get_created_routes
+from app.routing import processor, parallel
+from app.routing.parallel import split_by_sector, interior_sector
+
+RESTAURANT = processor.RESTAURANT_COORDS
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "parallel.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+
+
+def _at(order_id, degrees, km):
+    # ~111 km por grau; o ângulo é medido no plano (lon, lat), como em app/routing/sharding.py
+    angle = math.radians(degrees)
+    return {'id': order_id, 'coords': {'lat': RESTAURANT['lat'] + km / 111 * math.sin(angle),
+                                       'lon': RESTAURANT['lon'] + km / 111 * math.cos(angle)}}
+
+
+def test_boundary_orders_and_routes_stay_out_of_the_sectors():
+    """Com 4 setores de 90°, o que fica a menos de 10° de uma divisa vai para o caminho serial."""
+    inside_0, inside_1 = _at('a', 45, 3), _at('b', 135, 3)
+    near_edge, at_restaurant = _at('c', 95, 3), {'id': 'd', 'coords': dict(RESTAURANT)}
+    assert interior_sector(inside_1['coords'], RESTAURANT, 4) == 1
+    assert interior_sector(near_edge['coords'], RESTAURANT, 4) is None
+
+    crossing = {'id': 1, 'orders': [_at('x', 60, 2), _at('y', 120, 4)]}
+    inner = {'id': 2, 'orders': [_at('z', 200, 2)]}
+    sectors, seam_orders, seam_routes = split_by_sector(
+        [inside_0, inside_1, near_edge, at_restaurant], [crossing, inner], RESTAURANT, 4)
+
+    assert [[o['id'] for o in orders] for orders, _ in sectors] == [['a'], ['b'], [], []]
+    assert [[r['id'] for r in routes] for _, routes in sectors] == [[], [], [2], []]
+    assert [o['id'] for o in seam_orders] == ['c', 'd']
+    assert seam_routes == [crossing]
+
+
+def test_parallel_cycle_commits_every_sector_together(db_test_file, monkeypatch):
+    """Um pico roteado em paralelo deixa banco e estado em memória iguais, sem pedido perdido ou duplicado."""
+    monkeypatch.setattr(parallel, 'PARALLEL_SECTORS', 4)
+    monkeypatch.setattr(parallel, 'PARALLEL_MIN_ORDERS', 1)
+    calls = []
+    route_sectors = parallel.route_sectors
+    monkeypatch.setattr(parallel, 'route_sectors', lambda *args: calls.append(args) or route_sectors(*args))
+    rng = random.Random(11)
+    ids = []
+    try:
+        for batch in range(2):
+            orders = [_at(f'{batch}-{i}', rng.uniform(0, 360), rng.uniform(0.5, 6)) for i in range(60)]
+            save_new_orders([{'id': o['id'], 'lat': o['coords']['lat'], 'lon': o['coords']['lon']} for o in orders])
+            ids += [o['id'] for o in orders]
+            processor.processor_cycle()
+    finally:
+        parallel.shutdown_executor()
+
+    assert len(calls) == 2
+    assert get_pending_orders() == []
+    conn = sqlite3.connect(db_test_file)
+    routed = [row[0] for row in conn.execute("SELECT order_id FROM route_orders")]
+    conn.close()
+    assert sorted(routed) == sorted(ids)
+
+    live = processor.LIVE_ROUTES.routes.values()
+    assert ({r['id']: [o['id'] for o in r['orders']] for r in get_created_routes()}
+            == {r['id']: [o['id'] for o in r['orders']] for r in live})
+    # Pedidos do interior de setores diferentes nunca acabam na mesma rota
+    for route in live:
+        assert len({interior_sector(o['coords'], RESTAURANT, 4) for o in route['orders']} - {None}) <= 1
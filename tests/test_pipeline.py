@@ -0,0 +1,112 @@
+import sqlite3
+
+import pytest
+
+import app.database.manager
+import app.routing.processor as processor
+from app.database.manager import setup_database, save_new_order, get_pending_orders
+from app.pipeline import OrderPipeline, enable_pipeline, disable_pipeline
+
+
+def _order(order_id, lat=-3.80, lon=-38.51):
+    return {'id': order_id, 'coords': {'lat': lat, 'lon': lon}}
+
+
+def test_first_take_replays_pending_from_db():
+    """No reinício, o processador recebe os pendentes do banco mais o que só estava na fila, sem repetir."""
+    pipeline = OrderPipeline(maxsize=10)
+    pipeline.publish([_order('a'), _order('b')])
+
+    taken = pipeline.take_pending(lambda: [_order('a'), _order('c')])
+    assert [o['id'] for o in taken] == ['a', 'c', 'b']
+    assert pipeline.qsize() == 0
+
+    # Publicação atrasada de um pedido que já veio no replay
+    pipeline.publish([_order('c'), _order('d')])
+    assert [o['id'] for o in pipeline.take_pending(lambda: pytest.fail("não deveria varrer o banco"))] == ['d']
+
+
+def test_order_published_during_the_replay_scan_is_routed_once():
+    """A fila é esvaziada antes da leitura do banco: o que chega no meio vem do banco e a cópia é descartada."""
+    pipeline = OrderPipeline(maxsize=10)
+
+    def load_while_collector_publishes():
+        pipeline.publish([_order('x')])
+        return [_order('x')]
+
+    assert [o['id'] for o in pipeline.take_pending(load_while_collector_publishes)] == ['x']
+    assert pipeline.take_pending(lambda: pytest.fail("não deveria varrer o banco")) == []
+
+
+def test_late_copy_drained_by_a_second_replay_is_routed_once():
+    """Dois replays seguidos: a cópia atrasada de um pedido do primeiro não volta no segundo."""
+    pipeline = OrderPipeline(maxsize=10)
+    assert [o['id'] for o in pipeline.take_pending(lambda: [_order('x')])] == ['x']
+
+    pipeline.publish([_order('x')])  # Cópia atrasada do coletor
+    pipeline.request_replay()        # Estouro antes de qualquer drenagem normal
+    taken = pipeline.take_pending(lambda: [_order('y'), _order('z')])  # 'x' já foi roteado
+    assert [o['id'] for o in taken] == ['y', 'z']
+    assert pipeline.take_pending(lambda: pytest.fail("não deveria varrer o banco")) == []
+
+
+def test_full_queue_applies_backpressure_and_falls_back_to_replay():
+    """Com a fila cheia, o coletor espera; se estourar, o próximo ciclo recarrega do banco."""
+    pipeline = OrderPipeline(maxsize=2, put_timeout=0.05)
+    pipeline.take_pending(lambda: [])  # Consome o replay inicial
+
+    assert pipeline.publish([_order('a'), _order('b'), _order('c')]) == 2
+    assert pipeline.overflows == 1
+
+    taken = pipeline.take_pending(lambda: [_order('a'), _order('b'), _order('c')])
+    assert [o['id'] for o in taken] == ['a', 'b', 'c']
+    assert pipeline.replays == 2
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'pipeline_test.db')
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+    disable_pipeline()
+
+
+def test_processor_consumes_queue_without_scanning(db, monkeypatch):
+    """Depois do replay inicial, o processador não consulta mais get_pending_orders."""
+    pipeline = enable_pipeline(maxsize=10)
+    save_new_order({'id': 'antigo', 'lat': -3.80, 'lon': -38.51})
+    processor.processor_cycle()  # Replay do que ficou pendente
+    assert get_pending_orders() == []
+
+    scans = []
+    monkeypatch.setattr(processor, 'get_pending_orders', lambda: scans.append(1) or [])
+    save_new_order({'id': 'novo', 'lat': -3.81, 'lon': -38.51})
+    pipeline.publish([_order('novo', -3.81, -38.51)])
+    processor.processor_cycle()
+
+    assert scans == []
+    assert app.database.manager.get_pending_orders() == []
+
+
+def test_inactive_pipeline_scans_the_db_every_cycle():
+    """Sem os dois leases neste processo, a fila não recebe nada e o processador lê o banco a cada ciclo."""
+    holds_both = [False]
+    pipeline = OrderPipeline(maxsize=10, is_active=lambda: holds_both[0])
+
+    assert pipeline.publish([_order('a')]) == 0
+    assert [o['id'] for o in pipeline.take_pending(lambda: [_order('a')])] == ['a']
+    assert [o['id'] for o in pipeline.take_pending(lambda: [_order('a'), _order('b')])] == ['a', 'b']
+
+    # Ao ganhar os dois papéis, começa por um replay (o que ficou pendente no banco)
+    holds_both[0] = True
+    assert [o['id'] for o in pipeline.take_pending(lambda: [_order('b')])] == ['b']
+    pipeline.publish([_order('c')])
+    assert [o['id'] for o in pipeline.take_pending(lambda: pytest.fail("não deveria varrer o banco"))] == ['c']
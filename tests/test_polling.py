@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from app import polling
+from app.polling import AdaptivePollScheduler, CircuitBreaker, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scheduler_speeds_up_with_events_and_slows_down_when_idle():
+    """Com eventos chegando o intervalo cai ao mínimo; ocioso, cresce até o máximo."""
+    scheduler = AdaptivePollScheduler(rng=random.Random(0))
+
+    assert scheduler.next_delay(5) == polling.MIN_INTERVAL_S
+
+    delays = [scheduler.next_delay(0) for _ in range(20)]
+    assert delays[0] == polling.BASE_INTERVAL_S
+    assert delays == sorted(delays)
+    assert delays[-1] == polling.MAX_IDLE_INTERVAL_S
+
+
+def test_scheduler_backs_off_with_jitter_on_failures():
+    """Falhas consecutivas aumentam a espera exponencialmente, dentro da faixa de jitter."""
+    scheduler = AdaptivePollScheduler(breaker=CircuitBreaker(failure_threshold=100), rng=random.Random(0))
+
+    for failures in range(1, 6):
+        ceiling = min(polling.MAX_BACKOFF_S, polling.BACKOFF_BASE_S * 2 ** (failures - 1))
+        delay = scheduler.next_delay(None)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """O disjuntor abre após N falhas, libera um teste depois do timeout e fecha no sucesso."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60, clock=clock)
+    scheduler = AdaptivePollScheduler(breaker=breaker, rng=random.Random(0))
+
+    for _ in range(3):
+        delay = scheduler.next_delay(None)
+    assert breaker.state == polling.OPEN
+    assert not breaker.allow_request()
+    assert delay == pytest.approx(60)
+
+    clock.now += 60
+    assert breaker.state == polling.HALF_OPEN
+    assert breaker.allow_request()
+
+    # Falha no teste: volta a abrir imediatamente
+    scheduler.next_delay(None)
+    assert breaker.state == polling.OPEN
+
+    clock.now += 60
+    scheduler.next_delay(2)
+    assert breaker.state == polling.CLOSED
+    assert scheduler.metrics()['breaker_times_opened'] == 2
+    assert scheduler.metrics()['poll_interval_seconds'] == polling.MIN_INTERVAL_S
+
+
+def test_token_bucket_allows_burst_then_paces_requests():
+    """Depois da rajada, cada requisição espera 1/rate; o tempo parado acumula nas estatísticas."""
+    clock = FakeClock()
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock, sleep=fake_sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    clock.now += 10  # Ocioso: recupera a rajada, sem passar do limite
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.throttled_seconds == pytest.approx(sum(sleeps))
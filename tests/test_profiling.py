@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+import app.database.manager
+import app.routing.processor as processor
+from app.database.manager import setup_database, save_new_order
+from app.routing.profiling import CycleProfiler, STAGES
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'profiling_test.db')
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    return db_file
+
+
+def test_disabled_profiler_records_nothing():
+    """Desligado, o profiler devolve sempre o mesmo contexto vazio e não acumula nada."""
+    profiler = CycleProfiler(enabled=False)
+    profiler.begin_cycle()
+    with profiler.stage('reorder'):
+        pass
+    profiler.end_cycle(did_work=True)
+
+    assert profiler.stage('a') is profiler.stage('b')
+    assert profiler.status()['stages'] == {}
+
+
+def test_profiler_measures_every_stage_and_dumps_cprofile(db, tmp_path, monkeypatch):
+    """Ligado, mede todas as etapas do ciclo e grava o cProfile dos próximos N ciclos com trabalho."""
+    profiler = CycleProfiler(enabled=False, profile_dir=str(tmp_path / 'profiles'))
+    profiler.configure(enabled=True, capture_cycles=1)
+    monkeypatch.setattr(processor, 'PROFILER', profiler)
+
+    processor.processor_cycle()  # Ciclo vazio: não conta para a captura
+    assert profiler.capture_remaining == 1
+
+    save_new_order({'id': 'a', 'lat': -3.80, 'lon': -38.505})
+    save_new_order({'id': 'b', 'lat': -3.81, 'lon': -38.506})
+    processor.processor_cycle()
+
+    status = profiler.status()
+    assert set(status['stages']) == set(STAGES)
+    assert status['capture_remaining'] == 0
+    assert len(status['dumps']) == 1
+    assert (tmp_path / 'profiles').exists()
+
+
+def test_worker_signals_toggle_the_processor_profiler(monkeypatch):
+    """No worker, SIGUSR1 liga/desliga o profiler e SIGUSR2 pede a captura dos próximos ciclos."""
+    import signal
+    import worker
+    from app.routing.profiling import PROFILER
+
+    if not hasattr(signal, 'SIGUSR1'):
+        pytest.skip("sem SIGUSR1 nesta plataforma")
+    monkeypatch.setattr(PROFILER, 'enabled', False)
+    monkeypatch.setattr(PROFILER, 'capture_remaining', 0)
+    previous = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGUSR2)
+    try:
+        worker.install_profiler_signals()
+        signal.raise_signal(signal.SIGUSR1)
+        assert PROFILER.enabled is True
+        signal.raise_signal(signal.SIGUSR1)
+        assert PROFILER.enabled is False
+        signal.raise_signal(signal.SIGUSR2)
+        assert PROFILER.enabled is True
+        assert PROFILER.capture_remaining == worker.PROFILE_CAPTURE_CYCLES
+    finally:
+        signal.signal(signal.SIGUSR1, previous[0])
+        signal.signal(signal.SIGUSR2, previous[1])
@@ -0,0 +1,73 @@
+import pytest
+
+from app.recorder import OrderStreamRecorder, load_recording
+from scripts.replay_orders import replay, RESTAURANT_COORDS
+from scripts.synthetic_orders import generate_orders
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_recording_round_trip_skips_truncated_lines(tmp_path):
+    """A gravação é lida em ordem de chegada; uma última linha pela metade é ignorada."""
+    path = tmp_path / 'stream.jsonl'
+    clock = FakeClock()
+    recorder = OrderStreamRecorder(str(path), clock=clock)
+    recorder.record([{'id': 'A', 'lat': -3.78, 'lon': -38.50}, {'id': 'B', 'lat': -3.79, 'lon': -38.51}])
+    clock.now += 4.5
+    recorder.record([{'id': 'C', 'lat': -3.77, 'lon': -38.49}])
+    recorder.close()
+    with open(path, 'a') as f:
+        f.write('{"t": 1010, "id": "D", "la')
+
+    orders = load_recording(str(path))
+    assert [o['id'] for o in orders] == ['A', 'B', 'C']
+    assert orders[2]['t'] - orders[0]['t'] == pytest.approx(4.5)
+
+
+def test_recording_keeps_the_full_order_and_replay_saves_it_unchanged(tmp_path, monkeypatch):
+    """Loja e prazos vão para a gravação e voltam intactos no replay, com o processador no relógio dela."""
+    import app.database.manager as manager
+    from app.routing import processor
+
+    path = tmp_path / 'stream.jsonl'
+    order = {'id': 'A', 'lat': -3.79, 'lon': -38.51, 'merchant_id': 'loja-sul',
+             'ready_at': 1010.0, 'promised_at': 2800.0}
+    recorder = OrderStreamRecorder(str(path), clock=FakeClock())
+    recorder.record([order])
+    recorder.close()
+    recorded = load_recording(str(path))
+    assert recorded == [dict(order, t=1000.0)]
+
+    saved, cycle_times = [], []
+    save_new_orders = manager.save_new_orders
+    monkeypatch.setattr(manager, 'save_new_orders', lambda orders: saved.extend(orders) or save_new_orders(orders))
+    route_orders = processor._route_orders
+    monkeypatch.setattr(processor, '_route_orders',
+                        lambda *args: cycle_times.append(processor.SEALER.now()) or route_orders(*args))
+    assert replay(recorded, speed=20, interval=3.0, sleep=lambda s: None)['routed_orders'] == 1
+    assert saved == [dict(order, t=1000.0, created_at=1000.0)]
+    assert cycle_times == [1003.0]
+
+
+def test_replay_compresses_time_and_reports_quality(tmp_path):
+    """Uma gravação de 60s a 20x vira ciclos de 0.15s reais, e todos os pedidos terminam em rotas."""
+    synthetic = generate_orders(RESTAURANT_COORDS, 40, radius_km=3.0, seed=3)
+    orders = [{'t': 1000.0 + i * 1.5, 'id': o['id'], **o['coords']} for i, o in enumerate(synthetic)]
+    sleeps = []
+
+    results = replay(orders, speed=20, interval=3.0, sleep=sleeps.append)
+
+    assert results['cycles'] == 20  # 60s gravados / 3s por ciclo
+    assert results['routed_orders'] == 40
+    assert results['routes'] >= 1 and results['km_per_order'] > 0
+    assert results['stops_per_route'] == pytest.approx(40 / results['routes'], abs=1e-3)
+    assert all(0 < s <= 3.0 / 20 for s in sleeps)
+
+    with pytest.raises(ValueError):
+        replay(orders, speed=500)
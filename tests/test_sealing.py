@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+import app.database.manager
+from app.database.manager import setup_database, save_new_orders, get_created_routes, get_all_created_routes
+from app.routing import processor
+from app.routing.sealing import RouteSealer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def db_test_file(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "sealing.db")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+
+    def mock_get_db_connection():
+        conn = sqlite3.connect(db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    monkeypatch.setattr(app.database.manager, 'get_db_connection', mock_get_db_connection)
+    setup_database()
+    yield db_file
+    processor.reset_state()
+
+
+def _route(route_id, *created_at):
+    return {'id': route_id, 'orders': [{'id': f'{route_id}-{i}', 'coords': {'lat': 0, 'lon': 0}, 'created_at': t}
+                                       for i, t in enumerate(created_at)]}
+
+
+def test_heap_expires_routes_by_oldest_order():
+    """O prazo vem do pedido mais antigo; rotas esquecidas não voltam do heap."""
+    clock = FakeClock()
+    sealer = RouteSealer(max_age=600, clock=clock)
+    sealer.track(_route(1, 900.0, 950.0))  # prazo 1500
+    sealer.track(_route(2, 1000.0))        # prazo 1600
+    sealer.track(_route(3, 800.0))         # prazo 1400
+    sealer.forget(3)
+
+    clock.now = 1450
+    assert sealer.pop_expired() == []
+    clock.now = 1550
+    assert sealer.pop_expired() == [1]
+    assert sealer.next_deadline() == 1600
+    assert len(sealer) == 1
+
+
+def test_full_route_is_sealed_and_leaves_the_candidates(db_test_file):
+    """Com no máximo 2 paradas, o terceiro pedido na mesma direção abre outra rota."""
+    processor.reset_state(RouteSealer(max_stops=2))
+    base = processor.RESTAURANT_COORDS
+    save_new_orders([{'id': f'P{i}', 'lat': base['lat'] + 0.005 * i, 'lon': base['lon'] + 0.005 * i} for i in (1, 2, 3)])
+
+    processor.processor_cycle()
+
+    routes = {route['id']: route for route in get_all_created_routes()}
+    sealed = [r for r in routes.values() if r['status'] == 'sealed']
+    assert len(sealed) == 1 and len(sealed[0]['orders']) == 2
+    assert [[o['id'] for o in r['orders']] for r in get_created_routes()] == [['P3']]
+
+
+def test_old_routes_are_sealed_by_age_without_new_orders(db_test_file):
+    """Uma rota aberta cujo pedido mais antigo passou da idade máxima é fechada num ciclo ocioso."""
+    clock = FakeClock()
+    processor.reset_state(RouteSealer(max_age=600, clock=clock))
+    base = processor.RESTAURANT_COORDS
+    save_new_orders([{'id': 'A', 'lat': base['lat'] + 0.01, 'lon': base['lon'], 'created_at': 1000.0}])
+    processor.processor_cycle()
+    assert len(get_created_routes()) == 1
+
+    clock.now = 1601
+    processor.processor_cycle()
+    assert get_created_routes() == []
+    assert get_all_created_routes()[0]['status'] == 'sealed'
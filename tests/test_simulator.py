@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from scripts.ifood_simulator import SimulatorState
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_orders_carry_their_scheduled_arrival_time():
+    """O pedido i chega em started_at + i/rate, mesmo que o polling só o veja depois; o total respeita max_orders."""
+    clock = FakeClock()
+    state = SimulatorState(rate=4.0, seed=1, max_orders=10, clock=clock)
+    state.start()
+
+    clock.now += 1.3
+    events = state.poll()
+    assert len(events) == 6  # 0, 0.25, ..., 1.25
+    assert [order['emitted_at'] for order in state.orders.values()] == pytest.approx(
+        [1000.0 + i / 4 for i in range(6)])
+
+    clock.now += 60
+    state.poll()
+    assert len(state.orders) == 10
+    assert max(order['emitted_at'] for order in state.orders.values()) == pytest.approx(1000.0 + 9 / 4)
+
+
+def test_load_test_routes_every_generated_order():
+    """Ponta a ponta: --rate 10 --duration 1 gera 10 pedidos e todos aparecem em rotas."""
+    env = {k: v for k, v in os.environ.items() if k != 'DATABASE_URL'}
+    env['LOG_LEVEL'] = 'WARNING'
+    output = subprocess.run(
+        [sys.executable, '-m', 'scripts.load_test', '--rate', '10', '--duration', '1', '--drain', '30',
+         '--processor-interval', '0.5', '--observe-interval', '0.05', '--seed', '3'],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True, env=env, timeout=120).stdout
+    assert 'Pedidos gerados:      10' in output
+    assert 'Pedidos roteados:     10' in output
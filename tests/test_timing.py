@@ -0,0 +1,61 @@
+import random
+
+from app.routing import optimizer
+from app.routing.optimizer import find_best_route_for_order, plan_route_orders
+from app.routing.timing import route_schedule, feasible_positions
+
+RESTAURANT = {'lat': -3.78, 'lon': -38.50}
+NOW = 1_000_000.0
+
+
+def _order(order_id, dlat, dlon, promised_in=None, ready_in=None):
+    return {
+        'id': order_id,
+        'coords': {'lat': RESTAURANT['lat'] + dlat, 'lon': RESTAURANT['lon'] + dlon},
+        'promised_at': NOW + promised_in if promised_in is not None else None,
+        'ready_at': NOW + ready_in if ready_in is not None else None,
+    }
+
+
+def test_slack_check_matches_full_simulation():
+    """O teste O(1) por posição dá o mesmo resultado que simular a rota inteira com o pedido inserido."""
+    rng = random.Random(7)
+    distance = optimizer.haversine_distance
+    for _ in range(300):
+        orders = [_order(f'o{i}', rng.uniform(-0.03, 0.03), rng.uniform(-0.03, 0.03),
+                         promised_in=rng.uniform(300, 3000), ready_in=rng.choice([None, rng.uniform(0, 300)]))
+                  for i in range(rng.randint(0, 5))]
+        new = _order('novo', rng.uniform(-0.03, 0.03), rng.uniform(-0.03, 0.03),
+                     promised_in=rng.uniform(300, 3000), ready_in=rng.choice([None, rng.uniform(0, 600)]))
+
+        schedule = route_schedule(orders, RESTAURANT, NOW, distance)
+        fast = list(feasible_positions(orders, schedule, new, RESTAURANT, NOW, distance))
+        slow = [p for p in range(len(orders) + 1)
+                if route_schedule(orders[:p] + [new] + orders[p:], RESTAURANT, NOW, distance).is_feasible()]
+        assert fast == slow
+
+
+def test_insertion_keeps_earlier_customers_on_time():
+    """
+    O vizinho mais próximo passaria primeiro em B e atrasaria A; o pedido entra depois de A.
+    Se B também tem pressa, não há posição viável e a rota nem é pontuada.
+    """
+    a = _order('A', 0.02, 0.0, promised_in=400)        # ~2,2 km ao norte, prazo apertado
+    route = {'id': 1, 'orders': [a]}
+
+    relaxed = _order('B', 0.0, 0.005, promised_in=3600)
+    assert [o['id'] for o in plan_route_orders(route, relaxed, RESTAURANT, NOW)] == ['A', 'B']
+
+    urgent = _order('C', 0.0, 0.005, promised_in=300)
+    assert plan_route_orders(route, urgent, RESTAURANT, NOW) is None
+    assert find_best_route_for_order(urgent, [route], RESTAURANT, now=NOW) is None
+
+
+def test_late_ready_time_delays_the_whole_route():
+    """Um pedido que só fica pronto daqui a 10 minutos não entra numa rota que não pode esperar."""
+    route = {'id': 1, 'orders': [_order('A', 0.02, 0.0, promised_in=600)]}
+    slow_kitchen = _order('B', 0.021, 0.0, ready_in=600)
+    assert plan_route_orders(route, slow_kitchen, RESTAURANT, NOW) is None
+
+    route['orders'][0]['promised_at'] = NOW + 1800
+    assert plan_route_orders(route, slow_kitchen, RESTAURANT, NOW) is not None
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from app.token_manager import TokenManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_fetcher(expires_in=3600, delay=0.0):
+    calls = []
+
+    def fetch():
+        if delay:
+            time.sleep(delay)
+        calls.append(1)
+        return f"token-{len(calls)}", expires_in
+
+    return fetch, calls
+
+
+def test_token_is_cached_until_refresh_margin():
+    """O token só é renovado quando entra na margem de expiração."""
+    clock = FakeClock()
+    fetch, calls = make_fetcher(expires_in=3600)
+    manager = TokenManager(fetch, refresh_margin=300, clock=clock)
+
+    assert manager.get_token() == "token-1"
+    clock.now += 3000
+    assert manager.get_token() == "token-1"
+    assert len(calls) == 1
+
+    clock.now += 400  # Dentro da margem de 300s
+    assert manager.get_token() == "token-2"
+    assert len(calls) == 2
+
+
+def test_refresh_after_401_is_shared():
+    """Após um 401, só a primeira chamada renova; as outras reaproveitam o token novo."""
+    fetch, calls = make_fetcher()
+    manager = TokenManager(fetch)
+    stale = manager.get_token()
+
+    assert manager.refresh(stale_token=stale) == "token-2"
+    assert manager.refresh(stale_token=stale) == "token-2"
+    assert len(calls) == 2
+
+
+def test_concurrent_callers_share_one_request():
+    """Várias threads pedindo o token ao mesmo tempo geram uma única requisição."""
+    fetch, calls = make_fetcher(delay=0.1)
+    manager = TokenManager(fetch)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_token())) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["token-1"] * 10
+    assert len(calls) == 1
+
+
+def test_short_lived_token_refreshes_at_half_its_lifetime():
+    """Um token que vale menos que a margem é renovado na metade da validade, e não a cada chamada."""
+    clock = FakeClock()
+    fetch, calls = make_fetcher(expires_in=60)
+    manager = TokenManager(fetch, refresh_margin=300, clock=clock)
+
+    assert manager.get_token() == "token-1"
+    assert manager.seconds_until_refresh() == 30
+    clock.now += 20
+    assert manager.get_token() == "token-1"
+    assert len(calls) == 1
+
+    clock.now += 15
+    assert manager.get_token() == "token-2"
+    assert manager.seconds_until_refresh() == 30
+
+
+def test_failed_refresh_keeps_the_token_until_it_expires():
+    """Se a renovação dentro da margem falha, o token atual segue valendo até expirar."""
+    clock = FakeClock()
+    responses = [("token-1", 3600), None, None, None]
+    manager = TokenManager(lambda: responses.pop(0), refresh_margin=300, clock=clock)
+
+    assert manager.get_token() == "token-1"
+    clock.now += 3400  # Dentro da margem, autenticação fora do ar
+    assert manager.get_token() == "token-1"
+    assert manager.refresh(stale_token="token-1") is None  # Recusado pela API: não reaproveita
+    clock.now += 200  # Expirou de fato
+    assert manager.get_token() is None
+
+
+def test_background_refresh_renews_before_expiry():
+    """A thread de fundo renova o token antes de ele expirar."""
+    fetch, calls = make_fetcher(expires_in=0.3)
+    manager = TokenManager(fetch, refresh_margin=0.2)
+    manager.get_token()
+    manager.start_background_refresh()
+    try:
+        time.sleep(0.5)
+    finally:
+        manager.stop_background_refresh()
+    assert len(calls) >= 2
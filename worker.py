@@ -0,0 +1,144 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+
+from app.logging_config import setup_logging
+from app.database.manager import setup_database
+from app.leader import LeaderLease, run_as_leader, default_holder_id
+
+# --- PROCESSO DE FUNDO (COLETOR + PROCESSADOR) ---
+# O serviço web (gunicorn app:app) só atende HTTP. Os loops de fundo rodam aqui, em um
+# ou mais processos separados:
+#   - coletor: exatamente um ativo por vez (lease 'collector'); os demais ficam de reserva;
+#   - processador: um por setor (leases 'processor:<i>/<total>'); com --shards N, até N
+#     processos trabalham ao mesmo tempo, cada um em uma fatia angular da área
+#     (todos os processadores precisam usar o mesmo número de setores);
+#   - grade de demanda: um job (lease 'demand') que atualiza as taxas de chegada usadas na
+#     espera curta das rotas de uma parada; roda em 'all' quando MOTOROTAS_HOLD_WINDOW > 0.
+# O profiler do processador vive aqui, não no serviço web: `kill -USR1 <pid>` liga/desliga a
+# medição por etapa e `kill -USR2 <pid>` grava dumps do cProfile dos próximos ciclos. O estado
+# vai para o log a cada sinal.
+
+PROCESSOR_SHARDS = int(os.getenv("MOTOROTAS_PROCESSOR_SHARDS", "1"))
+PROCESSOR_INTERVAL_S = float(os.getenv("MOTOROTAS_PROCESSOR_INTERVAL", "3"))
+# Porta do /metrics do worker (as métricas do coletor e do processador vivem aqui); 0 desliga
+METRICS_PORT = int(os.getenv("MOTOROTAS_METRICS_PORT", "9108"))
+# Ciclos capturados pelo cProfile a cada SIGUSR2
+PROFILE_CAPTURE_CYCLES = 5
+
+logger = logging.getLogger('app.worker')
+
+
+def collector_leases(holder):
+    return [LeaderLease('collector', holder)]
+
+def demand_leases(holder):
+    return [LeaderLease('demand', holder)]
+
+def processor_leases(holder, shards):
+    return [LeaderLease(f'processor:{index}/{shards}', holder) for index in range(shards)]
+
+def _run_collector(lease, should_run):
+    from app.collector import start_collector_loop
+    start_collector_loop(should_run=should_run)
+
+def _run_demand(lease, should_run):
+    from app.routing.demand import start_demand_loop
+    from app.routing.processor import RESTAURANT_COORDS
+    start_demand_loop(RESTAURANT_COORDS, should_run=should_run)
+
+def _processor_target(leases, interval):
+    def run(lease, should_run):
+        from app.routing.processor import start_processor_loop
+        shards = len(leases)
+        shard = (leases.index(lease), shards) if shards > 1 else None
+        start_processor_loop(interval=interval, should_run=should_run, shard=shard)
+    return run
+
+def _toggle_profiler(signum=None, frame=None):
+    from app.routing.profiling import PROFILER
+    PROFILER.configure(enabled=not PROFILER.enabled)
+    logger.info("Profiler do processador: %s", json.dumps(PROFILER.status()))
+
+def _capture_profiles(signum=None, frame=None):
+    from app.routing.profiling import PROFILER
+    PROFILER.configure(enabled=True, capture_cycles=PROFILE_CAPTURE_CYCLES)
+    logger.info("Profiler do processador: %s", json.dumps(PROFILER.status()))
+
+def install_profiler_signals():
+    """SIGUSR1 liga/desliga o profiler; SIGUSR2 captura os próximos ciclos (só na thread principal)."""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, _toggle_profiler)
+        signal.signal(signal.SIGUSR2, _capture_profiles)
+
+def worker_json_routes(role):
+    """Endpoints JSON do servidor de métricas: o estado do coletor só existe onde ele roda."""
+    if role not in ('all', 'collector'):
+        return {}
+    from app.collector import get_collector_metrics
+    return {'/api/collector/metrics': get_collector_metrics}
+
+def start_worker(role='all', shards=PROCESSOR_SHARDS, interval=PROCESSOR_INTERVAL_S, stop_event=None):
+    """Inicia as threads dos papéis pedidos; cada uma espera pelo seu lease antes de trabalhar."""
+    holder = default_holder_id()
+    stop_event = stop_event or threading.Event()
+
+    collector = collector_leases(holder)
+    processors = processor_leases(holder, shards)
+    # A fila em memória só funciona com coletor e processador (único) no mesmo processo. Os dois
+    # leases são disputados em separado: a fila só é usada enquanto este processo detém ambos
+    from app.pipeline import enable_pipeline, pipeline_enabled_from_env
+    if role == 'all' and shards == 1 and pipeline_enabled_from_env():
+        enable_pipeline(is_active=lambda: all(lease.is_held() for lease in collector + processors))
+        logger.info("Modo pipeline ativo no worker (enquanto ele detiver os leases do coletor e do processador).")
+
+    if role in ('all', 'collector'):
+        # O coletor roda aqui (e não no serviço web): a gravação do fluxo de pedidos também
+        from app.recorder import RECORD_PATH, enable_recorder
+        if RECORD_PATH:
+            enable_recorder(RECORD_PATH)
+            logger.info("Gravando o fluxo de pedidos em %s", RECORD_PATH)
+
+    threads = []
+    if role in ('all', 'collector'):
+        threads.append(threading.Thread(
+            target=run_as_leader, args=(collector, _run_collector),
+            kwargs={'stop_event': stop_event}, name='collector', daemon=True))
+    from app.routing.demand import HOLD_WINDOW_S
+    if role == 'demand' or (role == 'all' and HOLD_WINDOW_S > 0):
+        threads.append(threading.Thread(
+            target=run_as_leader, args=(demand_leases(holder), _run_demand),
+            kwargs={'stop_event': stop_event}, name='demand', daemon=True))
+    if role in ('all', 'processor'):
+        threads.append(threading.Thread(
+            target=run_as_leader, args=(processors, _processor_target(processors, interval)),
+            kwargs={'stop_event': stop_event}, name='processor', daemon=True))
+    for thread in threads:
+        thread.start()
+    logger.info("Worker %s iniciado (papel=%s, setores=%d).", holder, role, shards)
+    return threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Roda o coletor e/ou o processador fora do servidor web.")
+    parser.add_argument('--role', choices=('all', 'collector', 'processor', 'demand'), default='all')
+    parser.add_argument('--shards', type=int, default=PROCESSOR_SHARDS,
+                        help="Número de setores do processador (= máximo de processadores ativos).")
+    parser.add_argument('--interval', type=float, default=PROCESSOR_INTERVAL_S)
+    args = parser.parse_args()
+
+    setup_logging()
+    setup_database()
+    install_profiler_signals()
+    if METRICS_PORT:
+        from app.metrics import start_metrics_server
+        start_metrics_server(METRICS_PORT, json_routes=worker_json_routes(args.role))
+        logger.info("Métricas do worker em http://0.0.0.0:%d/metrics", METRICS_PORT)
+    threads = start_worker(args.role, max(1, args.shards), args.interval)
+    for thread in threads:
+        thread.join()
+
+if __name__ == "__main__":
+    main()